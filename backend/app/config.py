@@ -27,8 +27,92 @@ class Settings(BaseSettings):
     COHERE_API_KEY: str = os.getenv("COHERE_API_KEY", "")
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
 
+    # Embedding Configuration
+    # "auto" uses Cohere when COHERE_API_KEY is set and the local engine otherwise
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "auto")
+    EMBEDDING_DIM: int = int(os.getenv("EMBEDDING_DIM", 1024))
+    # Encoding of embedding:* hashes in Redis: "json", "float32" or "int8"; int8 is only
+    # honored with EMBEDDING_QUANTIZATION=none, since a quantized index re-ranks with these vectors
+    EMBEDDING_STORAGE_FORMAT: str = os.getenv("EMBEDDING_STORAGE_FORMAT", "json")
+    # In-memory search index codec: "none", "int8" or "pq" (re-ranked with full vectors)
+    EMBEDDING_QUANTIZATION: str = os.getenv("EMBEDDING_QUANTIZATION", "none")
+    EMBEDDING_RERANK_FACTOR: int = int(os.getenv("EMBEDDING_RERANK_FACTOR", 4))
+    QUERY_CACHE_SIZE: int = int(os.getenv("QUERY_CACHE_SIZE", 1024))
+    QUERY_CACHE_TTL: int = int(os.getenv("QUERY_CACHE_TTL", 3600))
+
     # Data paths
     DATA_PATH: str = os.getenv("DATA_PATH", "/data")
+    LOG_PATH: str = os.getenv("LOG_PATH", "/data/LogData/logfiles.log")
+    # Glob of rotated log files (plain, gzip or zstd) loaded before LOG_PATH, oldest first
+    LOG_ARCHIVE_GLOB: str = os.getenv("LOG_ARCHIVE_GLOB", "")
+    # Bytes of log text parsed per block while streaming the log file
+    LOG_CHUNK_SIZE: int = int(os.getenv("LOG_CHUNK_SIZE", 2 << 20))
+    # Processes parsing the log on load (1 parses in the calling process)
+    LOG_PARSE_WORKERS: int = int(os.getenv("LOG_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+    # Seconds between checks for appended/rotated log lines (0 disables following)
+    LOG_FOLLOW_INTERVAL: float = float(os.getenv("LOG_FOLLOW_INTERVAL", 1))
+    # Counters per top-IP sketch and minutes of per-minute sketches kept for windowed queries
+    LOG_SKETCH_CAPACITY: int = int(os.getenv("LOG_SKETCH_CAPACITY", 1000))
+    LOG_SKETCH_WINDOW_MINUTES: int = int(os.getenv("LOG_SKETCH_WINDOW_MINUTES", 60))
+    # Snapshot of the parsed log state reused at startup (empty disables snapshots);
+    # keep it on a persistent volume, it is only useful if it survives a restart
+    LOG_SNAPSHOT_PATH: str = os.getenv("LOG_SNAPSHOT_PATH", "/var/lib/sre/log_snapshot.bin")
+    # Diagnostics results cached per log version (statistics, top IPs, summaries)
+    LOG_RESULT_CACHE_SIZE: int = int(os.getenv("LOG_RESULT_CACHE_SIZE", 256))
+
+    # Access log of the API's own requests (combined format): appended to
+    # ACCESS_LOG_PATH (by default the followed LOG_PATH, so the diagnostics include the API's own
+    # traffic; empty keeps no file) and counted in Redis;
+    # batches are flushed every ACCESS_LOG_FLUSH_INTERVAL seconds or ACCESS_LOG_FLUSH_LINES lines
+    ACCESS_LOG_ENABLED: bool = os.getenv("ACCESS_LOG_ENABLED", "true").lower() == "true"
+    ACCESS_LOG_PATH: str = os.getenv("ACCESS_LOG_PATH", LOG_PATH)
+    ACCESS_LOG_FLUSH_INTERVAL: float = float(os.getenv("ACCESS_LOG_FLUSH_INTERVAL", 1))
+    ACCESS_LOG_FLUSH_LINES: int = int(os.getenv("ACCESS_LOG_FLUSH_LINES", 1000))
+
+    # Token required in X-Admin-Token by /api/admin endpoints (empty disables them)
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+    # Longest sampling profile, in seconds; per-request cProfile (X-Profile: 1 header) is opt-in
+    PROFILE_MAX_SECONDS: float = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+    PROFILE_REQUESTS_ENABLED: bool = os.getenv("PROFILE_REQUESTS_ENABLED", "false").lower() == "true"
+    # Seconds profiled when a consumer receives SIGUSR1 (collapsed stacks are written to the temp dir)
+    PROFILE_SIGNAL_SECONDS: float = float(os.getenv("PROFILE_SIGNAL_SECONDS", 30))
+    # Event-loop lag sampled every LOOP_MONITOR_INTERVAL_MS (0 disables); callbacks holding
+    # the loop longer than LOOP_BLOCK_THRESHOLD_MS have their stack captured
+    LOOP_MONITOR_INTERVAL_MS: float = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", 50))
+    LOOP_BLOCK_THRESHOLD_MS: float = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", 100))
+    # Blocking handler work (log analytics, RAG queries, image search) runs on a pool of
+    # OFFLOAD_THREADS threads instead of the event loop; OFFLOAD_LIMITS caps the calls of
+    # each endpoint group running at once ("group=n,..."), the rest wait for a slot
+    OFFLOAD_ENABLED: bool = os.getenv("OFFLOAD_ENABLED", "true").lower() == "true"
+    OFFLOAD_THREADS: int = int(os.getenv("OFFLOAD_THREADS", 8))
+    OFFLOAD_LIMITS: str = os.getenv("OFFLOAD_LIMITS", "logs=4,query=2,images=2")
+
+    # Diagnostics question answering: generator "auto" (OpenAI when OPENAI_API_KEY
+    # is set), "openai" or "local"; extra knowledge files (.md/.txt) are read from
+    # RAG_KNOWLEDGE_PATH; retrieval returns RAG_TOP_K chunks within the budget
+    RAG_GENERATOR: str = os.getenv("RAG_GENERATOR", "auto")
+    RAG_OPENAI_MODEL: str = os.getenv("RAG_OPENAI_MODEL", "gpt-3.5-turbo")
+    RAG_KNOWLEDGE_PATH: str = os.getenv("RAG_KNOWLEDGE_PATH", "/data/knowledge")
+    RAG_TOP_K: int = int(os.getenv("RAG_TOP_K", 4))
+    RAG_RETRIEVAL_BUDGET_MS: float = float(os.getenv("RAG_RETRIEVAL_BUDGET_MS", 50))
+    RAG_MIN_SIMILARITY: float = float(os.getenv("RAG_MIN_SIMILARITY", 0.2))
+    # Seconds between rebuilds of the log summaries indexed for retrieval
+    RAG_LOG_REFRESH_SECONDS: float = float(os.getenv("RAG_LOG_REFRESH_SECONDS", 10))
+
+    # Seconds between image folder scans (0 disables the watcher) and embedding batch size
+    IMAGE_WATCH_INTERVAL: float = float(os.getenv("IMAGE_WATCH_INTERVAL", 30))
+    IMAGE_EMBED_BATCH_SIZE: int = int(os.getenv("IMAGE_EMBED_BATCH_SIZE", 32))
+
+    # Near-duplicate detection: "phash" or "dhash"; max Hamming distance;
+    # policy "link" (store a link, no embedding), "skip" (drop) or "off"
+    IMAGE_HASH_ALGORITHM: str = os.getenv("IMAGE_HASH_ALGORITHM", "phash")
+    IMAGE_DUPLICATE_DISTANCE: int = int(os.getenv("IMAGE_DUPLICATE_DISTANCE", 6))
+    IMAGE_DUPLICATE_POLICY: str = os.getenv("IMAGE_DUPLICATE_POLICY", "link")
+
+    # Image derivatives (thumbnails / web-optimized copies)
+    DERIVATIVE_CACHE_PATH: str = os.getenv("DERIVATIVE_CACHE_PATH", "/tmp/image_derivatives")
+    DERIVATIVE_WORKERS: int = int(os.getenv("DERIVATIVE_WORKERS", 2))
+    DERIVATIVE_QUALITY: int = int(os.getenv("DERIVATIVE_QUALITY", 80))
 
     # Application version
     APP_VERSION: str = f"v1.0.0057_{os.getenv('REGION', 'region1')}"
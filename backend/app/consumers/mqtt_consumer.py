@@ -10,6 +10,10 @@ import logging
 import redis
 import os
 
+from app.services.metrics import CONSUMER_ERRORS, CONSUMER_LAG_SECONDS, CONSUMER_MESSAGES, lag_seconds, start_push
+from app.config import settings
+from app.services.profiler import sampling_profiler
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -18,11 +22,16 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 MQTT_BROKER = os.getenv("MQTT_BROKER", "localhost")
 MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
 REGION = os.getenv("REGION", "region1")
+# Seconds between metric snapshots pushed to Redis for the API's /metrics
+METRICS_PUSH_INTERVAL = float(os.getenv("METRICS_PUSH_INTERVAL", 10))
 
 # Connect to Redis
 redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
 
 device_count = 0
+messages = CONSUMER_MESSAGES.labels("mqtt")
+errors = CONSUMER_ERRORS.labels("mqtt")
+lag = CONSUMER_LAG_SECONDS.labels("mqtt")
 
 def on_connect(client, userdata, flags, rc):
     """Callback when connected to MQTT broker"""
@@ -35,6 +44,10 @@ def on_message(client, userdata, msg):
     global device_count
     try:
         payload = json.loads(msg.payload.decode())
+        messages.inc()
+        delay = lag_seconds(payload.get("timestamp_utc"))
+        if delay is not None:
+            lag.observe(delay)
 
         # Increment device counter
         device_count += 1
@@ -44,6 +57,7 @@ def on_message(client, userdata, msg):
             logger.info(f"Processed {device_count} device messages, stored count in Redis")
 
     except Exception as e:
+        errors.inc()
         logger.error(f"Error processing message: {e}")
 
 def start_consumer():
@@ -54,6 +68,8 @@ def start_consumer():
 
     logger.info(f"Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
     client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    start_push(redis_client, REGION, "mqtt-consumer", METRICS_PUSH_INTERVAL)
+    sampling_profiler.install_signal_handler("mqtt-consumer", settings.PROFILE_SIGNAL_SECONDS)
     client.loop_forever()
 
 if __name__ == "__main__":
@@ -10,6 +10,11 @@ import logging
 import redis
 import os
 
+from app.services.metrics import (CONSUMER_ERRORS, CONSUMER_LAG_SECONDS, CONSUMER_MESSAGES,
+                                  CONSUMER_QUEUE_DEPTH, lag_seconds, start_push)
+from app.config import settings
+from app.services.profiler import sampling_profiler
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -19,14 +24,27 @@ RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
 RABBITMQ_PORT = int(os.getenv("RABBITMQ_PORT", 5672))
 RABBITMQ_USER = os.getenv("RABBITMQ_USER", "admin")
 RABBITMQ_PASS = os.getenv("RABBITMQ_PASS", "admin123")
+REGION = os.getenv("REGION", "region1")
+QUEUE = "webapp_active_users"
+# Seconds between metric snapshots pushed to Redis for the API's /metrics
+METRICS_PUSH_INTERVAL = float(os.getenv("METRICS_PUSH_INTERVAL", 10))
 
 # Connect to Redis
 redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
 
+messages = CONSUMER_MESSAGES.labels("rabbitmq")
+errors = CONSUMER_ERRORS.labels("rabbitmq")
+lag = CONSUMER_LAG_SECONDS.labels("rabbitmq")
+queue_depth = CONSUMER_QUEUE_DEPTH.labels("rabbitmq")
+
 def callback(ch, method, properties, body):
     """Callback when message received"""
     try:
         data = json.loads(body.decode())
+        messages.inc()
+        delay = lag_seconds(data.get("timestamp_utc"))
+        if delay is not None:
+            lag.observe(delay)
 
         # Store user activity metrics
         metrics = data.get('metrics', {})
@@ -38,8 +56,17 @@ def callback(ch, method, properties, body):
         logger.info(f"Updated user stats: {metrics.get('active_users', 0)} users, {metrics.get('active_connections', 0)} connections")
 
     except Exception as e:
+        errors.inc()
         logger.error(f"Error processing message: {e}")
 
+def sample_queue_depth(connection, channel):
+    """Record the number of messages waiting in the queue, then schedule the next sample"""
+    try:
+        queue_depth.set(channel.queue_declare(queue=QUEUE, durable=True, passive=True).method.message_count)
+    except Exception as e:
+        logger.error(f"Error reading queue depth: {e}")
+    connection.call_later(METRICS_PUSH_INTERVAL, lambda: sample_queue_depth(connection, channel))
+
 def start_consumer():
     """Start RabbitMQ consumer"""
     credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
@@ -56,8 +83,11 @@ def start_consumer():
     connection = pika.BlockingConnection(parameters)
     channel = connection.channel()
 
-    channel.queue_declare(queue='webapp_active_users', durable=True)
-    channel.basic_consume(queue='webapp_active_users', on_message_callback=callback, auto_ack=True)
+    channel.queue_declare(queue=QUEUE, durable=True)
+    channel.basic_consume(queue=QUEUE, on_message_callback=callback, auto_ack=True)
+    sample_queue_depth(connection, channel)
+    start_push(redis_client, REGION, "rabbitmq-consumer", METRICS_PUSH_INTERVAL)
+    sampling_profiler.install_signal_handler("rabbitmq-consumer", settings.PROFILE_SIGNAL_SECONDS)
 
     logger.info("Started consuming from webapp_active_users queue")
     channel.start_consuming()
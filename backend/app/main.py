@@ -3,7 +3,8 @@ FastAPI Backend for Enterprise SRE System
 """
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
 import logging
 import asyncio
@@ -11,9 +12,16 @@ from datetime import datetime, timezone
 
 from app.config import settings
 from app.services.redis_service import redis_service
-from app.services.embedding_service import embedding_service
+from app.services.image_watcher import image_watcher
+from app.services.image_derivatives import image_derivative_service
 from app.services.rag_service import rag_service
-from app.routers import devices, users, images, diagnostics, failover
+from app.services.log_follower import log_follower
+from app.services.access_log import AccessLogMiddleware, access_log
+from app.services.metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware, pushed_families, render
+from app.services.profiler import RequestProfilerMiddleware
+from app.services.loop_monitor import loop_monitor
+from app.services.offload import offloader
+from app.routers import devices, users, images, diagnostics, failover, admin
 
 # Configure logging
 logging.basicConfig(
@@ -28,23 +36,40 @@ async def lifespan(app: FastAPI):
     """Lifecycle management for the application"""
     logger.info(f"Starting backend for {settings.REGION}")
 
-    # Initialize embeddings on startup
+    # Initialize embeddings on startup, embedding only images that changed since the last run
     try:
         logger.info("Initializing image embeddings...")
-        count = embedding_service.initialize_embeddings(settings.DATA_PATH)
+        count = image_watcher.initialize()
         logger.info(f"Initialized {count} embeddings")
+        image_watcher.start()
     except Exception as e:
         logger.error(f"Error initializing embeddings: {e}")
 
+    # Keep log diagnostics current as the access log grows
+    log_follower.start()
+    if settings.ACCESS_LOG_ENABLED:
+        access_log.start()
+
     # Set initial state in Redis
     redis_service.set_state(f"{settings.REGION}:status", "active")
     redis_service.set_state(f"{settings.REGION}:version", settings.APP_VERSION)
     redis_service.set_state(f"{settings.REGION}:startup_time", datetime.now(timezone.utc).isoformat())
 
+    # Started last, so that blocking startup work is not reported
+    loop_monitor.start()
+
     yield
 
     # Cleanup on shutdown
     logger.info(f"Shutting down {settings.REGION}")
+    image_watcher.stop()
+    log_follower.stop()
+    access_log.stop()
+    loop_monitor.stop()
+    offloader.shutdown()
+    # Lines followed since startup are saved so the next start does not reparse them
+    rag_service.save_snapshot()
+    image_derivative_service.shutdown()
     redis_service.set_state(f"{settings.REGION}:status", "inactive")
 
 
@@ -55,6 +80,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Per-request cProfile; added first, so it is innermost and a report covers the handler
+if settings.PROFILE_REQUESTS_ENABLED:
+    app.add_middleware(RequestProfilerMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -64,12 +93,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Wraps CORS, so the access log sees the final status of every request
+if settings.ACCESS_LOG_ENABLED:
+    app.add_middleware(AccessLogMiddleware, writer=access_log)
+# Outermost, so request latency includes every middleware
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(devices.router, prefix="/api/devices", tags=["Devices"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(images.router, prefix="/api/images", tags=["Images"])
 app.include_router(diagnostics.router, prefix="/api/diagnostics", tags=["Diagnostics"])
 app.include_router(failover.router, prefix="/api/failover", tags=["Failover"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 
 
 @app.get("/")
@@ -167,6 +203,16 @@ async def get_metrics():
     return metrics
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus exposition of API, Redis and consumer metrics"""
+    # Reading pushed snapshots from Redis and rendering happen off the event loop
+    text = await run_in_threadpool(
+        lambda: render(REGISTRY.collect() + pushed_families(redis_service.client, settings.REGION))
+    )
+    return PlainTextResponse(text, media_type=CONTENT_TYPE)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
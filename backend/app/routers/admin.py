@@ -0,0 +1,90 @@
+"""
+Operational endpoints: on-demand profiling, event-loop health and worker pools of the running API process
+"""
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from datetime import datetime, timezone
+import logging
+
+from app.config import settings
+from app.services.profiler import ProfilerBusyError, request_profiles, sampling_profiler
+from app.services.loop_monitor import loop_monitor
+from app.services.offload import offloader
+
+logger = logging.getLogger(__name__)
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Reject the request unless it carries ADMIN_TOKEN; without one configured the endpoints are disabled"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if not hmac.compare_digest((x_admin_token or "").encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.get("/profile")
+async def profile(seconds: float = 10, interval_ms: float = 5, format: str = "collapsed"):
+    """
+    Sample the stacks of every thread for `seconds` and return them collapsed
+    (one `thread;outer;...;inner count` line per stack, flamegraph-ready)
+    """
+    try:
+        # Sampled from a worker thread, so the event loop keeps serving (and is profiled)
+        result = await run_in_threadpool(sampling_profiler.sample, seconds, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error profiling: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if format == "collapsed":
+        return PlainTextResponse(result["collapsed"], headers={
+            "X-Profile-Samples": str(result["samples"]),
+            "X-Profile-Seconds": str(result["seconds"])
+        })
+    return {**result, "timestamp": datetime.now(timezone.utc).isoformat()}
+
+
+@router.get("/profile/requests")
+async def list_request_profiles():
+    """List recent per-request cProfile reports (requests sent with `X-Profile: 1`)"""
+    return {
+        "enabled": settings.PROFILE_REQUESTS_ENABLED,
+        "profiles": request_profiles.list(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+
+@router.get("/profile/requests/{profile_id}")
+async def get_request_profile(profile_id: str):
+    """Get one per-request cProfile report, sorted by cumulative time"""
+    report = request_profiles.get(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return PlainTextResponse(report["stats"])
+
+
+@router.get("/loop")
+async def get_loop_statistics():
+    """Get event-loop lag percentiles and the stacks of recent loop-blocking callbacks"""
+    return {
+        **loop_monitor.stats(),
+        "recent_blocks": loop_monitor.blocks(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+
+@router.get("/offload")
+async def get_offload_statistics():
+    """Get the worker pool's per-endpoint limits and the calls running and waiting in each group"""
+    return {
+        **offloader.stats(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
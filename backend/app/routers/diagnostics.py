@@ -1,18 +1,35 @@
 """
 Diagnostics and RAG endpoints
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 from typing import Optional
 from datetime import datetime, timezone
+import json
+import time
 import logging
 from pydantic import BaseModel
 
 from app.services.rag_service import rag_service
+from app.services.query_planner import plan_question
+from app.services.log_follower import log_follower
+from app.services.access_log import access_log
+from app.services.offload import offloader
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+def to_epoch(value: Optional[datetime]) -> Optional[int]:
+    """Epoch seconds of a start/end parameter (ISO 8601 or epoch seconds); naive times are UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
 class QueryRequest(BaseModel):
     question: str
     context: Optional[dict] = None
@@ -22,11 +39,13 @@ class QueryRequest(BaseModel):
 async def query_llm(request: QueryRequest):
     """Query using LLM with RAG context"""
     try:
-        answer = rag_service.query_with_llm(request.question, request.context)
+        result = await offloader.run("query", rag_service.query, request.question, request.context)
 
         return {
             "question": request.question,
-            "answer": answer,
+            "answer": result["answer"],
+            "sources": result["sources"],
+            "timings": result["timings"],
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
 
@@ -35,14 +54,70 @@ async def query_llm(request: QueryRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/query/stream")
+async def stream_query(request: QueryRequest, http_request: Request):
+    """
+    Stream the answer as server-sent events: "context" (retrieved sources),
+    then "token" events as they are generated, then "done" with timings.
+    Generation stops when the client disconnects.
+    """
+    async def events():
+        started = time.perf_counter()
+        ttfb = first_token = None
+        tokens = 0
+        completed = False
+        answer = rag_service.query_events(request.question, request.context)
+        try:
+            # The generator may block on a remote model, so it is advanced off the event loop
+            async for event, data in iterate_in_threadpool(answer):
+                if await http_request.is_disconnected():
+                    break
+                now = time.perf_counter()
+                if event == "token":
+                    tokens += 1
+                    if first_token is None:
+                        first_token = now
+                elif event == "done":
+                    data["ttfb_ms"] = (ttfb - started) * 1000
+                    data["tokens_per_s"] = tokens / (now - first_token) if first_token and now > first_token else 0
+                    completed = True
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if ttfb is None:
+                    ttfb = time.perf_counter()
+        except Exception as e:
+            logger.error(f"Error streaming query: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        finally:
+            try:
+                answer.close()
+            except ValueError:
+                # Cancelled while a worker thread was producing the next token; the
+                # suspended generator is closed when it is garbage collected
+                pass
+            end = time.perf_counter()
+            rag_service.stream_stats.record(
+                ((ttfb or end) - started) * 1000,
+                ((first_token or end) - started) * 1000,
+                tokens,
+                tokens / (end - first_token) if first_token and end > first_token else 0,
+                completed
+            )
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @router.get("/logs/errors/{error_code}")
-async def get_frequent_ips(error_code: int, top_n: int = 10):
-    """Get most frequent IPs generating a specific error code"""
+async def get_frequent_ips(error_code: int, top_n: int = 10, minutes: Optional[int] = None,
+                           start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Get most frequent IPs generating a specific error code, optionally over the last N minutes of the log or a time range"""
     try:
-        results = rag_service.get_frequent_ips_by_error(error_code, top_n)
+        results = await offloader.run("logs", rag_service.get_frequent_ips_by_error,
+                                      error_code, top_n, minutes, to_epoch(start), to_epoch(end))
 
         return {
             "error_code": error_code,
+            "minutes": minutes,
             "top_ips": results,
             "count": len(results),
             "timestamp": datetime.now(timezone.utc).isoformat()
@@ -54,13 +129,15 @@ async def get_frequent_ips(error_code: int, top_n: int = 10):
 
 
 @router.get("/logs/stats")
-async def get_log_statistics():
-    """Get overall log statistics"""
+async def get_log_statistics(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Get log statistics, overall or for a time range"""
     try:
-        stats = rag_service.get_error_statistics()
+        stats = await offloader.run("logs", rag_service.get_error_statistics, to_epoch(start), to_epoch(end))
 
         return {
             "statistics": stats,
+            "start": start,
+            "end": end,
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
 
@@ -70,10 +147,10 @@ async def get_log_statistics():
 
 
 @router.get("/logs/summary")
-async def get_diagnostics_summary():
-    """Get diagnostics summary"""
+async def get_diagnostics_summary(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Get diagnostics summary, optionally for a time range"""
     try:
-        summary = rag_service.get_diagnostics_summary()
+        summary = await offloader.run("logs", rag_service.get_diagnostics_summary, to_epoch(start), to_epoch(end))
 
         return {
             "summary": summary,
@@ -86,10 +163,10 @@ async def get_diagnostics_summary():
 
 
 @router.get("/logs/search")
-async def search_logs(query: str, limit: int = 50):
-    """Search logs by keyword"""
+async def search_logs(query: str, limit: int = 50, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Search logs by keyword, optionally within a time range"""
     try:
-        results = rag_service.search_logs(query, limit)
+        results = await offloader.run("logs", rag_service.search_logs, query, limit, to_epoch(start), to_epoch(end))
 
         return {
             "query": query,
@@ -101,3 +178,86 @@ async def search_logs(query: str, limit: int = 50):
     except Exception as e:
         logger.error(f"Error searching logs: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/logs/query")
+async def query_logs(question: str):
+    """Plan an analytic question into a structured log query and run it on the indexed logs"""
+    try:
+        plan = plan_question(question)
+        if plan is None:
+            raise HTTPException(status_code=422, detail="Question is not an analytic question about the access log")
+
+        result = await offloader.run("logs", rag_service.run_log_query, plan)
+
+        return {
+            "question": question,
+            "plan": plan.to_dict(),
+            "result": result,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error running log query: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/logs/histogram")
+async def get_error_histogram(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Per-minute requests and error rate; defaults to the last hour of the log"""
+    try:
+        buckets = await offloader.run("logs", rag_service.get_error_histogram, to_epoch(start), to_epoch(end))
+
+        return {
+            "buckets": [
+                dict(bucket, minute=datetime.fromtimestamp(bucket["minute"], tz=timezone.utc).isoformat())
+                for bucket in buckets
+            ],
+            "count": len(buckets),
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
+    except Exception as e:
+        logger.error(f"Error computing histogram: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/logs/follow/stats")
+async def get_follow_statistics():
+    """Get log follower state (rows appended, rotations, truncations)"""
+    return {
+        "follower": log_follower.stats(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+
+@router.get("/logs/access/stats")
+async def get_access_log_statistics():
+    """Get access log writer state (lines written, batches flushed, lines dropped)"""
+    return {
+        "access_log": access_log.stats(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+
+@router.get("/query/stats")
+async def get_query_statistics():
+    """Get retrieval index size, latency budget misses and query cache hit rate"""
+    return {
+        "retrieval": rag_service.retriever.stats(),
+        "generator": rag_service.generator.name,
+        "streaming": rag_service.stream_stats.stats(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+
+@router.get("/logs/cache/stats")
+async def get_result_cache_statistics():
+    """Get diagnostics result cache hit rate and the current log version"""
+    return {
+        "result_cache": rag_service.results.stats(),
+        "log_version": rag_service.store.version,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
@@ -1,14 +1,17 @@
 """
 Image intelligence and semantic search endpoints
 """
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from typing import List, Dict, Optional
 from datetime import datetime, timezone
 import logging
 from pydantic import BaseModel
 
 from app.services.embedding_service import embedding_service
+from app.services.image_derivatives import image_derivative_service, SIZE_PRESETS, FORMATS
 from app.services.redis_service import redis_service
+from app.services.offload import offloader
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -17,16 +20,22 @@ router = APIRouter()
 class ImageSearchRequest(BaseModel):
     query: str
     top_k: int = 5
+    site_id: Optional[str] = None
+    device_type: Optional[str] = None
 
 
 @router.post("/search")
 async def search_images(request: ImageSearchRequest):
     """Search for images using natural language query"""
     try:
-        results = embedding_service.search_images(request.query, request.top_k)
+        results = await offloader.run(
+            "images", embedding_service.search_images,
+            request.query, request.top_k, request.site_id, request.device_type
+        )
 
         return {
             "query": request.query,
+            "filters": {"site_id": request.site_id, "device_type": request.device_type},
             "results": results,
             "count": len(results),
             "timestamp": datetime.now(timezone.utc).isoformat()
@@ -37,20 +46,66 @@ async def search_images(request: ImageSearchRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/cache/stats")
+async def get_query_cache_stats():
+    """Get query embedding cache metrics"""
+    return {
+        "query_cache": embedding_service.query_cache.stats(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+
+@router.get("/index/stats")
+async def get_index_stats():
+    """Get in-memory vector index size, quantization and memory footprint"""
+    return {
+        "index": embedding_service.index.stats(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+
+@router.get("/derivative/stats")
+async def get_derivative_stats():
+    """Get derivative render and cache counters"""
+    return {
+        "derivatives": image_derivative_service.stats(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+
+@router.get("/duplicates/{key}")
+async def get_image_duplicates(key: str, max_distance: Optional[int] = None):
+    """Find near-duplicates of an image by perceptual hash"""
+    metadata = embedding_service.image_metadata(key)
+    if not metadata:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if not metadata.get("phash"):
+        raise HTTPException(status_code=409, detail="Image has no perceptual hash")
+
+    matches = embedding_service.find_duplicates(int(metadata["phash"], 16), max_distance, exclude_key=key)
+    return {
+        "key": key,
+        "phash": metadata["phash"],
+        "duplicate_of": metadata.get("duplicate_of"),
+        "duplicates": [{"key": match, "distance": distance} for distance, match in matches],
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+
 @router.get("/list")
 async def list_images():
     """List all processed images"""
     try:
-        # Get all embedding keys
-        keys = redis_service.list_keys("embedding:*")
+        # Get embedding keys from the maintained index
+        keys = redis_service.list_embedding_keys()
 
         images = []
-        for key in keys[:50]:  # Limit to 50
-            embedding_data = redis_service.get_embedding(key.replace("embedding:", ""))
-            if embedding_data:
+        page = keys[:50]  # Limit to 50
+        for key, metadata in zip(page, redis_service.get_embedding_metadata(page)):
+            if metadata:
                 images.append({
-                    "key": key.replace("embedding:", ""),
-                    "metadata": embedding_data["metadata"]
+                    "key": key,
+                    "metadata": metadata
                 })
 
         return {
@@ -65,19 +120,18 @@ async def list_images():
 
 
 @router.get("/site/{site_id}")
-async def get_site_images(site_id: str):
-    """Get images for a specific site"""
+async def get_site_images(site_id: str, device_type: Optional[str] = None):
+    """Get images for a specific site, optionally filtered by device type"""
     try:
-        # Get all embedding keys for the site
-        keys = redis_service.list_keys(f"embedding:{site_id}*")
+        # Get embedding keys for the site from the maintained index
+        keys = redis_service.list_embedding_keys(site_id, device_type)
 
         images = []
-        for key in keys:
-            embedding_data = redis_service.get_embedding(key.replace("embedding:", ""))
-            if embedding_data:
+        for key, metadata in zip(keys, redis_service.get_embedding_metadata(keys)):
+            if metadata:
                 images.append({
-                    "key": key.replace("embedding:", ""),
-                    "metadata": embedding_data["metadata"]
+                    "key": key,
+                    "metadata": metadata
                 })
 
         return {
@@ -90,3 +144,34 @@ async def get_site_images(site_id: str):
     except Exception as e:
         logger.error(f"Error getting site images: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/derivative/{key}")
+async def get_image_derivative(key: str, request: Request, size: str = "thumb", format: str = "webp"):
+    """Serve a resized, web-optimized copy of an image with ETag-based conditional GET"""
+    if size not in SIZE_PRESETS:
+        raise HTTPException(status_code=400, detail=f"size must be one of {sorted(SIZE_PRESETS)}")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(FORMATS)}")
+
+    metadata = embedding_service.image_metadata(key)
+    if not metadata or not metadata.get("image_path"):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    source_path = metadata["image_path"]
+    try:
+        path, etag = await image_derivative_service.locate(source_path, size, format)
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=3600"}
+
+        # The ETag derives from the source hash, so a match needs no rendering at all
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+
+        await image_derivative_service.ensure(source_path, path, size, format)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Source image not found")
+    except Exception as e:
+        logger.error(f"Error rendering derivative for {key}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return FileResponse(path, media_type=FORMATS[format][1], headers=headers)
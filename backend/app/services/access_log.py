@@ -0,0 +1,217 @@
+"""
+Access logging of the API's own requests in the combined log format
+"""
+import os
+import time
+import threading
+from typing import Dict, List, Optional
+import logging
+
+from app.config import settings
+from app.services.log_store import ERROR_STATUS
+from app.services.redis_service import redis_service
+
+logger = logging.getLogger(__name__)
+
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def _quote(value: str) -> str:
+    """Field text safe inside a double-quoted log field"""
+    return value.replace('"', "%22") if '"' in value else value
+
+
+class AccessLogWriter:
+    """
+    Buffers access log lines and flushes them in batches from a background thread.
+
+    Recording a request only appends its line to a list; every
+    `flush_interval` seconds, or as soon as `flush_lines` lines are waiting,
+    the batch is appended to the access log file and added to the
+    `{REGION}:total_requests` / `{REGION}:error_count` counters in one Redis
+    round trip. The analyzed log store is never written directly: the access
+    log defaults to the followed LOG_PATH, so the follower ingests it,
+    file-backed like any other appended line. Each batch is one append
+    write, so backends sharing the file do not interleave partial lines.
+    Lines beyond `max_buffer` are
+    dropped and counted rather than letting a stalled flush grow memory.
+    """
+
+    def __init__(self, path: str = "", flush_interval: float = 1.0, flush_lines: int = 1000,
+                 max_buffer: int = 100000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_lines = flush_lines
+        self.max_buffer = max_buffer
+        self._pending: List[str] = []
+        self._errors = 0
+        self._lock = threading.Lock()
+        # Serializes flushes, so batches reach the file and the store in order
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._second = -1
+        self._timestamp = ""
+        self.lines_written = 0
+        self.flushes = 0
+        self.dropped = 0
+
+    def timestamp(self, now: float) -> str:
+        """Log timestamp of an epoch time, formatted once per second"""
+        second = int(now)
+        if second != self._second:
+            t = time.gmtime(second)
+            self._timestamp = (f"{t.tm_mday:02d}/{MONTH_NAMES[t.tm_mon - 1]}/{t.tm_year}:"
+                               f"{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d} +0000")
+            self._second = second
+        return self._timestamp
+
+    def record(self, line: str, status: int):
+        """Queue one formatted line"""
+        with self._lock:
+            if len(self._pending) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._pending.append(line)
+            if status >= ERROR_STATUS:
+                self._errors += 1
+            if len(self._pending) >= self.flush_lines:
+                self._wake.set()
+
+    def flush(self) -> int:
+        """Write out the queued lines; returns how many were flushed"""
+        with self._flush_lock:
+            with self._lock:
+                lines, self._pending = self._pending, []
+                errors, self._errors = self._errors, 0
+            if not lines:
+                return 0
+
+            if self.path:
+                try:
+                    if self._file is None:
+                        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                        self._file = open(self.path, "ab", buffering=0)
+                    self._file.write(("\n".join(lines) + "\n").encode("utf-8"))
+                except Exception as e:
+                    logger.error(f"Error writing access log {self.path}: {e}")
+            redis_service.increment_many({
+                f"{settings.REGION}:total_requests": len(lines),
+                f"{settings.REGION}:error_count": errors
+            })
+            self.lines_written += len(lines)
+            self.flushes += 1
+            return len(lines)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing access log: {e}")
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="access-log", daemon=True)
+        self._thread.start()
+        logger.info(f"Access log {'to ' + self.path if self.path else 'enabled'}, flushed every {self.flush_interval}s")
+
+    def stop(self):
+        """Stop the flush thread and write out what is still queued"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def followed(self) -> bool:
+        """Whether the log follower ingests this access log into the analyzed store"""
+        return bool(self.path) and settings.LOG_FOLLOW_INTERVAL > 0 and \
+            os.path.abspath(self.path) == os.path.abspath(settings.LOG_PATH)
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path or None,
+            "buffered": len(self._pending),
+            "lines_written": self.lines_written,
+            "flushes": self.flushes,
+            "dropped": self.dropped,
+            "followed": self.followed(),
+            "running": bool(self._thread and self._thread.is_alive())
+        }
+
+
+class AccessLogMiddleware:
+    """
+    ASGI middleware recording every HTTP request as a combined-format line:
+
+        ip - - [timestamp] "METHOD path?query HTTP/version" status bytes "referer" "user-agent"
+
+    The line is built when the response finishes (streamed responses
+    included) and handed to the writer; no I/O happens on the request path.
+    A request that raises before sending a response is logged as a 500.
+    """
+
+    def __init__(self, app, writer: Optional[AccessLogWriter] = None):
+        self.app = app
+        self.writer = writer or access_log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.time()
+        response = {"status": 500, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._record(scope, started, response["status"], response["bytes"])
+
+    def _record(self, scope, started: float, status: int, size: int):
+        try:
+            referer, agent = "-", ""
+            for name, value in scope.get("headers", ()):
+                if name == b"user-agent":
+                    agent = value.decode("latin-1")
+                elif name == b"referer":
+                    referer = value.decode("latin-1")
+            path = (scope.get("raw_path") or scope["path"].encode()).decode("latin-1")
+            # Some servers already include the query string in raw_path
+            if scope.get("query_string") and "?" not in path:
+                path += "?" + scope["query_string"].decode("latin-1")
+            client = scope.get("client")
+            self.writer.record(
+                f'{client[0] if client else "-"} - - [{self.writer.timestamp(started)}] '
+                f'"{scope["method"]} {_quote(path)} HTTP/{scope.get("http_version", "1.1")}" {status} {size} '
+                f'"{_quote(referer)}" "{_quote(agent) or "-"}"',
+                status
+            )
+        except Exception as e:
+            logger.error(f"Error recording access log line: {e}")
+
+
+# Singleton instance
+access_log = AccessLogWriter(
+    settings.ACCESS_LOG_PATH,
+    flush_interval=settings.ACCESS_LOG_FLUSH_INTERVAL,
+    flush_lines=settings.ACCESS_LOG_FLUSH_LINES
+)
@@ -0,0 +1,182 @@
+"""
+Pluggable embedding engines for text-to-vector encoding
+"""
+import re
+import math
+import hashlib
+import logging
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 1024
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Very common words carry no signal for site/equipment search
+STOP_WORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "get", "give",
+    "has", "have", "in", "is", "it", "me", "of", "on", "or", "show", "site", "that",
+    "the", "their", "there", "this", "to", "was", "were", "what", "which", "with",
+})
+
+
+class EmbeddingEngine:
+    """Base class for embedding backends"""
+
+    name = "base"
+    dimension = EMBEDDING_DIM
+
+    def embed_batch(self, texts: Sequence[str], input_type: str = "search_document") -> Optional[np.ndarray]:
+        """Encode a batch of texts into a (len(texts), dimension) float32 matrix"""
+        raise NotImplementedError
+
+    def embed(self, text: str, input_type: str = "search_document") -> Optional[List[float]]:
+        """Encode a single text"""
+        matrix = self.embed_batch([text], input_type)
+        if matrix is None or len(matrix) == 0:
+            return None
+        return matrix[0].tolist()
+
+
+class HashingEmbeddingEngine(EmbeddingEngine):
+    """
+    Deterministic local engine using the hashing trick.
+
+    Each text is tokenized into words, word bigrams and character trigrams.
+    Features are hashed into a fixed number of signed buckets, weighted with
+    sublinear term frequency and L2-normalized, so cosine similarity reflects
+    lexical overlap. Output depends only on the input text.
+    """
+
+    name = "local"
+
+    # Relative weights of the feature families
+    WORD_WEIGHT = 1.0
+    BIGRAM_WEIGHT = 0.7
+    TRIGRAM_WEIGHT = 0.35
+
+    def __init__(self, dimension: int = EMBEDDING_DIM):
+        self.dimension = dimension
+        # Per-instance memo so that engines with different dimensions never share entries
+        self._token_features = lru_cache(maxsize=65536)(self._compute_token_features)
+        self._bigram_feature = lru_cache(maxsize=65536)(self._compute_bigram_feature)
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        """Map a feature string to a (bucket, sign) pair with a stable hash"""
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dimension, (1.0 if value >> 63 else -1.0)
+
+    def _compute_token_features(self, token: str) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+        """Word feature plus character trigrams of the padded token"""
+        indices = []
+        weights = []
+
+        index, sign = self._bucket(f"w:{token}")
+        indices.append(index)
+        weights.append(sign * self.WORD_WEIGHT)
+
+        padded = f"#{token}#"
+        for i in range(len(padded) - 2):
+            index, sign = self._bucket(f"c:{padded[i:i + 3]}")
+            indices.append(index)
+            weights.append(sign * self.TRIGRAM_WEIGHT)
+
+        return tuple(indices), tuple(weights)
+
+    def _compute_bigram_feature(self, bigram: str) -> Tuple[int, float]:
+        index, sign = self._bucket(f"b:{bigram}")
+        return index, sign * self.BIGRAM_WEIGHT
+
+    def tokenize(self, text: str) -> List[str]:
+        """Lowercase alphanumeric tokens without stop words"""
+        return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOP_WORDS]
+
+    def embed_batch(self, texts: Sequence[str], input_type: str = "search_document") -> Optional[np.ndarray]:
+        """Encode a batch of texts with a single scatter-add over all features"""
+        rows: List[int] = []
+        cols: List[int] = []
+        values: List[float] = []
+
+        for row, text in enumerate(texts):
+            tokens = self.tokenize(text)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+
+            for token, count in counts.items():
+                # Sublinear term frequency
+                tf = 1.0 + math.log(count)
+                indices, weights = self._token_features(token)
+                rows.extend([row] * len(indices))
+                cols.extend(indices)
+                values.extend(w * tf for w in weights)
+
+            for first, second in zip(tokens, tokens[1:]):
+                index, weight = self._bigram_feature(f"{first} {second}")
+                rows.append(row)
+                cols.append(index)
+                values.append(weight)
+
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if values:
+            flat = np.asarray(rows, dtype=np.int64) * self.dimension + np.asarray(cols, dtype=np.int64)
+            matrix.ravel()[:] = np.bincount(
+                flat, weights=np.asarray(values, dtype=np.float64), minlength=matrix.size
+            )
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+class CohereEmbeddingEngine(EmbeddingEngine):
+    """Remote engine backed by the Cohere embed API"""
+
+    name = "cohere"
+    model = "embed-english-v3.0"
+
+    def __init__(self, client):
+        self.client = client
+
+    def embed_batch(self, texts: Sequence[str], input_type: str = "search_document") -> Optional[np.ndarray]:
+        try:
+            response = self.client.embed(
+                texts=list(texts),
+                model=self.model,
+                input_type=input_type
+            )
+            return np.asarray(response.embeddings, dtype=np.float32)
+        except Exception as e:
+            logger.error(f"Error generating Cohere embeddings: {e}")
+            return None
+
+
+def create_embedding_engine(backend: Optional[str] = None) -> EmbeddingEngine:
+    """
+    Build the configured embedding engine.
+
+    backend is one of "auto" (Cohere when an API key is configured, local otherwise),
+    "cohere" or "local".
+    """
+    backend = (backend or settings.EMBEDDING_BACKEND).lower()
+
+    if backend in ("auto", "cohere") and settings.COHERE_API_KEY:
+        try:
+            import cohere
+            client = cohere.Client(settings.COHERE_API_KEY)
+            logger.info("Cohere client initialized")
+            return CohereEmbeddingEngine(client)
+        except Exception as e:
+            logger.warning(f"Failed to initialize Cohere: {e}")
+    elif backend == "cohere":
+        logger.warning("EMBEDDING_BACKEND=cohere but COHERE_API_KEY is not configured")
+
+    logger.info("Using local hashing embedding engine")
+    return HashingEmbeddingEngine(settings.EMBEDDING_DIM)
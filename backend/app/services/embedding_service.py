@@ -1,50 +1,87 @@
 """
-Image embedding service using Cohere API
+Image embedding service with pluggable embedding engines (Cohere or local)
 """
-import cohere
 import base64
 import os
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional, Tuple
 from PIL import Image
 import io
+import re
 import logging
 from app.config import settings
 from app.services.redis_service import redis_service
+from app.services.embedding_engine import create_embedding_engine
+from app.services.cache import LRUCache
+from app.services.vector_index import VectorIndex
+from app.services.perceptual_hash import BKTree, dhash, phash
 
 logger = logging.getLogger(__name__)
 
+# Image folders under the data path and the device type they contain
+IMAGE_FOLDERS = {
+    "TurbineImages": "turbine",
+    "ThermalEngines": "thermal_engine",
+    "ElectricalRotors": "electrical_rotor",
+    "OilAndGas": "connected_device"
+}
+
+SITE_MAPPING = {
+    "turbine": "WY-ALPHA",
+    "thermal_engine": "TX-EAGLE",
+    "electrical_rotor": "NM-SAGE",
+    "connected_device": "ND-RAVEN"
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def iter_image_files(data_path: str) -> Iterator[Tuple[str, str, str]]:
+    """Yield (image_path, site_id, device_type) for every image under the data path"""
+    for folder, device_type in IMAGE_FOLDERS.items():
+        folder_path = os.path.join(data_path, folder)
+        if os.path.exists(folder_path):
+            for filename in sorted(os.listdir(folder_path)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(folder_path, filename), SITE_MAPPING.get(device_type, "UNKNOWN"), device_type
+
 
 class EmbeddingService:
     def __init__(self):
-        self.cohere_client = None
-        self.use_cohere = False
-
-        if settings.COHERE_API_KEY:
-            try:
-                self.cohere_client = cohere.Client(settings.COHERE_API_KEY)
-                self.use_cohere = True
-                logger.info("Cohere client initialized")
-            except Exception as e:
-                logger.warning(f"Failed to initialize Cohere: {e}")
-
-    def generate_text_embedding(self, text: str) -> Optional[List[float]]:
-        """Generate embedding for text"""
-        if not self.use_cohere:
-            # Return a dummy embedding if Cohere is not available
-            logger.warning("Using dummy embeddings - Cohere API key not configured")
-            return [0.1] * 1024
+        self.engine = create_embedding_engine()
+        self.use_cohere = self.engine.name == "cohere"
+        self.query_cache = LRUCache(
+            "query_embeddings",
+            max_size=settings.QUERY_CACHE_SIZE,
+            ttl_seconds=settings.QUERY_CACHE_TTL
+        )
+        self.index = VectorIndex(
+            self.engine.dimension,
+            quantization=settings.EMBEDDING_QUANTIZATION,
+            rerank_factor=settings.EMBEDDING_RERANK_FACTOR,
+            vector_loader=self._load_vectors
+        )
+        self.image_hashes = BKTree()
+
+    def _load_vectors(self, keys: List[str]) -> List[Optional[List[float]]]:
+        """Fetch stored vectors from Redis for re-ranking"""
+        return [data["embedding"] if data else None for data in redis_service.get_embeddings(keys)]
 
+    def generate_text_embedding(self, text: str, input_type: str = "search_document") -> Optional[List[float]]:
+        """Generate embedding for text"""
         try:
-            response = self.cohere_client.embed(
-                texts=[text],
-                model='embed-english-v3.0',
-                input_type='search_document'
-            )
-            return response.embeddings[0]
+            return self.engine.embed(text, input_type)
         except Exception as e:
             logger.error(f"Error generating text embedding: {e}")
             return None
 
+    def get_query_embedding(self, query: str) -> Optional[List[float]]:
+        """Embed a search query, served from the LRU cache when possible"""
+        normalized = re.sub(r"\s+", " ", query.strip().lower())
+        key = (self.engine.name, normalized)
+        return self.query_cache.get_or_compute(
+            key, lambda: self.generate_text_embedding(normalized, input_type="search_query")
+        )
+
     def generate_image_description(self, image_path: str) -> str:
         """
         Generate a textual description of an image
@@ -89,89 +126,234 @@ class EmbeddingService:
             logger.error(f"Error generating image description: {e}")
             return "Industrial site image"
 
+    @staticmethod
+    def image_key(image_path: str, site_id: str, device_type: str) -> str:
+        """Redis key suffix for an image embedding"""
+        return f"{site_id}_{device_type}_{os.path.basename(image_path)}"
+
     def process_image(self, image_path: str, site_id: str, device_type: str) -> Dict:
         """Process an image and store its embedding"""
+        results = self.process_images([(image_path, site_id, device_type)])
+        return results[0] if results else None
+
+    def compute_image_hash(self, image_path: str) -> Optional[int]:
+        """Perceptual hash of an image (IMAGE_HASH_ALGORITHM), or None if it cannot be decoded"""
         try:
-            # Generate description
-            description = self.generate_image_description(image_path)
+            return dhash(image_path) if settings.IMAGE_HASH_ALGORITHM == "dhash" else phash(image_path)
+        except Exception as e:
+            logger.warning(f"Could not hash image {image_path}: {e}")
+            return None
+
+    def find_duplicates(self, image_hash: int, max_distance: Optional[int] = None,
+                        exclude_key: Optional[str] = None) -> List[Tuple[int, str]]:
+        """Indexed images whose perceptual hash is within max_distance bits, closest first"""
+        if max_distance is None:
+            max_distance = settings.IMAGE_DUPLICATE_DISTANCE
+        return [
+            (distance, key) for distance, key in self.image_hashes.search(image_hash, max_distance)
+            if key != exclude_key
+        ]
+
+    def process_images(self, images: List[Tuple[str, str, str]]) -> List[Dict]:
+        """
+        Process a batch of (image_path, site_id, device_type) with one embedding call.
+
+        Images that are near-duplicates of an already indexed image are not
+        embedded: depending on IMAGE_DUPLICATE_POLICY they are stored as a link
+        to the original ("link") or dropped ("skip").
+        """
+        # Hashes registered in this batch but not yet backed by a stored embedding
+        pending = {}
+        try:
+            policy = settings.IMAGE_DUPLICATE_POLICY
+            originals = []
+            deferred = []
+            results = []
+
+            for image_path, site_id, device_type in images:
+                key = self.image_key(image_path, site_id, device_type)
+                image_hash = self.compute_image_hash(image_path) if policy != "off" else None
+
+                duplicates = self.find_duplicates(image_hash, exclude_key=key) if image_hash is not None else []
+                if duplicates and duplicates[0][1] in pending:
+                    # Linked once the original's embedding is stored; left unprocessed if that fails
+                    deferred.append((image_path, site_id, device_type, key, image_hash, duplicates[0]))
+                    continue
+                if duplicates:
+                    results.append(self._store_duplicate(image_path, site_id, device_type, key, image_hash,
+                                                         duplicates[0], policy))
+                    continue
+
+                if image_hash is not None:
+                    # Register now so later images in the same batch are checked against it
+                    self.image_hashes.add(key, image_hash)
+                    pending[key] = image_hash
+                originals.append((image_path, site_id, device_type, key, image_hash))
+
+            if not originals:
+                return results
+
+            # Generate descriptions
+            descriptions = [self.generate_image_description(path) for path, _, _, _, _ in originals]
+
+            # Generate embeddings from descriptions in one batch
+            embeddings = self.engine.embed_batch(descriptions, "search_document")
+            if embeddings is None:
+                self._forget_hashes(pending)
+                return results
 
-            # Generate embedding from description
-            embedding = self.generate_text_embedding(description)
+            # Images embedded now may have been near-duplicates before they changed
+            redis_service.delete_image_links([key for _, _, _, key, _ in originals])
 
-            if embedding:
-                # Store in Redis
+            for (image_path, site_id, device_type, key, image_hash), description, embedding in \
+                    zip(originals, descriptions, embeddings):
+                embedding = embedding.tolist()
                 metadata = {
                     "image_path": image_path,
                     "site_id": site_id,
                     "device_type": device_type,
                     "description": description
                 }
+                if image_hash is not None:
+                    metadata["phash"] = f"{image_hash:016x}"
 
-                key = f"{site_id}_{device_type}_{os.path.basename(image_path)}"
                 redis_service.store_embedding(key, embedding, metadata)
+                self.index.add(key, embedding, metadata)
+                pending.pop(key, None)
 
                 logger.info(f"Processed image: {image_path} -> {key}")
-                return {
+                results.append({
                     "key": key,
                     "description": description,
                     "embedding_size": len(embedding)
-                }
+                })
 
-            return None
+            for image_path, site_id, device_type, key, image_hash, match in deferred:
+                results.append(self._store_duplicate(image_path, site_id, device_type, key, image_hash, match, policy))
+            return results
 
         except Exception as e:
-            logger.error(f"Error processing image {image_path}: {e}")
-            return None
+            logger.error(f"Error processing images: {e}")
+            self._forget_hashes(pending)
+            return []
+
+    def _forget_hashes(self, pending: Dict[str, int]):
+        """Unregister hashes of images whose embedding was never stored, so nothing links to them"""
+        for key in pending:
+            self.image_hashes.remove(key)
+        pending.clear()
+
+    def _store_duplicate(self, image_path: str, site_id: str, device_type: str, key: str,
+                         image_hash: int, match: Tuple[int, str], policy: str) -> Dict:
+        """Record a near-duplicate without embedding it"""
+        distance, original_key = match
+        # A changed image that now duplicates another one must not keep its old vector
+        self.index.remove(key)
+        self.image_hashes.remove(key)
+        redis_service.delete_embedding(key)
+        redis_service.delete_image_links([key])
+        self._relink(key)
+
+        if policy == "link":
+            metadata = {
+                "image_path": image_path,
+                "site_id": site_id,
+                "device_type": device_type,
+                "phash": f"{image_hash:016x}",
+                "duplicate_of": original_key,
+                "duplicate_distance": distance
+            }
+            # Link records carry no vector and are kept out of the embedding indexes
+            redis_service.store_image_link(key, metadata)
+
+        logger.info(f"Near-duplicate image: {image_path} -> {original_key} (distance {distance}, {policy})")
+        return {
+            "key": key,
+            "duplicate_of": original_key,
+            "distance": distance,
+            "embedding_size": 0
+        }
+
+    def remove_image(self, key: str) -> bool:
+        """Remove an image (embedding or link) from Redis and the search indexes"""
+        self.index.remove(key)
+        self.image_hashes.remove(key)
+        redis_service.delete_image_links([key])
+        removed = redis_service.delete_embedding(key)
+        self._relink(key)
+        return removed
+
+    def _relink(self, original_key: str) -> int:
+        """
+        Process again the near-duplicates linked to an original that is no longer indexed.
 
-    def search_images(self, query: str, top_k: int = 5) -> List[Dict]:
-        """Search for images using natural language query"""
+        The first of them is embedded in its place and the rest link to it
+        (or to each other's originals), so none drop out of search.
+        """
+        links = redis_service.list_image_links(original_key)
+        if not links:
+            return 0
+        images, missing = [], []
+        for key, metadata in zip(links, redis_service.get_image_links(links)):
+            if metadata and os.path.exists(metadata.get("image_path", "")):
+                images.append((metadata["image_path"], metadata["site_id"], metadata["device_type"]))
+            else:
+                missing.append(key)
+        # Reprocessed images replace their own link records; only those of vanished files are dropped here
+        redis_service.delete_image_links(missing)
+        logger.info(f"Relinking {len(images)} near-duplicates of removed image {original_key}")
+        return len(self.process_images(images))
+
+    def image_metadata(self, key: str) -> Optional[Dict]:
+        """Metadata of an embedded image, or the link record of a near-duplicate"""
+        return redis_service.get_embedding_metadata([key])[0] or redis_service.get_image_links([key])[0]
+
+    def load_index(self, batch_size: int = 500) -> int:
+        """Populate the in-memory vector and hash indexes from embeddings already stored in Redis"""
+        keys = redis_service.list_embedding_keys()
+        loaded = 0
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            for key, data in zip(batch, redis_service.get_embeddings(batch)):
+                if not data or data["metadata"].get("duplicate_of"):
+                    continue
+                if data["metadata"].get("phash"):
+                    self.image_hashes.add(key, int(data["metadata"]["phash"], 16))
+                if self.index.add(key, data["embedding"], data["metadata"]):
+                    loaded += 1
+        logger.info(f"Loaded {loaded} embeddings from Redis into the search index")
+        return loaded
+
+    def search_images(self, query: str, top_k: int = 5, site_id: Optional[str] = None,
+                      device_type: Optional[str] = None) -> List[Dict]:
+        """Search for images using natural language query, optionally filtered by site and device type"""
         try:
             # Generate embedding for query
-            query_embedding = self.generate_text_embedding(query)
+            query_embedding = self.get_query_embedding(query)
 
             if not query_embedding:
                 return []
 
-            # Search in Redis
-            results = redis_service.search_embeddings(query_embedding, top_k)
+            # Search the in-memory index; fall back to Redis if it has not been populated
+            if len(self.index):
+                return self.index.search(query_embedding, top_k, site_id, device_type)
 
-            return results
+            return redis_service.search_embeddings(query_embedding, top_k, site_id, device_type)
 
         except Exception as e:
             logger.error(f"Error searching images: {e}")
             return []
 
-    def initialize_embeddings(self, data_path: str = "/data"):
-        """Initialize embeddings for all images in the data directory"""
+    def initialize_embeddings(self, data_path: str = "/data", batch_size: int = 32):
+        """Re-embed every image in the data directory (full rebuild)"""
         try:
-            image_folders = {
-                "TurbineImages": "turbine",
-                "ThermalEngines": "thermal_engine",
-                "ElectricalRotors": "electrical_rotor",
-                "OilAndGas": "connected_device"
-            }
-
-            site_mapping = {
-                "turbine": "WY-ALPHA",
-                "thermal_engine": "TX-EAGLE",
-                "electrical_rotor": "NM-SAGE",
-                "connected_device": "ND-RAVEN"
-            }
-
+            images = list(iter_image_files(data_path))
             processed_count = 0
 
-            for folder, device_type in image_folders.items():
-                folder_path = os.path.join(data_path, folder)
-                if os.path.exists(folder_path):
-                    for filename in os.listdir(folder_path):
-                        if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                            image_path = os.path.join(folder_path, filename)
-                            site_id = site_mapping.get(device_type, "UNKNOWN")
-
-                            result = self.process_image(image_path, site_id, device_type)
-                            if result:
-                                processed_count += 1
+            for start in range(0, len(images), batch_size):
+                processed_count += len(self.process_images(images[start:start + batch_size]))
 
+            self.index.quantize()
             logger.info(f"Initialized {processed_count} image embeddings")
             return processed_count
 
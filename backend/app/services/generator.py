@@ -0,0 +1,137 @@
+"""
+Pluggable answer generators for retrieval-augmented diagnostics queries
+"""
+import re
+import logging
+from typing import Dict, Iterator, List, Optional, Set
+
+from app.config import settings
+from app.services.embedding_engine import STOP_WORDS, TOKEN_PATTERN as WORD_PATTERN
+
+logger = logging.getLogger(__name__)
+
+# Whitespace-delimited pieces, each keeping its trailing whitespace, so that
+# joining the streamed tokens reproduces the text exactly
+TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+
+NO_CONTEXT_ANSWER = "I could not find anything in the knowledge base or the logs about that."
+
+
+class Generator:
+    """Base class for generation backends"""
+
+    name = "base"
+
+    def generate(self, question: str, contexts: List[Dict]) -> Iterator[str]:
+        """Yield the answer to question as text tokens, grounded in the retrieved contexts"""
+        raise NotImplementedError
+
+    def answer(self, question: str, contexts: List[Dict]) -> str:
+        """The whole generated answer"""
+        return "".join(self.generate(question, contexts))
+
+
+class ExtractiveGenerator(Generator):
+    """
+    Deterministic local stand-in for an LLM.
+
+    Answers with the best retrieved passage, followed by lower-ranked
+    passages only when they mention question terms the passages chosen so
+    far do not, and streams the text word by word. Output depends only on
+    the question and contexts, which makes end-to-end latency benchmarks
+    reproducible offline.
+    """
+
+    name = "local"
+
+    def __init__(self, max_passages: int = 3):
+        self.max_passages = max_passages
+
+    @staticmethod
+    def _terms(text: str) -> Set[str]:
+        return {t for t in WORD_PATTERN.findall(text.lower()) if t not in STOP_WORDS}
+
+    def generate(self, question: str, contexts: List[Dict]) -> Iterator[str]:
+        if not contexts:
+            yield NO_CONTEXT_ANSWER
+            return
+        wanted = self._terms(question)
+        covered = self._terms(contexts[0]["text"])
+        passages = [contexts[0]["text"]]
+        for context in contexts[1:]:
+            if len(passages) >= self.max_passages:
+                break
+            terms = self._terms(context["text"])
+            if (wanted & terms) - covered:
+                passages.append(context["text"])
+                covered |= terms
+        for position, passage in enumerate(passages):
+            if position:
+                yield "\n\n"
+            yield from TOKEN_PATTERN.findall(passage)
+
+
+class OpenAIGenerator(Generator):
+    """Remote generator streaming chat completions from OpenAI"""
+
+    name = "openai"
+
+    SYSTEM_PROMPT = (
+        "You are an SRE assistant. Answer the question using only the provided context. "
+        "If the context does not contain the answer, say so."
+    )
+
+    def __init__(self, client, model: str):
+        self.client = client
+        self.model = model
+
+    def generate(self, question: str, contexts: List[Dict]) -> Iterator[str]:
+        context = "\n\n".join(f"[{c['title']}]\n{c['text']}" for c in contexts)
+        streamed = False
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": self.SYSTEM_PROMPT},
+                    {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}
+                ],
+                stream=True
+            )
+            try:
+                for event in stream:
+                    token = event.choices[0].delta.content if event.choices else None
+                    if token:
+                        streamed = True
+                        yield token
+            finally:
+                # Closing the HTTP response stops generation when the caller gives up early
+                stream.response.close()
+        except Exception as e:
+            logger.error(f"Error generating OpenAI answer: {e}")
+            # Fall back to the retrieved passages unless part of an answer was already sent
+            if not streamed:
+                yield from ExtractiveGenerator().generate(question, contexts)
+
+
+def create_generator(backend: Optional[str] = None) -> Generator:
+    """
+    Build the configured generator.
+
+    backend is one of "auto" (OpenAI when an API key is configured, local otherwise),
+    "openai" or "local".
+    """
+    backend = (backend or settings.RAG_GENERATOR).lower()
+
+    if backend in ("auto", "openai") and settings.OPENAI_API_KEY:
+        try:
+            from openai import OpenAI
+            client = OpenAI(api_key=settings.OPENAI_API_KEY)
+            logger.info("OpenAI client initialized")
+            return OpenAIGenerator(client, settings.RAG_OPENAI_MODEL)
+        except Exception as e:
+            logger.warning(f"Failed to initialize OpenAI: {e}")
+    elif backend == "openai":
+        logger.warning("RAG_GENERATOR=openai but OPENAI_API_KEY is not configured")
+
+    logger.info("Using local extractive generator")
+    return ExtractiveGenerator()
@@ -0,0 +1,177 @@
+"""
+Space-Saving heavy-hitter sketches for top IPs per status code
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _lookup(items: np.ndarray, values: np.ndarray, keys: np.ndarray, default: int) -> np.ndarray:
+    """values for keys found in sorted items, default elsewhere"""
+    result = np.full(len(keys), default, dtype=np.int64)
+    if len(items):
+        position = np.minimum(np.searchsorted(items, keys), len(items) - 1)
+        found = items[position] == keys
+        result[found] = values[position[found]]
+    return result
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary holding at most `capacity` counters.
+
+    Counters are kept as NumPy arrays sorted by item. Updates and merges
+    follow the mergeable-summaries rule: an item missing from a full
+    summary is assumed to have that summary's minimum count, which is also
+    added to its error. Every reported count overestimates the true count
+    by at most its error, and the error is at most total / capacity.
+    """
+
+    __slots__ = ("capacity", "items", "counts", "errors", "total")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.items = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.errors = np.zeros(0, dtype=np.int64)
+        self.total = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def floor(self) -> int:
+        """Count assumed for items not tracked by this summary"""
+        return int(self.counts.min()) if len(self.items) >= self.capacity else 0
+
+    def _combine(self, items: np.ndarray, counts: np.ndarray, errors: np.ndarray, floor: int, total: int):
+        union = np.union1d(self.items, items)
+        own_floor = self.floor()
+        merged_counts = _lookup(self.items, self.counts, union, own_floor) + _lookup(items, counts, union, floor)
+        merged_errors = _lookup(self.items, self.errors, union, own_floor) + _lookup(items, errors, union, floor)
+
+        if len(union) > self.capacity:
+            keep = np.sort(np.argpartition(-merged_counts, self.capacity - 1)[:self.capacity])
+            union, merged_counts, merged_errors = union[keep], merged_counts[keep], merged_errors[keep]
+        self.items, self.counts, self.errors = union, merged_counts, merged_errors
+        self.total += total
+
+    def update(self, items: np.ndarray, counts: np.ndarray):
+        """Add exact counts for distinct, sorted items"""
+        if len(items):
+            self._combine(items.astype(np.int64), counts.astype(np.int64),
+                          np.zeros(len(items), dtype=np.int64), 0, int(counts.sum()))
+
+    def merge(self, other: "SpaceSaving"):
+        """Fold another summary into this one"""
+        if len(other):
+            self._combine(other.items, other.counts, other.errors, other.floor(), other.total)
+
+    @classmethod
+    def merge_all(cls, sketches: List["SpaceSaving"], capacity: int) -> "SpaceSaving":
+        """Merge many summaries at once; same result as pairwise merging without the intermediate trims"""
+        merged = cls(capacity)
+        sketches = [sketch for sketch in sketches if len(sketch)]
+        if not sketches:
+            return merged
+        floors = [sketch.floor() for sketch in sketches]
+        items = np.concatenate([sketch.items for sketch in sketches])
+        # Each summary contributes its floor to every item, plus the excess for items it tracks
+        excess = np.concatenate([sketch.counts - floor for sketch, floor in zip(sketches, floors)])
+        error_excess = np.concatenate([sketch.errors - floor for sketch, floor in zip(sketches, floors)])
+        merged.items, inverse = np.unique(items, return_inverse=True)
+        merged.counts = np.bincount(inverse, weights=excess).astype(np.int64) + sum(floors)
+        merged.errors = np.bincount(inverse, weights=error_excess).astype(np.int64) + sum(floors)
+        merged.total = sum(sketch.total for sketch in sketches)
+        if len(merged.items) > capacity:
+            keep = np.sort(np.argpartition(-merged.counts, capacity - 1)[:capacity])
+            merged.items, merged.counts, merged.errors = merged.items[keep], merged.counts[keep], merged.errors[keep]
+        return merged
+
+    def top(self, n: int) -> List[Tuple[int, int, int]]:
+        """(item, count, error) for the n largest counts; ties go to the smaller item"""
+        order = np.lexsort((self.items, -self.counts))[:n]
+        return [(int(self.items[i]), int(self.counts[i]), int(self.errors[i])) for i in order]
+
+    def nbytes(self) -> int:
+        return self.items.nbytes + self.counts.nbytes + self.errors.nbytes
+
+
+class HeavyHitters:
+    """
+    Per-key Space-Saving sketches over the whole log plus per-minute sketches
+    for the most recent `window_minutes`, so top-N queries over the last N
+    minutes merge at most N small summaries. The window is anchored at the
+    newest minute seen, which keeps replayed historical logs meaningful.
+    """
+
+    def __init__(self, capacity: int = 1000, window_minutes: int = 60):
+        self.capacity = capacity
+        self.window_minutes = window_minutes
+        self.totals: Dict[int, SpaceSaving] = {}
+        self.minutes: Dict[int, "OrderedDict[int, SpaceSaving]"] = {}
+        self.latest_minute: Optional[int] = None
+
+    def add(self, key: int, minutes: np.ndarray, items: np.ndarray):
+        """Count row-aligned (minute, item) pairs under key"""
+        if not len(items):
+            return
+        width = int(items.max()) + 1
+        combined, counts = np.unique(minutes.astype(np.int64) * width + items, return_counts=True)
+        pair_minutes, pair_items = np.divmod(combined, width)
+
+        distinct, inverse = np.unique(pair_items, return_inverse=True)
+        self.totals.setdefault(key, SpaceSaving(self.capacity)).update(
+            distinct, np.bincount(inverse, weights=counts).astype(np.int64)
+        )
+
+        latest = int(pair_minutes[-1])
+        if self.latest_minute is None or latest > self.latest_minute:
+            self.latest_minute = latest
+        oldest = self.latest_minute - self.window_minutes + 1
+
+        buckets = self.minutes.setdefault(key, OrderedDict())
+        bounds = np.flatnonzero(np.diff(pair_minutes)) + 1
+        starts = np.concatenate(([0], bounds)).tolist()
+        ends = np.concatenate((bounds, [len(pair_minutes)])).tolist()
+        for start, end in zip(starts, ends):
+            minute = int(pair_minutes[start])
+            if minute < oldest:
+                continue
+            bucket = buckets.get(minute)
+            if bucket is None:
+                bucket = buckets[minute] = SpaceSaving(self.capacity)
+            bucket.update(pair_items[start:end], counts[start:end])
+        self._expire()
+
+    def _expire(self):
+        oldest = self.latest_minute - self.window_minutes + 1
+        for buckets in self.minutes.values():
+            for minute in [m for m in buckets if m < oldest]:
+                del buckets[minute]
+
+    def top(self, key: int, n: int, minutes: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        """Top (item, count, error) for key, over everything or the last `minutes` minutes"""
+        if minutes is None:
+            sketch = self.totals.get(key)
+            return sketch.top(n) if sketch else []
+
+        if self.latest_minute is None:
+            return []
+        minutes = min(minutes, self.window_minutes)
+        oldest = self.latest_minute - minutes + 1
+        buckets = [bucket for minute, bucket in self.minutes.get(key, {}).items() if minute >= oldest]
+        return SpaceSaving.merge_all(buckets, self.capacity).top(n)
+
+    def stats(self) -> Dict:
+        sketches = list(self.totals.values()) + [b for buckets in self.minutes.values() for b in buckets.values()]
+        return {
+            "keys": len(self.totals),
+            "sketches": len(sketches),
+            "capacity": self.capacity,
+            "window_minutes": self.window_minutes,
+            "bytes": sum(s.nbytes() for s in sketches)
+        }
@@ -0,0 +1,179 @@
+"""
+Image derivative pipeline: resized, web-optimized copies rendered in a process pool and cached on disk
+"""
+import os
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+import logging
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Longest-edge sizes offered to clients; a fixed set keeps the disk cache bounded
+SIZE_PRESETS = {
+    "thumb": 256,
+    "small": 512,
+    "medium": 1024,
+    "large": 2048
+}
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg")
+}
+
+
+def render_derivative(source_path: str, target_path: str, max_edge: int, image_format: str, quality: int) -> str:
+    """Decode, resize and re-encode one image (runs in a worker process)"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        # Let the JPEG decoder downscale by a power of two while decoding
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        temp_path = f"{target_path}.{os.getpid()}.tmp"
+        options = {"quality": quality}
+        if image_format == "JPEG":
+            options.update(optimize=True, progressive=True)
+        else:
+            options.update(method=4)
+        image.save(temp_path, image_format, **options)
+
+    # Atomic publish so readers never see a partial file
+    os.replace(temp_path, target_path)
+    return target_path
+
+
+class ImageDerivativeService:
+    """
+    Serves resized derivatives of source images.
+
+    Derivatives are keyed by the source content hash, size preset and
+    format, so a changed source never serves a stale derivative. Rendering
+    runs in a process pool and concurrent requests for the same derivative
+    share one render. A worker that dies (out of memory, a decompression
+    bomb) breaks the pool: the renders it had fail, and the next one starts
+    a fresh pool.
+    """
+
+    def __init__(self, cache_path: str, workers: int = 2, quality: int = 80):
+        self.cache_path = cache_path
+        self.workers = workers
+        self.quality = quality
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, Future] = {}
+        self._hashes: Dict[str, Tuple[float, int, str]] = {}
+        # Reentrant: a future that is already done runs its callbacks while the lock is held
+        self._lock = threading.RLock()
+        self.renders = 0
+        self.cache_hits = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Create the worker pool on first use; caller must hold the lock"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        """Drop a broken pool, unless it has already been replaced"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, *args) -> Future:
+        """Submit a render, replacing the pool if a worker died since the last one; caller must hold the lock"""
+        pool = self._get_pool()
+        try:
+            future = pool.submit(render_derivative, *args)
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            pool = self._get_pool()
+            future = pool.submit(render_derivative, *args)
+
+        def discard_if_broken(done: Future):
+            if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+                logger.error("Derivative worker died, restarting the render pool")
+                self._discard_pool(pool)
+
+        future.add_done_callback(discard_if_broken)
+        return future
+
+    def source_hash(self, source_path: str) -> str:
+        """Content hash of a source image, memoized by mtime and size"""
+        stat = os.stat(source_path)
+        cached = self._hashes.get(source_path)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(source_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        value = digest.hexdigest()
+        self._hashes[source_path] = (stat.st_mtime, stat.st_size, value)
+        return value
+
+    def derivative_path(self, source_hash: str, size: str, image_format: str) -> str:
+        return os.path.join(self.cache_path, source_hash[:2], f"{source_hash}_{size}.{image_format}")
+
+    @staticmethod
+    def etag(source_hash: str, size: str, image_format: str) -> str:
+        return f'"{source_hash[:32]}-{size}-{image_format}"'
+
+    async def locate(self, source_path: str, size: str, image_format: str) -> Tuple[str, str]:
+        """Return (derivative_path, etag) for a source image without rendering anything"""
+        source_hash = await asyncio.to_thread(self.source_hash, source_path)
+        return self.derivative_path(source_hash, size, image_format), self.etag(source_hash, size, image_format)
+
+    async def ensure(self, source_path: str, target_path: str, size: str, image_format: str) -> str:
+        """Render the derivative at target_path unless it is already cached"""
+        if os.path.exists(target_path):
+            self.cache_hits += 1
+            return target_path
+
+        with self._lock:
+            future = self._inflight.get(target_path)
+            if future is None:
+                pil_format, _ = FORMATS[image_format]
+                future = self._submit(source_path, target_path, SIZE_PRESETS[size], pil_format, self.quality)
+                self._inflight[target_path] = future
+                future.add_done_callback(lambda _: self._inflight.pop(target_path, None))
+                self.renders += 1
+
+        await asyncio.wrap_future(future)
+        return target_path
+
+    def stats(self) -> Dict:
+        return {
+            "renders": self.renders,
+            "cache_hits": self.cache_hits,
+            "inflight": len(self._inflight),
+            "workers": self.workers,
+            "cache_path": self.cache_path
+        }
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+# Singleton instance
+image_derivative_service = ImageDerivativeService(
+    settings.DERIVATIVE_CACHE_PATH,
+    workers=settings.DERIVATIVE_WORKERS,
+    quality=settings.DERIVATIVE_QUALITY
+)
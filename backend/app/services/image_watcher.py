@@ -0,0 +1,179 @@
+"""
+Directory watcher that keeps image embeddings in sync with the data folders
+"""
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from app.config import settings
+from app.services.redis_service import redis_service
+from app.services.embedding_service import EmbeddingService, embedding_service, iter_image_files
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_KEY = "image_manifest"
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Content hash of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImageWatcher:
+    """
+    Polls the image folders and embeds only what changed.
+
+    A manifest of (mtime, size, sha256, engine) per image path is kept in
+    the Redis hash image_manifest. Files whose mtime and size are unchanged
+    are skipped without reading them; otherwise the content hash decides
+    whether the image really changed. Added and changed images are embedded
+    in batches, removed images are deleted from Redis and the search index.
+    """
+
+    def __init__(self, service: EmbeddingService, data_path: str, interval: float = 30, batch_size: int = 32):
+        self.service = service
+        self.data_path = data_path
+        self.interval = interval
+        self.batch_size = batch_size
+        self.manifest: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_sync: Dict = {}
+
+    def load_manifest(self):
+        """Load the manifest persisted by a previous run"""
+        stored = redis_service.get_hash(MANIFEST_KEY) or {}
+        self.manifest = {path: json.loads(entry) for path, entry in stored.items()}
+
+    def scan(self) -> Tuple[List[Tuple[str, str, str]], List[str], List[str], Dict[str, Dict]]:
+        """
+        Compare the folders with the manifest.
+
+        Returns (to_embed, touched, removed, fingerprints): images to (re-)embed
+        as (path, site_id, device_type), paths whose mtime changed but content
+        did not, paths that disappeared, and the new mtime/size/sha256 of every
+        path in the first two lists.
+        """
+        to_embed = []
+        touched = []
+        fingerprints = {}
+        seen = set()
+        engine = self.service.engine.name
+
+        for image_path, site_id, device_type in iter_image_files(self.data_path):
+            seen.add(image_path)
+            try:
+                stat = os.stat(image_path)
+            except OSError:
+                continue
+
+            entry = self.manifest.get(image_path)
+            if entry and entry.get("engine") == engine \
+                    and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                continue
+
+            digest = file_sha256(image_path)
+            fingerprints[image_path] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": digest}
+            if entry and entry.get("engine") == engine and entry["sha256"] == digest:
+                touched.append(image_path)
+            else:
+                to_embed.append((image_path, site_id, device_type))
+
+        removed = [path for path in self.manifest if path not in seen]
+        return to_embed, touched, removed, fingerprints
+
+    def sync_once(self) -> Dict:
+        """Apply one round of added/changed/removed images"""
+        with self._lock:
+            to_embed, touched, removed, fingerprints = self.scan()
+            engine = self.service.engine.name
+            updates = {}
+
+            for path in touched:
+                updates[path] = dict(fingerprints[path], key=self.manifest[path]["key"], engine=engine)
+
+            embedded = 0
+            duplicates = 0
+            for start in range(0, len(to_embed), self.batch_size):
+                batch = to_embed[start:start + self.batch_size]
+                results = self.service.process_images(batch)
+                by_key = {result["key"]: result for result in results}
+                for image_path, site_id, device_type in batch:
+                    key = self.service.image_key(image_path, site_id, device_type)
+                    if key in by_key:
+                        updates[image_path] = dict(fingerprints[image_path], key=key, engine=engine)
+                        if by_key[key].get("duplicate_of"):
+                            duplicates += 1
+                        else:
+                            embedded += 1
+
+            for path in removed:
+                self.service.remove_image(self.manifest.pop(path)["key"])
+            if removed:
+                redis_service.delete_hash_fields(MANIFEST_KEY, removed)
+
+            if updates:
+                redis_service.set_hash(MANIFEST_KEY, {path: json.dumps(entry) for path, entry in updates.items()})
+                self.manifest.update(updates)
+
+            if embedded or removed:
+                self.service.index.quantize()
+
+            self.last_sync = {
+                "embedded": embedded,
+                "duplicates": duplicates,
+                "unchanged_touched": len(touched),
+                "removed": len(removed),
+                "tracked": len(self.manifest)
+            }
+            if embedded or duplicates or removed:
+                logger.info(f"Image sync: {self.last_sync}")
+            return self.last_sync
+
+    def initialize(self) -> int:
+        """Load persisted state, hydrate the search index and apply pending deltas"""
+        self.load_manifest()
+        self.service.load_index()
+        # A restart with no changed images still has to switch the hydrated index to the target codec
+        self.service.index.quantize()
+        self.sync_once()
+        return len(self.service.index)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sync_once()
+            except Exception as e:
+                logger.error(f"Error syncing images: {e}")
+
+    def start(self):
+        """Start polling in a background thread"""
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="image-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.data_path} for image changes every {self.interval}s")
+
+    def stop(self):
+        """Stop the polling thread"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+# Singleton instance
+image_watcher = ImageWatcher(
+    embedding_service,
+    settings.DATA_PATH,
+    interval=settings.IMAGE_WATCH_INTERVAL,
+    batch_size=settings.IMAGE_EMBED_BATCH_SIZE
+)
@@ -0,0 +1,161 @@
+"""
+Loading of rotated and compressed (gzip / zstd) access log archives
+"""
+import os
+import glob
+import gzip
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+import logging
+
+from app.services.log_store import DEFAULT_CHUNK_SIZE, LogStore, ParsedChunk, parse_buffer
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def compression(path: str) -> Optional[str]:
+    """Compression of path ("gzip" or "zstd") from its magic bytes, None for plain text"""
+    with open(path, "rb") as f:
+        head = f.read(4)
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head == ZSTD_MAGIC:
+        return "zstd"
+    return None
+
+
+def zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def open_archive(path: str) -> BinaryIO:
+    """Binary stream of the decompressed contents of path"""
+    kind = compression(path)
+    if kind == "gzip":
+        # Also reads concatenated members, as written by some log rotators
+        return gzip.open(path, "rb")
+    if kind == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+    return open(path, "rb")
+
+
+def expand_archives(pattern: str, exclude: Tuple[str, ...] = ()) -> List[str]:
+    """
+    Files matching a glob, oldest first (by modification time, then name).
+
+    Files in exclude (the live log) are skipped, as are zstd archives when
+    the zstandard package (in requirements.txt) is not installed.
+    """
+    if not pattern:
+        return []
+    excluded = {os.path.realpath(path) for path in exclude}
+    paths = []
+    for path in glob.glob(pattern):
+        if not os.path.isfile(path) or os.path.realpath(path) in excluded:
+            continue
+        try:
+            if compression(path) == "zstd" and not zstd_available():
+                logger.warning(f"Skipping {path}: install the zstandard package to read zstd archives")
+                continue
+            paths.append((os.path.getmtime(path), path))
+        except OSError as e:
+            logger.error(f"Error reading log archive {path}: {e}")
+    return [path for _, path in sorted(paths)]
+
+
+def iter_archive_blocks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yield (offset, data) blocks of whole lines of the decompressed archive.
+
+    Offsets count decompressed bytes; nothing is written to disk.
+    """
+    offset = 0
+    pending = b""
+    with open_archive(path) as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            data = pending + data
+            newline = data.rfind(b"\n")
+            if newline < 0:
+                # A single line longer than the chunk size
+                pending = data
+                continue
+            yield offset, data[:newline + 1]
+            offset += newline + 1
+            pending = data[newline + 1:]
+    if pending:
+        yield offset, pending
+
+
+def parse_archive(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[ParsedChunk]:
+    """Decompress and parse a whole archive block by block (runs in a worker process)"""
+    return [parse_buffer(data, offset) for offset, data in iter_archive_blocks(path, chunk_size)]
+
+
+def load_archives(store: LogStore, paths: List[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  workers: int = 1) -> int:
+    """
+    Append the rows of rotated log files to store, in the given order.
+
+    Compressed archives are stream-decompressed and parsed in a process
+    pool, one archive per worker, and appended in order as they finish;
+    at most `workers` parsed archives are held at a time. Plain rotated
+    files are loaded like the live log, so their raw lines stay readable.
+    An unreadable file is logged and skipped. Returns the number of rows added.
+    """
+    kinds = []
+    for path in paths:
+        try:
+            kinds.append((path, compression(path)))
+        except OSError as e:
+            logger.error(f"Error reading log archive {path}: {e}")
+    archives = [path for path, kind in kinds if kind]
+
+    added = 0
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and archives else None
+    try:
+        compressed = iter(archives)
+        pending = deque()
+
+        def submit():
+            path = next(compressed, None)
+            if path is not None:
+                pending.append(pool.submit(parse_archive, path, chunk_size))
+
+        if pool:
+            for _ in range(workers):
+                submit()
+
+        for path, kind in kinds:
+            try:
+                if kind is None:
+                    added += store.load_file(path, chunk_size, workers=workers)
+                    continue
+                if pool:
+                    future = pending.popleft()
+                    submit()
+                    chunks = future.result()
+                else:
+                    chunks = parse_archive(path, chunk_size)
+                store.attach_archive(path)
+                for chunk in chunks:
+                    store.append_chunk(chunk)
+                    added += len(chunk)
+                logger.info(f"Loaded {sum(len(chunk) for chunk in chunks)} log entries from {kind} archive {path}")
+            except Exception as e:
+                logger.error(f"Error loading log archive {path}: {e}")
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    return added
@@ -0,0 +1,136 @@
+"""
+Follows the access log like `tail -F` and feeds new lines into the log store
+"""
+import os
+import threading
+from typing import Dict, Optional, Tuple
+import logging
+
+from app.config import settings
+from app.services.log_store import LogStore
+from app.services.log_snapshot import source_fingerprint
+from app.services.rag_service import RAGService, rag_service
+
+logger = logging.getLogger(__name__)
+
+# Bytes hashed from each end of the part already read, to notice it being rewritten
+FINGERPRINT_SAMPLE = 4096
+
+
+class LogFollower:
+    """
+    Polls the log file and appends newly written lines to the service's store.
+
+    Only complete lines are parsed; a partially written last line is picked
+    up once its newline arrives. Rotation (the path now names a different
+    file) drains what is left of the old file before switching to the new
+    one. Truncation (same file, smaller than what was read, or with the
+    part already read rewritten, as after a copytruncate that was written
+    past the old offset between polls) restarts from the beginning. The
+    store updates its aggregates per appended block, so
+    diagnostics stay current without reloading.
+    """
+
+    def __init__(self, service: RAGService, log_path: str, interval: float = 1.0,
+                 chunk_size: int = settings.LOG_CHUNK_SIZE):
+        self.service = service
+        self.log_path = log_path
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.rows_appended = 0
+        self.rotations = 0
+        self.truncations = 0
+        # (offset, fingerprint) of the part already read, and the (size, mtime) it was last checked at
+        self._fingerprint: Optional[Tuple[int, str]] = None
+        self._checked: Optional[Tuple[int, int]] = None
+
+    def poll(self) -> int:
+        """Ingest whatever was appended since the last poll; returns rows added"""
+        with self._lock:
+            store = self.service.store
+            try:
+                stat = os.stat(self.log_path)
+            except FileNotFoundError:
+                # Rotated away and not recreated yet: keep reading the old file
+                return self._load(store)
+
+            added = 0
+            if store.source_path is None:
+                store.attach(self.log_path)
+            elif store.source_identity != (stat.st_dev, stat.st_ino):
+                added += self._load(store, include_partial=True)
+                store.attach(self.log_path)
+                self.rotations += 1
+                logger.info(f"Log rotated, following new {self.log_path}")
+            elif stat.st_size < store.source_offset or self._rewritten(store, stat):
+                store.mark_truncated()
+                store.attach(self.log_path)
+                self.truncations += 1
+                logger.info(f"Log truncated, re-reading {self.log_path} from the start")
+
+            added += self._load(store)
+            self._remember(store, stat)
+            return added
+
+    def _remember(self, store: LogStore, stat: os.stat_result):
+        """Fingerprint what has been read so far, right after reading it"""
+        offset = store.source_offset
+        if not offset:
+            self._fingerprint = None
+        elif self._fingerprint is None or self._fingerprint[0] != offset:
+            self._fingerprint = (offset, source_fingerprint(store.source_path, offset, FINGERPRINT_SAMPLE))
+        self._checked = (stat.st_size, stat.st_mtime_ns)
+
+    def _rewritten(self, store: LogStore, stat: os.stat_result) -> bool:
+        """Whether the part of the file already read changed, checked only when the file did"""
+        if self._fingerprint is None or self._fingerprint[0] != store.source_offset or \
+                self._checked == (stat.st_size, stat.st_mtime_ns):
+            return False
+        offset, fingerprint = self._fingerprint
+        return source_fingerprint(store.source_path, offset, FINGERPRINT_SAMPLE) != fingerprint
+
+    def _load(self, store: LogStore, include_partial: bool = False) -> int:
+        added = store.load_file(chunk_size=self.chunk_size, include_partial=include_partial)
+        self.rows_appended += added
+        return added
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error following log file: {e}")
+
+    def start(self):
+        """Start following in a background thread"""
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-follower", daemon=True)
+        self._thread.start()
+        logger.info(f"Following {self.log_path} every {self.interval}s")
+
+    def stop(self):
+        """Stop the follower thread"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def stats(self) -> Dict:
+        store = self.service.store
+        return {
+            "log_path": self.log_path,
+            "rows": len(store),
+            "offset": store.source_offset,
+            "rows_appended": self.rows_appended,
+            "rotations": self.rotations,
+            "truncations": self.truncations,
+            "following": bool(self._thread and self._thread.is_alive())
+        }
+
+
+# Singleton instance
+log_follower = LogFollower(rag_service, settings.LOG_PATH, interval=settings.LOG_FOLLOW_INTERVAL)
@@ -0,0 +1,257 @@
+"""
+Inverted index over log rows for full-text search
+"""
+import re
+import math
+import bisect
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Row ids per compressed posting block
+BLOCK_SIZE = 128
+
+# Rows scanned in the first search window; the window doubles while matches are sparse
+INITIAL_WINDOW = 1 << 16
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*")
+
+DELTA_DTYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+DELTA_LIMITS = [np.iinfo(dtype).max for dtype in DELTA_DTYPES]
+
+
+def tokenize(text: str, split_dots: bool = True) -> List[str]:
+    """
+    Lowercase alphanumeric tokens of a field value.
+
+    Dotted tokens such as "app.js" or "5.0" are kept whole and, when
+    split_dots is set, also indexed by their parts; IP addresses are
+    indexed whole only so that octets do not become huge posting lists.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if split_dots and "." in token:
+            tokens.extend(token.split("."))
+    return list(dict.fromkeys(tokens))
+
+
+class PostingList:
+    """
+    Sorted row ids of one token, delta-encoded in fixed-size blocks.
+
+    Each full block stores its first row id and the gaps to the following
+    rows in the narrowest unsigned dtype that fits them, so frequent
+    tokens cost about one byte per row. The newest rows stay in an
+    uncompressed tail until a block fills up.
+    """
+
+    __slots__ = ("starts", "ends", "blocks", "tail", "count")
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.blocks: List[np.ndarray] = []
+        self.tail = np.zeros(0, dtype=np.int64)
+        self.count = 0
+
+    def extend(self, rows: np.ndarray):
+        """Append row ids greater than any already present"""
+        self.count += len(rows)
+        tail = np.concatenate([self.tail, rows]) if len(self.tail) else rows
+        full = len(tail) - len(tail) % BLOCK_SIZE
+        if full:
+            self._seal(tail[:full].reshape(-1, BLOCK_SIZE))
+        self.tail = tail[full:].astype(np.int64, copy=True)
+
+    def _seal(self, rows: np.ndarray):
+        """Compress a (blocks, BLOCK_SIZE) array of row ids"""
+        gaps = np.diff(rows, axis=1)
+        widths = np.searchsorted(DELTA_LIMITS, gaps.max(axis=1))
+        blocks: List[Optional[np.ndarray]] = [None] * len(rows)
+        for width in np.unique(widths).tolist():
+            selected = np.flatnonzero(widths == width)
+            for position, block in zip(selected.tolist(), gaps[selected].astype(DELTA_DTYPES[width])):
+                blocks[position] = block
+        self.starts.extend(rows[:, 0].tolist())
+        self.ends.extend(rows[:, -1].tolist())
+        self.blocks.extend(blocks)
+
+    def _decode(self, block: int) -> np.ndarray:
+        rows = np.empty(len(self.blocks[block]) + 1, dtype=np.int64)
+        rows[0] = self.starts[block]
+        np.cumsum(self.blocks[block], out=rows[1:], dtype=np.int64)
+        rows[1:] += rows[0]
+        return rows
+
+    def rows_between(self, low: int, high: int) -> np.ndarray:
+        """Row ids in [low, high)"""
+        parts = []
+        first = bisect.bisect_left(self.ends, low)
+        last = bisect.bisect_left(self.starts, high)
+        for block in range(first, last):
+            parts.append(self._decode(block))
+        if len(self.tail) and self.tail[-1] >= low and self.tail[0] < high:
+            parts.append(self.tail)
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        return rows[(rows >= low) & (rows < high)]
+
+    def nbytes(self) -> int:
+        return sum(block.nbytes for block in self.blocks) + 16 * len(self.blocks) + self.tail.nbytes
+
+
+class LogIndex:
+    """
+    Token -> posting list index over the rows of a LogStore.
+
+    Tokens come from the IP, path segments, method, status code and user
+    agent. Because those columns are dictionary encoded, each distinct
+    value is tokenized once and rows are added per distinct value.
+
+    Queries are evaluated newest-first over row windows that grow until
+    enough matches are found, so the work depends on how recent the
+    matches are rather than on the size of the log.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, PostingList] = {}
+        self.rows = 0
+        # Cached token lists per dictionary code, per column
+        self._code_tokens: Dict[str, List[List[str]]] = {}
+
+    def _tokens(self, column: str, values: List[str], code: int) -> List[str]:
+        cached = self._code_tokens.setdefault(column, [])
+        while len(cached) <= code:
+            cached.append(tokenize(values[len(cached)], split_dots=column != "ip"))
+        return cached[code]
+
+    def add(self, first_row: int, columns: Dict[str, Tuple[np.ndarray, Optional[List[str]]]]):
+        """
+        Index a block of appended rows.
+
+        columns maps a column name to (codes, dictionary values); codes are
+        row-aligned and values is None for columns whose codes are the
+        literal value (status).
+        """
+        batch: Dict[str, List[np.ndarray]] = {}
+        count = 0
+        for column, (codes, values) in columns.items():
+            count = len(codes)
+            if not count:
+                continue
+            order = np.argsort(codes, kind="stable")
+            ordered = codes[order]
+            bounds = np.flatnonzero(np.diff(ordered)) + 1
+            distinct = ordered[np.concatenate(([0], bounds))].tolist()
+            groups = np.split(order.astype(np.int64) + first_row, bounds)
+            for code, rows in zip(distinct, groups):
+                tokens = [str(code)] if values is None else self._tokens(column, values, code)
+                for token in tokens:
+                    batch.setdefault(token, []).append(rows)
+
+        for token, parts in batch.items():
+            # A token may come from several columns of the same row
+            rows = np.unique(np.concatenate(parts)) if len(parts) > 1 else parts[0]
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = PostingList()
+            posting.extend(rows)
+        self.rows = max(self.rows, first_row + count)
+
+    @staticmethod
+    def parse_query(query: str) -> Tuple[List[str], str]:
+        """Split a query into tokens and a mode: terms are ANDed unless joined by OR"""
+        words = query.split()
+        mode = "or" if "OR" in words else "and"
+        terms = []
+        for word in words:
+            if word in ("AND", "OR"):
+                continue
+            # Dotted values are indexed whole, so query them whole
+            terms.extend(tokenize(word, split_dots=False))
+        return list(dict.fromkeys(terms)), mode
+
+    def search(self, query: str, limit: int = 50, low: int = 0, high: Optional[int] = None,
+               keep: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> List[Tuple[int, float]]:
+        """
+        Matching (row, score) pairs, best first.
+
+        AND queries return the most recent matching rows. OR queries rank
+        rows by the summed IDF of the terms they contain, then by recency,
+        among the most recent candidates. Only rows in [low, high) are
+        considered, further narrowed by the optional keep mask function.
+        """
+        terms, mode = self.parse_query(query)
+        if not terms or limit <= 0:
+            return []
+
+        postings = [self.postings.get(term) for term in terms]
+        if mode == "and" and any(p is None for p in postings):
+            return []
+        # Rarest term first keeps AND intersections small
+        postings = sorted((p for p in postings if p is not None), key=lambda p: p.count)
+        if not postings:
+            return []
+        weights = [math.log(1 + self.rows / p.count) for p in postings]
+
+        # OR keeps a deeper candidate pool so that strong matches can outrank recent weak ones
+        wanted = limit if mode == "and" else limit * 4
+        matches: List[Tuple[np.ndarray, np.ndarray]] = []
+        found = 0
+        full_matches = 0
+        floor = low
+        high = self.rows if high is None else min(high, self.rows)
+        window = INITIAL_WINDOW
+        while high > floor and found < wanted:
+            low = max(floor, high - window)
+            if mode == "and":
+                rows = postings[0].rows_between(low, high)
+                for posting in postings[1:]:
+                    if not len(rows):
+                        break
+                    rows = np.intersect1d(rows, posting.rows_between(low, high), assume_unique=True)
+                scores = np.full(len(rows), sum(weights))
+                complete = np.ones(len(rows), dtype=bool)
+            else:
+                parts = [(posting.rows_between(low, high), weight) for posting, weight in zip(postings, weights)]
+                rows = np.unique(np.concatenate([part for part, _ in parts]))
+                scores = np.zeros(len(rows))
+                hits = np.zeros(len(rows), dtype=np.int64)
+                for part, weight in parts:
+                    position = np.searchsorted(rows, part)
+                    scores[position] += weight
+                    hits[position] += 1
+                complete = hits == len(postings)
+            if keep is not None and len(rows):
+                selected = keep(rows)
+                rows, scores, complete = rows[selected], scores[selected], complete[selected]
+            full_matches += int(complete.sum())
+            if len(rows):
+                matches.append((rows, scores))
+                found += len(rows)
+            high = low
+            window *= 2
+            if mode == "or" and full_matches >= limit:
+                break
+
+        if not matches:
+            return []
+        rows = np.concatenate([m[0] for m in matches])
+        scores = np.concatenate([m[1] for m in matches])
+        order = np.lexsort((-rows, -scores))[:limit]
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+    def stats(self) -> Dict:
+        postings = sum(p.count for p in self.postings.values())
+        compressed = sum(p.nbytes() for p in self.postings.values())
+        return {
+            "tokens": len(self.postings),
+            "postings": postings,
+            "compressed_bytes": compressed,
+            "bytes_per_posting": compressed / postings if postings else 0
+        }
@@ -0,0 +1,277 @@
+"""
+On-disk snapshots of the parsed and indexed log state
+"""
+import os
+import json
+import mmap
+import struct
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from app.services.log_store import GrowableArray, Dictionary, LogStore
+from app.services.log_index import BLOCK_SIZE, DELTA_DTYPES, LogIndex, PostingList
+from app.services.heavy_hitters import HeavyHitters, SpaceSaving
+from app.services.log_time_index import TimeIndex
+
+logger = logging.getLogger(__name__)
+
+# File layout: MAGIC, uint32 format version, uint64 header length, JSON
+# header, then raw little-endian arrays, each starting on an ALIGN boundary
+MAGIC = b"LOGSNAP\0"
+SNAPSHOT_VERSION = 1
+ALIGN = 64
+PREAMBLE = struct.Struct("<8sIQ")
+
+# Bytes hashed from each end of the indexed prefix of the source file
+HASH_SAMPLE = 1 << 20
+# Seconds a file's mtime must predate the save for size + mtime alone to be trusted
+MTIME_SLACK = 2.0
+
+DICTIONARIES = ("ips", "paths", "methods", "protocols", "timestamps", "agents")
+COLUMNS = ("timestamp_epochs", "ip", "path", "method", "protocol", "timestamp", "agent", "status", "bytes", "offset")
+
+
+def source_fingerprint(path: str, length: int, sample: int = HASH_SAMPLE) -> str:
+    """SHA-256 of the first and last `sample` bytes of path[:length], plus the length"""
+    digest = hashlib.sha256(str(length).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(min(length, sample)))
+        if length > sample:
+            f.seek(max(sample, length - sample))
+            digest.update(f.read(length - max(sample, length - sample)))
+    return digest.hexdigest()
+
+
+def _pack_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [value.encode("utf-8", errors="surrogatepass") for value in values]
+    ends = np.cumsum([len(value) for value in encoded], dtype=np.int64)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), ends
+
+
+def _unpack_strings(data: np.ndarray, ends: np.ndarray) -> List[str]:
+    raw = data.tobytes()
+    starts = [0] + ends[:-1].tolist()
+    return [raw[start:end].decode("utf-8", errors="surrogatepass") for start, end in zip(starts, ends.tolist())]
+
+
+def _index_arrays(index: LogIndex, arrays: Dict[str, np.ndarray]) -> Dict:
+    tokens = list(index.postings)
+    postings = [index.postings[token] for token in tokens]
+    widths = {np.dtype(dtype): width for width, dtype in enumerate(DELTA_DTYPES)}
+    blocks = [block for posting in postings for block in posting.blocks]
+
+    arrays["index_tokens"], arrays["index_token_ends"] = _pack_strings(tokens)
+    arrays["index_block_counts"] = np.asarray([len(p.blocks) for p in postings], dtype=np.int64)
+    arrays["index_tail_counts"] = np.asarray([len(p.tail) for p in postings], dtype=np.int64)
+    arrays["index_counts"] = np.asarray([p.count for p in postings], dtype=np.int64)
+    arrays["index_starts"] = np.asarray([start for p in postings for start in p.starts], dtype=np.int64)
+    arrays["index_ends"] = np.asarray([end for p in postings for end in p.ends], dtype=np.int64)
+    arrays["index_widths"] = np.asarray([widths[block.dtype] for block in blocks], dtype=np.uint8)
+    arrays["index_data"] = np.frombuffer(b"".join(block.tobytes() for block in blocks), dtype=np.uint8)
+    arrays["index_tails"] = np.concatenate([p.tail for p in postings]) if postings else np.zeros(0, dtype=np.int64)
+    return {"rows": index.rows}
+
+
+def _restore_index(arrays: Dict[str, np.ndarray], meta: Dict) -> LogIndex:
+    index = LogIndex()
+    index.rows = meta["rows"]
+    tokens = _unpack_strings(arrays["index_tokens"], arrays["index_token_ends"])
+    starts = arrays["index_starts"].tolist()
+    ends = arrays["index_ends"].tolist()
+    widths = arrays["index_widths"].tolist()
+    data = arrays["index_data"]
+    tails = arrays["index_tails"]
+
+    block = 0
+    offset = 0
+    tail = 0
+    for token, blocks, tail_count, count in zip(tokens, arrays["index_block_counts"].tolist(),
+                                                arrays["index_tail_counts"].tolist(), arrays["index_counts"].tolist()):
+        posting = PostingList()
+        posting.starts = starts[block:block + blocks]
+        posting.ends = ends[block:block + blocks]
+        for width in widths[block:block + blocks]:
+            dtype = np.dtype(DELTA_DTYPES[width])
+            # Views into the mapped file; full blocks always hold BLOCK_SIZE - 1 gaps
+            posting.blocks.append(data[offset:offset + (BLOCK_SIZE - 1) * dtype.itemsize].view(dtype))
+            offset += (BLOCK_SIZE - 1) * dtype.itemsize
+        posting.tail = np.array(tails[tail:tail + tail_count], dtype=np.int64)
+        posting.count = count
+        index.postings[token] = posting
+        block += blocks
+        tail += tail_count
+    return index
+
+
+def _sketch_arrays(hitters: HeavyHitters, arrays: Dict[str, np.ndarray]) -> Dict:
+    sketches: List[Tuple[int, Optional[int], SpaceSaving]] = [(key, None, s) for key, s in hitters.totals.items()]
+    sketches += [(key, minute, s) for key, buckets in hitters.minutes.items() for minute, s in buckets.items()]
+    for field in ("items", "counts", "errors"):
+        parts = [getattr(s, field) for _, _, s in sketches]
+        arrays[f"sketch_{field}"] = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+    return {
+        "capacity": hitters.capacity,
+        "window_minutes": hitters.window_minutes,
+        "latest_minute": hitters.latest_minute,
+        "sketches": [[key, minute, len(s), s.total] for key, minute, s in sketches]
+    }
+
+
+def _restore_sketches(arrays: Dict[str, np.ndarray], meta: Dict) -> HeavyHitters:
+    hitters = HeavyHitters(meta["capacity"], meta["window_minutes"])
+    hitters.latest_minute = meta["latest_minute"]
+    position = 0
+    for key, minute, size, total in meta["sketches"]:
+        sketch = SpaceSaving(meta["capacity"])
+        sketch.items, sketch.counts, sketch.errors = (
+            np.array(arrays[f"sketch_{field}"][position:position + size]) for field in ("items", "counts", "errors")
+        )
+        sketch.total = total
+        position += size
+        if minute is None:
+            hitters.totals[key] = sketch
+        else:
+            # Buckets were written in their original (oldest first) order
+            hitters.minutes.setdefault(key, OrderedDict())[minute] = sketch
+    return hitters
+
+
+def save_snapshot(store: LogStore, snapshot_path: str) -> bool:
+    """Write the store to snapshot_path atomically; only single-file stores can be snapshotted"""
+    with store.lock:
+        if not store.single_file:
+            logger.info("Log store spans several files or in-memory rows; snapshot skipped")
+            return False
+
+        stat = os.stat(store.source_path)
+        arrays: Dict[str, np.ndarray] = {}
+        for name in DICTIONARIES:
+            arrays[f"dict_{name}"], arrays[f"dict_{name}_ends"] = _pack_strings(getattr(store, name).values)
+        for name in COLUMNS:
+            arrays[f"column_{name}"] = getattr(store, name).view()
+        arrays["status_counts"] = store.status_counts
+        arrays["method_counts"] = store.method_counts
+        time_index = store.time_index
+        arrays["time_epochs"], arrays["time_rows"] = time_index.sorted_arrays()
+        arrays["time_minute_requests"] = time_index.minute_requests[:time_index.minute_count]
+        arrays["time_minute_errors"] = time_index.minute_errors[:time_index.minute_count]
+
+        header = {
+            "source": {
+                "path": os.path.abspath(store.source_path),
+                "length": store.source_offset,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "hash": source_fingerprint(store.source_path, store.source_offset),
+                "saved": time.time()
+            },
+            "rows": len(store),
+            "total_bytes": store.total_bytes,
+            "time_base_minute": time_index.base_minute,
+            "index": _index_arrays(store.index, arrays),
+            "sketches": _sketch_arrays(store.heavy_hitters, arrays),
+            "arrays": {}
+        }
+
+    # Lay the arrays out after the header
+    layout = header["arrays"]
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {"offset": offset, "dtype": array.dtype.str, "length": len(array)}
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    encoded = json.dumps(header).encode("utf-8")
+    data_start = -(-(PREAMBLE.size + len(encoded)) // ALIGN) * ALIGN
+
+    os.makedirs(os.path.dirname(os.path.abspath(snapshot_path)), exist_ok=True)
+    temp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, SNAPSHOT_VERSION, len(encoded)))
+        f.write(encoded)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    # Atomic publish so a concurrent reader never maps a partial file
+    os.replace(temp_path, snapshot_path)
+    logger.info(f"Saved log snapshot of {header['rows']} rows to {snapshot_path}")
+    return True
+
+
+def _read(snapshot_path: str) -> Optional[Tuple[Dict, Dict[str, np.ndarray]]]:
+    with open(snapshot_path, "rb") as f:
+        preamble = f.read(PREAMBLE.size)
+        if len(preamble) < PREAMBLE.size:
+            return None
+        magic, version, header_length = PREAMBLE.unpack(preamble)
+        if magic != MAGIC or version != SNAPSHOT_VERSION:
+            logger.info(f"Ignoring log snapshot with format {magic!r} v{version}")
+            return None
+        header = json.loads(f.read(header_length))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    data_start = -(-(PREAMBLE.size + header_length) // ALIGN) * ALIGN
+    arrays = {
+        name: np.frombuffer(mapped, dtype=np.dtype(spec["dtype"]), count=spec["length"],
+                            offset=data_start + spec["offset"])
+        for name, spec in header["arrays"].items()
+    }
+    return header, arrays
+
+
+def snapshot_matches(source: Dict, log_path: str) -> bool:
+    """The snapshot's source is log_path with the indexed prefix unchanged"""
+    try:
+        stat = os.stat(log_path)
+    except FileNotFoundError:
+        return False
+    if source["path"] != os.path.abspath(log_path) or stat.st_size < source["length"]:
+        return False
+    # Unchanged size and mtime prove nothing if the file was modified within the
+    # filesystem's timestamp granularity of the save, so those still get hashed
+    if stat.st_size == source["size"] and stat.st_mtime == source["mtime"] \
+            and source["saved"] - stat.st_mtime > MTIME_SLACK:
+        return True
+    # The file changed since the snapshot: reuse it only if the indexed prefix is intact (appends)
+    return source_fingerprint(log_path, source["length"]) == source["hash"]
+
+
+def load_snapshot(snapshot_path: str, log_path: str) -> Optional[LogStore]:
+    """
+    Map a snapshot of log_path into a LogStore.
+
+    Columns and posting blocks are views of the mapped file; they are
+    copied into memory only when new rows are appended. Returns None when
+    there is no usable snapshot for this log file.
+    """
+    if not os.path.exists(snapshot_path):
+        return None
+    result = _read(snapshot_path)
+    if result is None:
+        return None
+    header, arrays = result
+    if not snapshot_matches(header["source"], log_path):
+        logger.info(f"Log snapshot {snapshot_path} does not match {log_path}")
+        return None
+
+    store = LogStore()
+    # Attach while empty so the file's segment starts at row 0
+    store.attach(log_path, offset=header["source"]["length"])
+    for name in DICTIONARIES:
+        setattr(store, name, Dictionary.from_values(_unpack_strings(arrays[f"dict_{name}"], arrays[f"dict_{name}_ends"])))
+    for name in COLUMNS:
+        setattr(store, name, GrowableArray.wrap(arrays[f"column_{name}"]))
+    store.status_counts = np.array(arrays["status_counts"])
+    store.method_counts = np.array(arrays["method_counts"])
+    store.total_bytes = header["total_bytes"]
+    store.time_index = TimeIndex.restore(
+        arrays["time_epochs"], arrays["time_rows"], header["time_base_minute"],
+        arrays["time_minute_requests"], arrays["time_minute_errors"]
+    )
+    store.index = _restore_index(arrays, header["index"])
+    store.heavy_hitters = _restore_sketches(arrays, header["sketches"])
+    return store
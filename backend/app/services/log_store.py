@@ -0,0 +1,831 @@
+"""
+Columnar store for parsed access-log lines
+"""
+import os
+import re
+import mmap
+import bisect
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import count, islice
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from app.config import settings
+from app.services.log_index import LogIndex, PostingList, tokenize
+from app.services.heavy_hitters import HeavyHitters
+from app.services.log_time_index import TimeIndex
+
+logger = logging.getLogger(__name__)
+
+# Apache/Nginx log format pattern; referrer and user agent are present in the combined format
+LOG_PATTERN = re.compile(r'^(\S+) - - \[(.*?)\] "(\S+) (\S+) (\S+)" (\d+) (\d+)(?: "([^"]*)" "([^"]*)")?')
+
+# HTTP status codes are three digits; bincount grows past this for malformed values
+MAX_STATUS = 1000
+
+# Status codes from here up get per-IP heavy-hitter sketches maintained on append
+ERROR_STATUS = 400
+
+# Bytes of log text decoded and parsed at a time when loading from a file
+DEFAULT_CHUNK_SIZE = 2 << 20
+
+# Store versions are unique across stores, so results keyed by a version never
+# outlive the data they were computed from
+_versions = count(1)
+
+MONTHS = {name: number for number, name in enumerate(
+    ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), 1)}
+
+_day_starts: Dict[str, int] = {}
+
+
+def parse_timestamp(value: str) -> int:
+    """Epoch seconds of a `10/Oct/2000:13:55:36 -0700` log timestamp; -1 if malformed"""
+    try:
+        day = value[:11]
+        start = _day_starts.get(day)
+        if start is None:
+            start = _day_starts[day] = int(datetime(
+                int(value[7:11]), MONTHS[value[3:6]], int(value[0:2]), tzinfo=timezone.utc
+            ).timestamp())
+        seconds = int(value[12:14]) * 3600 + int(value[15:17]) * 60 + int(value[18:20])
+        offset = 0
+        if len(value) >= 26:
+            offset = (int(value[22:24]) * 3600 + int(value[24:26]) * 60) * (-1 if value[21] == "-" else 1)
+        return start + seconds - offset
+    except (KeyError, ValueError):
+        return -1
+
+
+class Dictionary:
+    """Maps repeated string values to dense integer codes in first-seen order"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode_many(self, values: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.encode(v) for v in values), dtype=np.int32)
+
+    def lookup(self, value: str) -> Optional[int]:
+        return self.codes.get(value)
+
+    @classmethod
+    def from_values(cls, values: List[str]) -> "Dictionary":
+        dictionary = cls()
+        dictionary.__setstate__((values,))
+        return dictionary
+
+    def __getstate__(self):
+        # The value -> code map is derivable; ship only the values between processes.
+        # Wrapped in a tuple: pickle skips __setstate__ for a falsy state (no values yet)
+        return (self.values,)
+
+    def __setstate__(self, state: Tuple[List[str]]):
+        values, = state
+        self.values = values
+        self.codes = {value: code for code, value in enumerate(values)}
+
+
+class GrowableArray:
+    """Append-only NumPy array with amortized O(1) growth"""
+
+    def __init__(self, dtype, capacity: int = 1024):
+        self._data = np.zeros(capacity, dtype=dtype)
+        self._size = 0
+
+    @classmethod
+    def wrap(cls, array: np.ndarray) -> "GrowableArray":
+        """Adopt an existing (possibly read-only, memory-mapped) array; the first append copies it"""
+        grown = cls(array.dtype, 0)
+        grown._data = array
+        grown._size = len(array)
+        return grown
+
+    def __len__(self):
+        return self._size
+
+    def extend(self, values: np.ndarray):
+        if not len(values):
+            return
+        needed = self._size + len(values)
+        if needed > len(self._data):
+            grown = np.zeros(max(needed, len(self._data) * 2), dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size:needed] = values
+        self._size = needed
+
+    def view(self) -> np.ndarray:
+        return self._data[:self._size]
+
+
+@dataclass
+class ParsedChunk:
+    """Columns parsed from a run of log lines, with chunk-local dictionaries"""
+    ips: Dictionary
+    paths: Dictionary
+    methods: Dictionary
+    protocols: Dictionary
+    timestamps: Dictionary
+    agents: Dictionary
+    ip: np.ndarray
+    path: np.ndarray
+    method: np.ndarray
+    protocol: np.ndarray
+    timestamp: np.ndarray
+    agent: np.ndarray
+    status: np.ndarray
+    bytes: np.ndarray
+    # Byte offset of each row in the source file, or None when the rows
+    # came from memory and the raw lines are kept instead
+    offset: Optional[np.ndarray] = None
+    lines: Optional[List[str]] = None
+
+    def __len__(self):
+        return len(self.status)
+
+
+def parse_lines(lines: Iterable[str], offsets: Optional[Iterable[int]] = None) -> ParsedChunk:
+    """
+    Parse raw log lines into columns; lines that do not match the format are skipped.
+
+    When offsets (the file position of each line) are given, only the
+    offsets of kept rows are recorded; otherwise the raw lines are kept.
+    """
+    dictionaries = {name: Dictionary() for name in ("ips", "paths", "methods", "protocols", "timestamps", "agents")}
+    ip, path, method, protocol, timestamp, agent, status, size, kept = [], [], [], [], [], [], [], [], []
+    match_line = LOG_PATTERN.match
+    positions = iter(offsets) if offsets is not None else None
+
+    for line in lines:
+        position = next(positions) if positions is not None else None
+        match = match_line(line)
+        if not match:
+            continue
+        ip.append(dictionaries["ips"].encode(match.group(1)))
+        timestamp.append(dictionaries["timestamps"].encode(match.group(2)))
+        method.append(dictionaries["methods"].encode(match.group(3)))
+        path.append(dictionaries["paths"].encode(match.group(4)))
+        protocol.append(dictionaries["protocols"].encode(match.group(5)))
+        agent.append(dictionaries["agents"].encode(match.group(9) or ""))
+        status.append(int(match.group(6)))
+        size.append(int(match.group(7)))
+        kept.append(line if positions is None else position)
+
+    return ParsedChunk(
+        ip=np.asarray(ip, dtype=np.int32),
+        path=np.asarray(path, dtype=np.int32),
+        method=np.asarray(method, dtype=np.int32),
+        protocol=np.asarray(protocol, dtype=np.int32),
+        timestamp=np.asarray(timestamp, dtype=np.int32),
+        agent=np.asarray(agent, dtype=np.int32),
+        status=np.asarray(status, dtype=np.int32),
+        bytes=np.asarray(size, dtype=np.int64),
+        offset=np.asarray(kept, dtype=np.int64) if positions is not None else None,
+        lines=kept if positions is None else None,
+        **dictionaries
+    )
+
+
+def parse_buffer(data: bytes, base_offset: int = 0) -> ParsedChunk:
+    """Parse a block of complete log lines read from a file starting at base_offset"""
+    text = data.decode("utf-8", errors="replace")
+    lines = text.split("\n")
+    if lines and not lines[-1]:
+        lines.pop()
+
+    if data.isascii():
+        lengths = np.fromiter((len(line) + 1 for line in lines), dtype=np.int64, count=len(lines))
+    else:
+        lengths = np.fromiter((len(line.encode("utf-8")) + 1 for line in lines), dtype=np.int64, count=len(lines))
+    offsets = base_offset + np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lines) else lengths
+
+    return parse_lines(lines, offsets.tolist())
+
+
+def chunk_bounds(mm: mmap.mmap, start: int, size: int, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 include_partial: bool = True) -> Iterator[Tuple[int, int]]:
+    """
+    Yield (start, end) byte ranges of whole lines covering mm[start:size].
+
+    A final line without a trailing newline is covered only when
+    include_partial is set (a writer may still be appending to it).
+    """
+    position = start
+    while position < size:
+        end = min(position + chunk_size, size)
+        if end < size:
+            newline = mm.rfind(b"\n", position, end)
+            if newline < 0:
+                # A single line longer than the chunk size
+                newline = mm.find(b"\n", end)
+            end = newline + 1 if newline >= 0 else size
+        if end == size and mm[size - 1:size] != b"\n" and not include_partial:
+            newline = mm.rfind(b"\n", position, size)
+            if newline < 0:
+                return
+            end = newline + 1
+        yield position, end
+        position = end
+
+
+def iter_file_chunks(fd: int, start: int = 0, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     include_partial: bool = True) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yield (offset, data) blocks of whole lines from a memory-mapped file descriptor.
+
+    Blocks end on a newline, so only one block of text is held at a time.
+    """
+    size = os.fstat(fd).st_size
+    if size <= start:
+        return
+    with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as mm:
+        for position, end in chunk_bounds(mm, start, size, chunk_size, include_partial):
+            yield position, mm[position:end]
+            # Drop the parsed pages from this process's resident set
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_DONTNEED"):
+                page_start = position - position % mmap.PAGESIZE
+                mm.madvise(mmap.MADV_DONTNEED, page_start, end - page_start)
+
+
+def parse_file_range(path: str, identity: Tuple[int, int], start: int, end: int) -> ParsedChunk:
+    """Parse bytes [start, end) of a log file (runs in a worker process)"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        stat = os.fstat(fd)
+        if (stat.st_dev, stat.st_ino) != identity:
+            raise RuntimeError(f"{path} was replaced while being parsed")
+        return parse_buffer(os.pread(fd, end - start, start), start)
+    finally:
+        os.close(fd)
+
+
+class LogStore:
+    """
+    Parse-once, column-oriented representation of an access log.
+
+    Repeated strings (IP, path, method, protocol, timestamp, user agent) are dictionary
+    encoded into int32 code columns; status and byte counts are plain NumPy
+    integer columns. Analytics run as vectorized operations over the columns.
+
+    Rows loaded from a file keep only their byte offset; raw lines are read
+    back from the file on demand, so the log text is never held in memory.
+    A store can span several files (log rotation): each source file is a
+    segment starting at a given row. Rows of segments that cannot be read
+    back (compressed archives, truncated files) get their raw line rebuilt
+    from the columns.
+
+    Appends and queries are serialized by a lock so a background follower
+    can append while requests read. Appended rows are also added to an
+    inverted index for full-text search.
+    """
+
+    def __init__(self):
+        self.ips = Dictionary()
+        self.paths = Dictionary()
+        self.methods = Dictionary()
+        self.protocols = Dictionary()
+        self.timestamps = Dictionary()
+        self.agents = Dictionary()
+        # Epoch seconds per timestamp dictionary code
+        self.timestamp_epochs = GrowableArray(np.int64)
+        self.ip = GrowableArray(np.int32)
+        self.path = GrowableArray(np.int32)
+        self.method = GrowableArray(np.int32)
+        self.protocol = GrowableArray(np.int32)
+        self.timestamp = GrowableArray(np.int32)
+        self.agent = GrowableArray(np.int32)
+        self.status = GrowableArray(np.int32)
+        self.bytes = GrowableArray(np.int64)
+        # File offset per row; negative values -(i + 1) index memory_lines
+        self.offset = GrowableArray(np.int64)
+        self.memory_lines: List[str] = []
+        self.lock = threading.RLock()
+        self.index = LogIndex()
+        self.time_index = TimeIndex()
+
+        # Source files as parallel lists: first row of each segment and its
+        # open descriptor (None for archives and once the file was truncated under us)
+        self._segment_rows: List[int] = []
+        self._segment_fds: List[Optional[int]] = []
+        self.source_path: Optional[str] = None
+        self.source_identity: Optional[Tuple[int, int]] = None
+        self.source_offset = 0
+
+        # Totals maintained on append so statistics never rescan the columns
+        self.status_counts = np.zeros(MAX_STATUS, dtype=np.int64)
+        self.method_counts = np.zeros(0, dtype=np.int64)
+        self.total_bytes = 0
+        # Bounded-memory top IPs per error status, overall and per recent minute
+        self.heavy_hitters = HeavyHitters(settings.LOG_SKETCH_CAPACITY, settings.LOG_SKETCH_WINDOW_MINUTES)
+        # Changes whenever rows are added or raw lines become unreadable
+        self.version = next(_versions)
+
+    def __len__(self):
+        return len(self.status)
+
+    @staticmethod
+    def _remap(local: Dictionary, target: Dictionary, codes: np.ndarray) -> np.ndarray:
+        """Translate chunk-local dictionary codes to this store's codes"""
+        if not len(codes):
+            return codes
+        mapping = np.asarray([target.encode(value) for value in local.values], dtype=np.int32)
+        return mapping[codes]
+
+    @staticmethod
+    def _add_counts(totals: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+        """Add a bincount of values to totals, growing totals when needed"""
+        counts = np.bincount(values, minlength=size)
+        if len(counts) > len(totals):
+            totals = np.concatenate([totals, np.zeros(len(counts) - len(totals), dtype=totals.dtype)])
+        totals[:len(counts)] += counts
+        return totals
+
+    def append_chunk(self, chunk: ParsedChunk):
+        """Append parsed rows to the columns and update the running totals"""
+        with self.lock:
+            first_row = len(self)
+            ip = self._remap(chunk.ips, self.ips, chunk.ip)
+            path = self._remap(chunk.paths, self.paths, chunk.path)
+            method = self._remap(chunk.methods, self.methods, chunk.method)
+            agent = self._remap(chunk.agents, self.agents, chunk.agent)
+            self.ip.extend(ip)
+            self.path.extend(path)
+            self.method.extend(method)
+            self.protocol.extend(self._remap(chunk.protocols, self.protocols, chunk.protocol))
+            timestamp = self._remap(chunk.timestamps, self.timestamps, chunk.timestamp)
+            self.timestamp.extend(timestamp)
+            if len(self.timestamp_epochs) < len(self.timestamps):
+                self.timestamp_epochs.extend(np.fromiter(
+                    (parse_timestamp(v) for v in self.timestamps.values[len(self.timestamp_epochs):]),
+                    dtype=np.int64
+                ))
+            self.agent.extend(agent)
+            self.status.extend(chunk.status)
+            self.bytes.extend(chunk.bytes)
+            if chunk.offset is not None:
+                self.offset.extend(chunk.offset)
+            else:
+                first = len(self.memory_lines)
+                self.offset.extend(-np.arange(first + 1, first + len(chunk) + 1, dtype=np.int64))
+                self.memory_lines.extend(chunk.lines)
+
+            self.status_counts = self._add_counts(self.status_counts, chunk.status, MAX_STATUS)
+            self.method_counts = self._add_counts(self.method_counts, method, len(self.methods))
+            self.total_bytes += int(chunk.bytes.sum())
+
+            epochs = self.timestamp_epochs.view()[timestamp]
+            errors = chunk.status >= ERROR_STATUS
+            self.time_index.add(first_row, epochs, errors)
+            if errors.any():
+                minutes = np.maximum(epochs, 0) // 60
+                for code in np.unique(chunk.status[errors]).tolist():
+                    rows = chunk.status == code
+                    self.heavy_hitters.add(code, minutes[rows], ip[rows])
+
+            self.index.add(first_row, {
+                "ip": (ip, self.ips.values),
+                "path": (path, self.paths.values),
+                "method": (method, self.methods.values),
+                "status": (chunk.status, None),
+                "agent": (agent, self.agents.values)
+            })
+            if len(chunk):
+                self.version = next(_versions)
+
+    def append_lines(self, lines: Iterable[str]) -> int:
+        """Parse and append raw lines; returns the number of rows added"""
+        chunk = parse_lines(lines)
+        self.append_chunk(chunk)
+        return len(chunk)
+
+    @property
+    def single_file(self) -> bool:
+        """Every row came from one source file, starting at its first byte"""
+        return self._segment_rows == [0] and self._segment_fds[0] is not None and not self.memory_lines
+
+    def _start_segment(self, fd: Optional[int]):
+        if self._segment_rows and self._segment_rows[-1] == len(self):
+            # The previous segment never received a row
+            self._close_fd(self._segment_fds.pop())
+            self._segment_rows.pop()
+        self._segment_rows.append(len(self))
+        self._segment_fds.append(fd)
+
+    def attach(self, path: str, offset: int = 0):
+        """Start a new segment backed by path; following rows are read from it, beginning at offset"""
+        fd = os.open(path, os.O_RDONLY)
+        stat = os.fstat(fd)
+        with self.lock:
+            self._start_segment(fd)
+            self.source_path = path
+            self.source_identity = (stat.st_dev, stat.st_ino)
+            self.source_offset = offset
+
+    def attach_archive(self, path: str):
+        """Start a new segment for rows decompressed from path, which are not read back from it"""
+        with self.lock:
+            self._start_segment(None)
+            self.source_path = path
+            self.source_identity = None
+            self.source_offset = 0
+
+    def mark_truncated(self):
+        """The current source lost its contents; raw lines of its rows are no longer readable"""
+        with self.lock:
+            if self._segment_fds:
+                self._close_fd(self._segment_fds[-1])
+                self._segment_fds[-1] = None
+                self.version = next(_versions)
+
+    def load_file(self, path: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  include_partial: bool = True, workers: int = 1) -> int:
+        """
+        Stream new lines of a log file into the store block by block.
+
+        Reading resumes at source_offset of the current segment, so calling
+        this again only parses lines appended since. Passing a different
+        path starts a new segment. With workers > 1, blocks are parsed in a
+        process pool and appended in file order, which gives exactly the
+        same store as a serial parse. Returns the number of rows added.
+        """
+        if path is not None and path != self.source_path:
+            self.attach(path)
+        fd = self._segment_fds[-1] if self._segment_fds else None
+        if fd is None:
+            return 0
+
+        size = os.fstat(fd).st_size
+        if workers > 1 and size - self.source_offset > 2 * chunk_size:
+            return self._load_parallel(fd, size, chunk_size, include_partial, workers)
+
+        added = 0
+        for offset, data in iter_file_chunks(fd, self.source_offset, chunk_size, include_partial):
+            chunk = parse_buffer(data, offset)
+            with self.lock:
+                self.append_chunk(chunk)
+                self.source_offset = offset + len(data)
+            added += len(chunk)
+        return added
+
+    def _load_parallel(self, fd: int, size: int, chunk_size: int, include_partial: bool, workers: int) -> int:
+        with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as mm:
+            bounds = list(chunk_bounds(mm, self.source_offset, size, chunk_size, include_partial))
+
+        added = 0
+        pending = deque()
+        ranges = iter(bounds)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # A bounded number of blocks in flight keeps memory flat when appending lags parsing
+            for start, end in islice(ranges, 2 * workers):
+                pending.append((end, pool.submit(parse_file_range, self.source_path, self.source_identity, start, end)))
+            while pending:
+                end, future = pending.popleft()
+                chunk = future.result()
+                with self.lock:
+                    self.append_chunk(chunk)
+                    self.source_offset = end
+                added += len(chunk)
+                following = next(ranges, None)
+                if following is not None:
+                    pending.append((following[1], pool.submit(
+                        parse_file_range, self.source_path, self.source_identity, *following
+                    )))
+        return added
+
+    def raw(self, index: int) -> str:
+        """Raw text of one row"""
+        offset = int(self.offset.view()[index])
+        if offset < 0:
+            return self.memory_lines[-offset - 1]
+
+        fd = self._segment_fds[bisect.bisect_right(self._segment_rows, index) - 1]
+        if fd is None:
+            return self._rebuilt(index)
+        data = b""
+        length = 512
+        while True:
+            data = os.pread(fd, length, offset)
+            newline = data.find(b"\n")
+            if newline >= 0:
+                data = data[:newline]
+                break
+            if len(data) < length:
+                break
+            length *= 4
+        return data.decode("utf-8", errors="replace")
+
+    def _rebuilt(self, index: int) -> str:
+        """Combined-format line from the parsed columns (the referer is not kept)"""
+        agent = self.agents.values[self.agent.view()[index]]
+        return (
+            f'{self.ips.values[self.ip.view()[index]]} - - [{self.timestamps.values[self.timestamp.view()[index]]}] '
+            f'"{self.methods.values[self.method.view()[index]]} {self.paths.values[self.path.view()[index]]} '
+            f'{self.protocols.values[self.protocol.view()[index]]}" {self.status.view()[index]} '
+            f'{self.bytes.view()[index]}' + (f' "-" "{agent}"' if agent else "")
+        )
+
+    @staticmethod
+    def _close_fd(fd: Optional[int]):
+        if fd is not None:
+            os.close(fd)
+
+    def close(self):
+        """Release the backing files"""
+        with self.lock:
+            for fd in self._segment_fds:
+                self._close_fd(fd)
+            self._segment_fds = [None] * len(self._segment_fds)
+
+    def row(self, index: int) -> Dict:
+        """Reconstruct one parsed row as a dict of its fields and raw line"""
+        with self.lock:
+            return {
+                "ip": self.ips.values[self.ip.view()[index]],
+                "timestamp": self.timestamps.values[self.timestamp.view()[index]],
+                "method": self.methods.values[self.method.view()[index]],
+                "path": self.paths.values[self.path.view()[index]],
+                "protocol": self.protocols.values[self.protocol.view()[index]],
+                "status_code": int(self.status.view()[index]),
+                "bytes": int(self.bytes.view()[index]),
+                "user_agent": self.agents.values[self.agent.view()[index]],
+                "raw": self.raw(index)
+            }
+
+    def _window(self, minutes: Optional[int], start: Optional[int], end: Optional[int]) -> Tuple[Optional[int], Optional[int]]:
+        """Resolve `last N minutes` (anchored at the newest log minute) into a start epoch"""
+        if minutes is not None and start is None:
+            latest = self.time_index.latest()
+            if latest is not None:
+                start = (latest // 60 - minutes + 1) * 60
+        return start, end
+
+    def top_ips(self, status_code: int, top_n: int = 10, minutes: Optional[int] = None,
+                start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        """
+        Most frequent IPs among rows with the given status code.
+
+        Error statuses are answered from the heavy-hitter sketches, optionally
+        over the last `minutes` minutes of the log; `error` bounds how much a
+        count may be overestimated. Other statuses, and explicit start/end
+        epoch ranges, are counted exactly.
+        """
+        if top_n <= 0:
+            return []
+
+        with self.lock:
+            if status_code >= ERROR_STATUS and start is None and end is None:
+                return [
+                    {"ip": self.ips.values[code], "count": count, "error": error}
+                    for code, count, error in self.heavy_hitters.top(status_code, top_n, minutes)
+                ]
+            return self.exact_top_ips(status_code, top_n, minutes, start, end)
+
+    def exact_top_ips(self, status_code: int, top_n: int = 10, minutes: Optional[int] = None,
+                      start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        """Exact top IPs by scanning the status column, or only the rows of a time range"""
+        with self.lock:
+            start, end = self._window(minutes, start, end)
+            if start is None and end is None:
+                ip = self.ip.view()[self.status.view() == status_code]
+            else:
+                rows = self.time_index.rows_between(start, end)
+                ip = self.ip.view()[rows][self.status.view()[rows] == status_code]
+            codes, counts = np.unique(ip, return_counts=True)
+            # Highest count first, ties broken by first appearance in the log
+            order = np.lexsort((codes, -counts))[:top_n]
+            return [
+                {"ip": self.ips.values[codes[i]], "count": int(counts[i]), "error": 0}
+                for i in order
+            ]
+
+    def _rarest_posting(self, value: str) -> Optional[PostingList]:
+        """Shortest posting list among a value's tokens (it holds every row with the value), None without tokens"""
+        tokens = tokenize(value)
+        if not tokens:
+            return None
+        return min((self.index.postings.get(token) or PostingList() for token in tokens),
+                   key=lambda posting: posting.count)
+
+    def _candidate_rows(self, codes: Optional[List[int]], ip: Optional[str], start: Optional[int],
+                        end: Optional[int], path_codes: Optional[List[int]] = None,
+                        method: Optional[str] = None) -> Optional[np.ndarray]:
+        """
+        Rows that may match, from the most selective index available: the
+        posting lists of the IP, status codes, method or matching paths, or
+        the time index. None means every row.
+        """
+        options = []
+        empty = np.zeros(0, dtype=np.int64)
+        if ip is not None:
+            ip_posting = self.index.postings.get(ip)
+            options.append((ip_posting.count if ip_posting else 0, lambda: ip_posting.rows_between(0, len(self))
+                            if ip_posting else empty))
+        if method is not None:
+            method_posting = self._rarest_posting(method) if method in self.methods.codes else PostingList()
+            if method_posting is not None:
+                options.append((method_posting.count, lambda: method_posting.rows_between(0, len(self))))
+        if path_codes is not None:
+            # Rows of each matching path are within the posting list of its rarest token
+            postings = {}
+            for code in path_codes:
+                posting = self._rarest_posting(self.paths.values[code])
+                if posting is None:
+                    # A path without tokens ("/") cannot be narrowed by the index
+                    postings = None
+                    break
+                postings[id(posting)] = posting
+            if postings is not None:
+                path_postings = list(postings.values())
+                options.append((sum(p.count for p in path_postings), lambda: np.unique(np.concatenate(
+                    [p.rows_between(0, len(self)) for p in path_postings])) if path_postings else empty))
+        if codes is not None:
+            code_postings = [self.index.postings[str(code)] for code in codes if str(code) in self.index.postings]
+            options.append((sum(p.count for p in code_postings), lambda: np.sort(np.concatenate(
+                [p.rows_between(0, len(self)) for p in code_postings])) if code_postings else empty))
+        if start is not None or end is not None:
+            options.append((self.time_index.count(start, end), lambda: self.time_index.rows_between(start, end)))
+        if not options:
+            return None
+        return min(options, key=lambda option: option[0])[1]()
+
+    def _aggregate_totals(self, codes: Optional[List[int]], group_by: Optional[str], top_n: int) -> Optional[Dict]:
+        """Whole-log aggregates answered from the running totals and sketches, or None"""
+        status_counts = {code: int(self.status_counts[code]) for code in np.flatnonzero(self.status_counts).tolist()
+                         if codes is None or code in codes}
+        result = {"matched": len(self) if codes is None else sum(status_counts.values()), "total": len(self), "groups": []}
+        if group_by is None:
+            return result
+        if group_by == "status":
+            ranked = sorted(status_counts.items(), key=lambda item: (-item[1], item[0]))[:top_n]
+            result["groups"] = [{"key": code, "count": count} for code, count in ranked]
+            return result
+        if group_by == "method" and codes is None:
+            ranked = sorted(enumerate(self.method_counts.tolist()), key=lambda item: (-item[1], item[0]))
+            result["groups"] = [{"key": self.methods.values[m], "count": n} for m, n in ranked[:top_n] if n]
+            return result
+        if group_by == "ip" and codes is not None and len(codes) == 1 and codes[0] >= ERROR_STATUS:
+            result["groups"] = [
+                {"key": self.ips.values[code], "count": count, "error": error}
+                for code, count, error in self.heavy_hitters.top(codes[0], top_n)
+            ]
+            return result
+        return None
+
+    def aggregate(self, codes: Optional[List[int]] = None, statuses: Optional[Tuple[int, int]] = None,
+                  minutes: Optional[int] = None, start: Optional[int] = None, end: Optional[int] = None,
+                  ip: Optional[str] = None, path: Optional[str] = None, method: Optional[str] = None,
+                  group_by: Optional[str] = None, top_n: int = 10) -> Dict:
+        """
+        Count rows matching the filters, optionally grouped by ip, path,
+        method, agent, status or minute.
+
+        codes are exact status codes and statuses an inclusive code range;
+        path matches as a prefix. Candidate rows come from the inverted or
+        time index and only they are filtered, so the cost follows the size
+        of the most selective filter rather than of the log.
+        """
+        with self.lock:
+            start, end = self._window(minutes, start, end)
+            if codes is None and statuses is not None:
+                present = np.flatnonzero(self.status_counts)
+                codes = present[(present >= statuses[0]) & (present <= statuses[1])].tolist()
+            # Requests in scope (every filter but the status), the denominator of rates
+            if ip is not None or path is not None or method is not None:
+                total = self.aggregate(start=start, end=end, ip=ip, path=path, method=method)["matched"] \
+                    if codes is not None else None
+            elif start is None and end is None:
+                total = len(self)
+            else:
+                total = self.time_index.count(start, end)
+
+            if ip is None and path is None and method is None and start is None and end is None:
+                answered = self._aggregate_totals(codes, group_by, top_n)
+                if answered is not None:
+                    return answered
+
+            # Prefix match over the (small) path dictionary
+            matching = [code for code, value in enumerate(self.paths.values) if value.startswith(path)] \
+                if path is not None else None
+            rows = self._candidate_rows(codes, ip, start, end, matching, method)
+            if rows is None:
+                rows = np.arange(len(self))
+            keep = np.ones(len(rows), dtype=bool)
+            if codes is not None:
+                keep &= np.isin(self.status.view()[rows], codes)
+            if start is not None or end is not None:
+                epochs = self.timestamp_epochs.view()[self.timestamp.view()[rows]]
+                if start is not None:
+                    keep &= epochs >= start
+                if end is not None:
+                    keep &= epochs < end
+            if ip is not None:
+                keep &= self.ip.view()[rows] == self.ips.codes.get(ip, -1)
+            if method is not None:
+                keep &= self.method.view()[rows] == self.methods.codes.get(method, -1)
+            if path is not None:
+                keep &= np.isin(self.path.view()[rows], matching)
+            rows = rows[keep]
+
+            result = {"matched": len(rows), "total": len(rows) if total is None else total, "groups": []}
+            if group_by is None or not len(rows):
+                return result
+
+            if group_by == "minute":
+                minutes_of_rows = self.timestamp_epochs.view()[self.timestamp.view()[rows]] // 60
+                keys, counts = np.unique(minutes_of_rows[minutes_of_rows >= 0], return_counts=True)
+                # Chronological, most recent top_n minutes
+                keys, counts = keys[-top_n:], counts[-top_n:]
+                result["groups"] = [{"key": int(k) * 60, "count": int(c)} for k, c in zip(keys.tolist(), counts.tolist())]
+                return result
+
+            columns = {"ip": (self.ip, self.ips), "path": (self.path, self.paths),
+                       "method": (self.method, self.methods), "agent": (self.agent, self.agents),
+                       "status": (self.status, None)}
+            column, dictionary = columns[group_by]
+            counts = np.bincount(column.view()[rows])
+            keys = np.flatnonzero(counts)
+            # Highest count first, ties broken by first appearance (smaller code)
+            order = np.lexsort((keys, -counts[keys]))[:top_n]
+            result["groups"] = [
+                {"key": dictionary.values[keys[i]] if dictionary else int(keys[i]), "count": int(counts[keys[i]])}
+                for i in order
+            ]
+            return result
+
+    def search(self, query: str, limit: int = 50, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        """Full-text search over the index, optionally within an epoch range; rows carry their relevance score"""
+        with self.lock:
+            low, high, keep = 0, None, None
+            if start is not None or end is not None:
+                rows = self.time_index.rows_between(start, end)
+                if not len(rows):
+                    return []
+                low, high = int(rows.min()), int(rows.max()) + 1
+                epochs = self.timestamp_epochs.view()
+                timestamp = self.timestamp.view()
+                low_epoch = start if start is not None else np.iinfo(np.int64).min
+                high_epoch = end if end is not None else np.iinfo(np.int64).max
+
+                def keep(candidates: np.ndarray) -> np.ndarray:
+                    # Rows inside the row span may still be outside the time range when lines are out of order
+                    values = epochs[timestamp[candidates]]
+                    return (values >= low_epoch) & (values < high_epoch)
+
+            results = []
+            for index, score in self.index.search(query, limit, low, high, keep):
+                row = self.row(index)
+                row["score"] = round(score, 3)
+                results.append(row)
+            return results
+
+    def statistics(self, start: Optional[int] = None, end: Optional[int] = None) -> Dict:
+        """Request, byte, status code and method totals, overall or for an epoch range"""
+        with self.lock:
+            if start is None and end is None:
+                total = len(self)
+                total_bytes = self.total_bytes
+                status_codes = {int(c): int(self.status_counts[c]) for c in np.flatnonzero(self.status_counts)}
+                methods = {self.methods.values[m]: int(n) for m, n in enumerate(self.method_counts) if n}
+            else:
+                # Cost is proportional to the rows in the range
+                rows = self.time_index.rows_between(start, end)
+                total = len(rows)
+                total_bytes = int(self.bytes.view()[rows].sum())
+                codes, counts = np.unique(self.status.view()[rows], return_counts=True)
+                status_codes = dict(zip(codes.tolist(), counts.tolist()))
+                codes, counts = np.unique(self.method.view()[rows], return_counts=True)
+                methods = {self.methods.values[m]: n for m, n in zip(codes.tolist(), counts.tolist())}
+            errors = sum(count for code, count in status_codes.items() if code >= ERROR_STATUS)
+
+            return {
+                "total_requests": total,
+                "total_bytes": total_bytes,
+                "status_codes": status_codes,
+                "methods": methods,
+                "error_rate": errors / total if total > 0 else 0
+            }
+
+    def error_histogram(self, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        """Per-minute requests, errors and error rate; defaults to the last hour of the log"""
+        with self.lock:
+            if start is None and end is None:
+                start, end = self._window(60, None, None)
+            return self.time_index.histogram(start, end)
@@ -0,0 +1,206 @@
+"""
+Time index over log rows: epoch-sorted row order and per-minute counters
+"""
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Overlapping tail re-merged in place at most (or the appended block's size, if larger)
+MAX_TAIL_MERGE = 1 << 16
+# Out-of-order runs are compacted into the main order once there are this many,
+# or once they hold more than 1/RUNS_FRACTION of the rows
+MAX_RUNS = 8
+RUNS_FRACTION = 8
+
+
+class TimeIndex:
+    """
+    Rows ordered by timestamp, for range queries resolved by binary search.
+
+    `epochs` holds every row's epoch second in ascending order and `rows`
+    the matching row ids. Access logs are nearly time ordered, so an
+    appended block usually sorts after everything indexed; when lines
+    arrive slightly out of order only the overlapping tail is re-merged.
+    A block that would overlap more than MAX_TAIL_MERGE rows (an older
+    archive, a replayed file) is kept as a separate sorted run instead;
+    queries merge the runs' matches, and runs are folded into the main
+    order only once they hold a fixed fraction of the rows, so every row is
+    re-sorted O(log N) times at most. Rows without a valid timestamp
+    (epoch -1) are left out of the order.
+
+    Per-minute request and error counters form the time-bucket index used
+    by the error-rate histogram, so a histogram over a window costs one
+    slice per minute of the window.
+    """
+
+    def __init__(self):
+        self.epochs = np.zeros(0, dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.int32)
+        self._size = 0
+        # Sorted (epochs, rows) blocks that arrived out of order
+        self._runs: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.base_minute: Optional[int] = None
+        self.minute_requests = np.zeros(0, dtype=np.int64)
+        self.minute_errors = np.zeros(0, dtype=np.int64)
+        self.minute_count = 0
+
+    def __len__(self):
+        return self._size + sum(len(epochs) for epochs, _ in self._runs)
+
+    @classmethod
+    def restore(cls, epochs: np.ndarray, rows: np.ndarray, base_minute: Optional[int],
+                minute_requests: np.ndarray, minute_errors: np.ndarray) -> "TimeIndex":
+        """Rebuild from saved arrays; they are adopted as-is and copied on the next append"""
+        index = cls()
+        # Older snapshots kept untimed rows, which sort first
+        valid = int(np.searchsorted(epochs, 0, side="left"))
+        epochs, rows = epochs[valid:], rows[valid:]
+        index.epochs, index.rows, index._size = epochs, rows, len(epochs)
+        index.base_minute = base_minute
+        index.minute_requests, index.minute_errors = minute_requests, minute_errors
+        index.minute_count = len(minute_requests)
+        return index
+
+    def _reserve(self, needed: int):
+        if needed > len(self.epochs):
+            capacity = max(needed, 2 * len(self.epochs), 1024)
+            self.epochs = np.concatenate([self.epochs[:self._size], np.zeros(capacity - self._size, dtype=np.int64)])
+            self.rows = np.concatenate([self.rows[:self._size], np.zeros(capacity - self._size, dtype=np.int32)])
+
+    def add(self, first_row: int, epochs: np.ndarray, errors: np.ndarray):
+        """Index appended rows given their epoch seconds and an is-error mask"""
+        if not len(epochs):
+            return
+        self._count_minutes(epochs // 60, errors)
+
+        valid = np.flatnonzero(epochs >= 0)
+        if not len(valid):
+            return
+        order = valid[np.argsort(epochs[valid], kind="stable")]
+        new_epochs = epochs[order]
+        new_rows = (order + first_row).astype(np.int32)
+
+        # Rows at or after `position` are re-merged with the new block
+        position = int(np.searchsorted(self.epochs[:self._size], new_epochs[0], side="right"))
+        if self._size - position > max(MAX_TAIL_MERGE, len(new_epochs)):
+            if self._runs and self._runs[-1][0][-1] <= new_epochs[0]:
+                # An older file read block by block continues its run
+                run_epochs, run_rows = self._runs[-1]
+                self._runs[-1] = (np.concatenate([run_epochs, new_epochs]), np.concatenate([run_rows, new_rows]))
+            else:
+                self._runs.append((new_epochs, new_rows))
+            if len(self._runs) > MAX_RUNS or len(self) - self._size > self._size // RUNS_FRACTION:
+                self.compact()
+            return
+        if position < self._size:
+            tail_epochs = np.concatenate([self.epochs[position:self._size], new_epochs])
+            tail_rows = np.concatenate([self.rows[position:self._size], new_rows])
+            merge = np.argsort(tail_epochs, kind="stable")
+            new_epochs, new_rows = tail_epochs[merge], tail_rows[merge]
+
+        end = position + len(new_epochs)
+        self._reserve(end)
+        self.epochs[position:end] = new_epochs
+        self.rows[position:end] = new_rows
+        self._size = end
+
+    def compact(self):
+        """Fold the out-of-order runs into the main order"""
+        if not self._runs:
+            return
+        epochs = np.concatenate([self.epochs[:self._size]] + [epochs for epochs, _ in self._runs])
+        rows = np.concatenate([self.rows[:self._size]] + [rows for _, rows in self._runs])
+        merge = np.argsort(epochs, kind="stable")
+        self.epochs, self.rows, self._size = epochs[merge], rows[merge], len(epochs)
+        self._runs = []
+
+    def _count_minutes(self, minutes: np.ndarray, errors: np.ndarray):
+        # Rows with unparseable timestamps (epoch -1) are not bucketed
+        valid = minutes >= 0
+        minutes, errors = minutes[valid], errors[valid]
+        if not len(minutes):
+            return
+        low, high = int(minutes.min()), int(minutes.max())
+        if not self.minute_requests.flags.writeable:
+            # Restored from a memory-mapped snapshot
+            self.minute_requests, self.minute_errors = self.minute_requests.copy(), self.minute_errors.copy()
+        if self.base_minute is None:
+            self.base_minute = low
+        if low < self.base_minute:
+            shift = self.base_minute - low
+            self.minute_requests = np.concatenate([np.zeros(shift, dtype=np.int64), self.minute_requests])
+            self.minute_errors = np.concatenate([np.zeros(shift, dtype=np.int64), self.minute_errors])
+            self.base_minute = low
+            self.minute_count += shift
+        span = high - self.base_minute + 1
+        if span > len(self.minute_requests):
+            grow = max(span, 2 * len(self.minute_requests)) - len(self.minute_requests)
+            self.minute_requests = np.concatenate([self.minute_requests, np.zeros(grow, dtype=np.int64)])
+            self.minute_errors = np.concatenate([self.minute_errors, np.zeros(grow, dtype=np.int64)])
+        self.minute_count = max(self.minute_count, span)
+
+        # Only the minutes this block touches are updated
+        first = low - self.base_minute
+        offsets = minutes - low
+        requests = np.bincount(offsets)
+        self.minute_requests[first:first + len(requests)] += requests
+        self.minute_errors[first:first + len(requests)] += np.bincount(offsets[errors], minlength=len(requests))
+
+    @staticmethod
+    def _bounds(epochs: np.ndarray, start: Optional[int], end: Optional[int]) -> Tuple[int, int]:
+        low = int(np.searchsorted(epochs, start, side="left")) if start is not None else 0
+        high = int(np.searchsorted(epochs, end, side="left")) if end is not None else len(epochs)
+        return low, max(low, high)
+
+    def count(self, start: Optional[int] = None, end: Optional[int] = None) -> int:
+        """Number of rows with start <= epoch < end"""
+        total = 0
+        for epochs, _ in [(self.epochs[:self._size], None)] + self._runs:
+            low, high = self._bounds(epochs, start, end)
+            total += high - low
+        return total
+
+    def rows_between(self, start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        """Row ids with start <= epoch < end, in time order"""
+        low, high = self._bounds(self.epochs[:self._size], start, end)
+        if not self._runs:
+            return self.rows[low:high]
+        epochs, rows = [self.epochs[low:high]], [self.rows[low:high]]
+        for run_epochs, run_rows in self._runs:
+            low, high = self._bounds(run_epochs, start, end)
+            epochs.append(run_epochs[low:high])
+            rows.append(run_rows[low:high])
+        merged = np.concatenate(rows)
+        return merged[np.argsort(np.concatenate(epochs), kind="stable")]
+
+    def sorted_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Epochs and row ids of every timed row in one order (compacts the runs)"""
+        self.compact()
+        return self.epochs[:self._size], self.rows[:self._size]
+
+    def latest(self) -> Optional[int]:
+        ends = [int(epochs[-1]) for epochs, _ in self._runs]
+        if self._size:
+            ends.append(int(self.epochs[self._size - 1]))
+        return max(ends) if ends else None
+
+    def histogram(self, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        """Per-minute request and error counts for minutes overlapping [start, end)"""
+        if self.base_minute is None:
+            return []
+        first = 0 if start is None else max(0, start // 60 - self.base_minute)
+        last = self.minute_count if end is None else min(self.minute_count, -(-end // 60) - self.base_minute)
+        buckets = []
+        for offset in range(first, max(first, last)):
+            requests = int(self.minute_requests[offset])
+            errors = int(self.minute_errors[offset])
+            buckets.append({
+                "minute": (self.base_minute + offset) * 60,
+                "requests": requests,
+                "errors": errors,
+                "error_rate": errors / requests if requests else 0
+            })
+        return buckets
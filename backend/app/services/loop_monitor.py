@@ -0,0 +1,158 @@
+"""
+Event-loop lag monitoring and detection of callbacks that block the loop
+"""
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+import logging
+
+import numpy as np
+
+from app.config import settings
+from app.services.metrics import LAG_BUCKETS, Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Innermost frames kept per captured stack
+STACK_DEPTH = 30
+
+LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds", "Delay between when a loop tick was due and when it ran",
+    buckets=(0.001, 0.0025, 0.005) + LAG_BUCKETS
+)
+LOOP_BLOCKED = Counter("event_loop_blocked_total", "Callbacks that held the event loop longer than the threshold")
+
+
+class LoopMonitor:
+    """
+    Measures event-loop scheduling lag and captures the stacks of blocking callbacks.
+
+    A task on the loop sleeps `interval` seconds at a time; how late each
+    wake-up is, is the lag every other coroutine sees at that moment.
+    A watchdog thread checks the task's heartbeat: when the loop has not
+    come back for longer than `threshold`, the callback running right
+    now is the culprit, so the loop thread's stack is captured while it is
+    still blocking (once per stall), logged and kept for stats().
+    """
+
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1, window: int = 1200, max_blocks: int = 20):
+        self.interval = interval
+        self.threshold = threshold
+        self._lags: Deque[float] = deque(maxlen=window)
+        self._blocks: Deque[Dict] = deque(maxlen=max_blocks)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._loop_thread: Optional[int] = None
+        self._heartbeat = 0.0
+        self._open_block: Optional[Dict] = None
+        self.samples = 0
+        self.blocked = 0
+        self.max_lag = 0.0
+
+    async def _tick(self):
+        self._loop_thread = threading.get_ident()
+        while not self._stop.is_set():
+            beat = time.perf_counter()
+            self._heartbeat = beat
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - beat - self.interval, 0.0)
+            LOOP_LAG_SECONDS.observe(lag)
+            with self._lock:
+                self._lags.append(lag)
+                self.samples += 1
+                self.max_lag = max(self.max_lag, lag)
+                block = self._open_block
+                if block is not None and block["heartbeat"] == beat:
+                    # The stall is over: record how long the loop was held in total
+                    block["blocked_ms"] = round(lag * 1000, 1)
+                    self._open_block = None
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._heartbeat
+            stalled = time.perf_counter() - beat - self.interval
+            if stalled < self.threshold or beat == reported or self._loop_thread is None:
+                continue
+            reported = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.format_list(traceback.extract_stack(frame)[-STACK_DEPTH:])
+            del frame
+            block = {
+                "heartbeat": beat,
+                "detected_at": datetime.now(timezone.utc).isoformat(),
+                "blocked_ms": round(stalled * 1000, 1),
+                "stack": [line.rstrip() for line in stack]
+            }
+            with self._lock:
+                self._blocks.append(block)
+                self._open_block = block
+                self.blocked += 1
+            LOOP_BLOCKED.inc()
+            logger.warning(f"Event loop blocked for over {stalled * 1000:.0f} ms in:\n{''.join(stack[-5:])}")
+
+    def start(self):
+        """Start monitoring the running event loop (call from a coroutine)"""
+        if self.interval <= 0 or (self._task and not self._task.done()):
+            return
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Monitoring event loop lag every {self.interval * 1000:.0f} ms, "
+                    f"capturing callbacks blocking over {self.threshold * 1000:.0f} ms")
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+        if self._watchdog:
+            self._watchdog.join(timeout=5)
+
+    def reset(self):
+        """Forget recorded lags and blocks (e.g. between test cases)"""
+        with self._lock:
+            self._lags.clear()
+            self._blocks.clear()
+            self._open_block = None
+            self.samples = 0
+            self.blocked = 0
+            self.max_lag = 0.0
+
+    def blocks(self) -> List[Dict]:
+        """Recently captured blocking callbacks, newest first"""
+        with self._lock:
+            return [{k: v for k, v in block.items() if k != "heartbeat"} for block in reversed(self._blocks)]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lags = np.asarray(self._lags, dtype=np.float64) * 1000
+            result = {
+                "running": bool(self._task and not self._task.done()),
+                "interval_ms": self.interval * 1000,
+                "threshold_ms": self.threshold * 1000,
+                "samples": self.samples,
+                "blocked": self.blocked,
+                "max_lag_ms": round(self.max_lag * 1000, 3)
+            }
+        result["lag_ms"] = {
+            name: round(float(np.percentile(lags, q)), 3) if len(lags) else 0
+            for name, q in (("p50", 50), ("p95", 95), ("p99", 99))
+        }
+        return result
+
+
+# Singleton instance
+loop_monitor = LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL_MS / 1000,
+    threshold=settings.LOOP_BLOCK_THRESHOLD_MS / 1000
+)
@@ -0,0 +1,357 @@
+"""
+In-process counters, gauges and histograms with Prometheus text exposition
+"""
+import json
+import time
+import bisect
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REDIS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Redis key prefix of metric snapshots pushed by other processes (consumers)
+PUSH_PREFIX = "metrics:"
+
+
+class _Shards:
+    """
+    Per-thread value lists, summed when read.
+
+    Each thread only ever writes its own list, so recording takes no lock
+    and no increment is lost; the lock is taken once per thread, on its
+    first observation, and when metrics are collected.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._local = threading.local()
+        self._all: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def mine(self) -> List[float]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = [0] * self.size
+            with self._lock:
+                self._all.append(values)
+            self._local.values = values
+            return values
+
+    def total(self) -> List[float]:
+        with self._lock:
+            shards = list(self._all)
+        return [sum(values[i] for values in shards) for i in range(self.size)]
+
+
+class CounterChild:
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, amount: float = 1):
+        self._shards.mine()[0] += amount
+
+    def value(self) -> float:
+        return self._shards.total()[0]
+
+
+class GaugeChild:
+    def __init__(self):
+        self._shards = _Shards(1)
+        self._base = 0.0
+
+    def inc(self, amount: float = 1):
+        self._shards.mine()[0] += amount
+
+    def dec(self, amount: float = 1):
+        self._shards.mine()[0] -= amount
+
+    def set(self, value: float):
+        self._base = value - self._shards.total()[0]
+
+    def value(self) -> float:
+        return self._base + self._shards.total()[0]
+
+
+class HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        # One count per bucket, one for +Inf, then the sum
+        self._shards = _Shards(len(self.buckets) + 2)
+
+    def observe(self, value: float):
+        values = self._shards.mine()
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def value(self) -> Tuple[List[float], float]:
+        """Cumulative bucket counts (the last one is +Inf) and the sum"""
+        totals = self._shards.total()
+        cumulative, running = [], 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-1]
+
+
+class Metric:
+    """A metric family; children are created per combination of label values"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional["Registry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        """Child for the given label values (created on first use)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(v) for v in values), self._new_child())
+                self._children[values] = child
+        return child
+
+    def _samples(self, labels: Dict[str, str], child) -> List[Tuple[str, Dict[str, str], float]]:
+        return [(self.name, labels, child.value())]
+
+    def collect(self) -> Dict:
+        """Family as a JSON-serializable dict of samples"""
+        samples, seen = [], set()
+        for values, child in list(self._children.items()):
+            if id(child) in seen:
+                continue
+            seen.add(id(child))
+            labels = dict(zip(self.labelnames, (str(v) for v in values)))
+            samples.extend(self._samples(labels, child))
+        return {"name": self.name, "type": self.kind, "help": self.documentation, "samples": samples}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return GaugeChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Optional["Registry"] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self, labels: Dict[str, str], child) -> List[Tuple[str, Dict[str, str], float]]:
+        cumulative, total = child.value()
+        samples = [(f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, count)
+                   for bound, count in zip(self.buckets + (float("inf"),), cumulative)]
+        samples.append((f"{self.name}_count", labels, cumulative[-1]))
+        samples.append((f"{self.name}_sum", labels, total))
+        return samples
+
+
+class Registry:
+    """The metric families of one process"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def collect(self) -> List[Dict]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [metric.collect() for metric in metrics]
+
+
+REGISTRY = Registry()
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(families: Iterable[Dict]) -> str:
+    """
+    Prometheus text exposition of metric families.
+
+    Families with the same name (from several processes) are merged under
+    one HELP/TYPE header.
+    """
+    merged: Dict[str, Dict] = {}
+    for family in families:
+        target = merged.setdefault(family["name"], {**family, "samples": []})
+        target["samples"].extend(family["samples"])
+
+    lines = []
+    for name, family in merged.items():
+        lines.append(f"# HELP {name} {_escape(family['help'])}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for sample, labels, value in family["samples"]:
+            label_text = ",".join(f'{key}="{_escape(str(v))}"' for key, v in labels.items())
+            lines.append(f"{sample}{{{label_text}}} {_format_value(value)}" if label_text
+                         else f"{sample} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def push_metrics(client, region: str, source: str, ttl: int = 60) -> bool:
+    """Store this process's metrics in Redis for the API to expose, labelled with source"""
+    try:
+        families = REGISTRY.collect()
+        for family in families:
+            family["samples"] = [(sample, {**labels, "source": source}, value)
+                                 for sample, labels, value in family["samples"]]
+        client.set(f"{PUSH_PREFIX}{region}:{source}", json.dumps(families), ex=ttl)
+        return True
+    except Exception as e:
+        logger.error(f"Error pushing metrics: {e}")
+        return False
+
+
+def start_push(client, region: str, source: str, interval: float = 10) -> threading.Thread:
+    """Push metrics every interval seconds from a daemon thread"""
+    def run():
+        while True:
+            push_metrics(client, region, source, ttl=max(int(interval * 3), 1))
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="metrics-push", daemon=True)
+    thread.start()
+    return thread
+
+
+def pushed_families(client, region: str) -> List[Dict]:
+    """Metric families pushed by other processes of the region that are still fresh"""
+    families = []
+    try:
+        # SCAN does not hold Redis up like KEYS, and one MGET replaces a GET per key
+        keys = list(client.scan_iter(match=f"{PUSH_PREFIX}{region}:*", count=100))
+        for data in client.mget(keys) if keys else []:
+            if data:
+                families.extend(json.loads(data))
+    except Exception as e:
+        logger.error(f"Error reading pushed metrics: {e}")
+    return families
+
+
+def lag_seconds(timestamp: Optional[str]) -> Optional[float]:
+    """Seconds since an ISO 8601 message timestamp, or None when it is missing or invalid"""
+    if not timestamp:
+        return None
+    try:
+        sent = datetime.fromisoformat(timestamp)
+        if sent.tzinfo is None:
+            sent = sent.replace(tzinfo=timezone.utc)
+        return max((datetime.now(timezone.utc) - sent).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+# API request metrics
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ["method", "route"]
+)
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route template and status", ["method", "route", "status"])
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served")
+
+# Redis commands issued through RedisService
+REDIS_COMMAND_SECONDS = Histogram(
+    "redis_command_duration_seconds", "Redis command latency", ["command"], buckets=REDIS_BUCKETS
+)
+
+# Message consumers (pushed from the consumer processes)
+CONSUMER_MESSAGES = Counter("consumer_messages_total", "Messages ingested by consumer", ["consumer"])
+CONSUMER_ERRORS = Counter("consumer_errors_total", "Messages that failed processing", ["consumer"])
+CONSUMER_LAG_SECONDS = Histogram(
+    "consumer_lag_seconds", "Delay between a message's timestamp and its processing", ["consumer"],
+    buckets=LAG_BUCKETS
+)
+CONSUMER_QUEUE_DEPTH = Gauge("consumer_queue_depth", "Messages waiting in the consumer's queue", ["consumer"])
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency, status and in-flight count per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; unmatched paths share one label
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope["method"], route, status[0]).inc()
@@ -0,0 +1,143 @@
+"""
+Runs blocking handler work on a thread pool, with per-endpoint concurrency limits
+"""
+import time
+import asyncio
+import weakref
+import cProfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+import logging
+
+from app.config import settings
+from app.services.metrics import LATENCY_BUCKETS, Gauge, Histogram
+from app.services.profiler import worker_profiles
+
+logger = logging.getLogger(__name__)
+
+OFFLOAD_QUEUE_SECONDS = Histogram(
+    "offload_queue_seconds", "Time offloaded calls waited for a slot and a worker thread", ["group"],
+    buckets=(0.0001, 0.0005) + LATENCY_BUCKETS
+)
+OFFLOAD_RUN_SECONDS = Histogram("offload_run_seconds", "Time offloaded calls ran on a worker thread", ["group"])
+OFFLOAD_WAITING = Gauge("offload_waiting", "Offloaded calls waiting for a slot", ["group"])
+OFFLOAD_RUNNING = Gauge("offload_running", "Offloaded calls holding a slot", ["group"])
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """Per-group limits from "group=n,group=n" (malformed entries are skipped)"""
+    limits = {}
+    for entry in spec.split(","):
+        name, _, value = entry.partition("=")
+        try:
+            if name.strip():
+                limits[name.strip()] = max(int(value), 1)
+        except ValueError:
+            logger.error(f"Ignoring offload limit {entry.strip()!r}")
+    return limits
+
+
+class Offloader:
+    """
+    Moves CPU-bound handler work off the event loop.
+
+    Calls run on a shared thread pool so the loop keeps answering other
+    requests (/health included) while a heavy query runs. Each endpoint group
+    has its own limit: calls beyond it wait on the loop, without occupying a
+    thread, so one busy endpoint cannot take the whole pool. A slot is held
+    until the thread finishes, even when the client has gone away.
+    """
+
+    def __init__(self, threads: int = 8, limits: Optional[Dict[str, int]] = None, enabled: bool = True):
+        self.enabled = enabled
+        self.threads = max(threads, 1)
+        self.limits = dict(limits or {})
+        self._groups = set(self.limits)
+        self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="offload")
+        # Semaphores bind to the loop they are first used on
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = \
+            weakref.WeakKeyDictionary()
+
+    def _semaphore(self, loop: asyncio.AbstractEventLoop, group: str) -> asyncio.Semaphore:
+        semaphores = self._semaphores.setdefault(loop, {})
+        semaphore = semaphores.get(group)
+        if semaphore is None:
+            self._groups.add(group)
+            semaphore = semaphores[group] = asyncio.Semaphore(self.limits.get(group, self.threads))
+        return semaphore
+
+    async def run(self, group: str, func: Callable, *args, **kwargs):
+        """Run func(*args, **kwargs) on the pool once group has a free slot and return its result"""
+        if not self.enabled:
+            return func(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore(loop, group)
+        waiting = OFFLOAD_WAITING.labels(group)
+        running = OFFLOAD_RUNNING.labels(group)
+        queued = time.perf_counter()
+        waiting.inc()
+        try:
+            await semaphore.acquire()
+        finally:
+            waiting.dec()
+        running.inc()
+        started = []
+        # The request is being profiled (X-Profile: 1): profile the call on its worker too
+        profiles = worker_profiles.get()
+
+        def call():
+            started.append(time.perf_counter())
+            if profiles is None:
+                return func(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                profiles.append(profile)
+
+        def done(_):
+            finished = time.perf_counter()
+            OFFLOAD_QUEUE_SECONDS.labels(group).observe((started[0] if started else finished) - queued)
+            if started:
+                OFFLOAD_RUN_SECONDS.labels(group).observe(finished - started[0])
+            running.dec()
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                # The loop has been closed (shutdown)
+                pass
+
+        try:
+            future = self._pool.submit(call)
+        except Exception:
+            running.dec()
+            semaphore.release()
+            raise
+        future.add_done_callback(done)
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "threads": self.threads,
+            "groups": {
+                group: {
+                    "limit": self.limits.get(group, self.threads),
+                    "running": int(OFFLOAD_RUNNING.labels(group).value()),
+                    "waiting": int(OFFLOAD_WAITING.labels(group).value())
+                }
+                for group in sorted(self._groups)
+            }
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Singleton instance
+offloader = Offloader(
+    threads=settings.OFFLOAD_THREADS,
+    limits=parse_limits(settings.OFFLOAD_LIMITS),
+    enabled=settings.OFFLOAD_ENABLED
+)
@@ -0,0 +1,144 @@
+"""
+Perceptual image hashes and a BK-tree for near-duplicate lookup
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+PHASH_SAMPLE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(PHASH_SAMPLE)
+
+
+def _grayscale(image_path: str, size: Tuple[int, int]) -> np.ndarray:
+    with Image.open(image_path) as image:
+        # Decode at reduced resolution when the format supports it (JPEG)
+        image.draft("L", (size[0] * 4, size[1] * 4))
+        small = image.convert("L").resize(size, Image.LANCZOS)
+        return np.asarray(small, dtype=np.float32)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def dhash(image_path: str) -> int:
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 thumbnail"""
+    pixels = _grayscale(image_path, (HASH_SIZE + 1, HASH_SIZE))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(image_path: str) -> int:
+    """64-bit DCT hash: low-frequency coefficients of a 32x32 thumbnail compared with their median"""
+    pixels = _grayscale(image_path, (PHASH_SAMPLE, PHASH_SAMPLE))
+    coefficients = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only encodes average brightness
+    median = np.median(coefficients.ravel()[1:])
+    return _bits_to_int(coefficients > median)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes with Hamming distance.
+
+    Range queries only descend into children whose edge distance lies within
+    [d - radius, d + radius] of the query's distance to the node, so lookups
+    with a small radius visit a small fraction of the tree. Removal marks the
+    key as gone; the tree is rebuilt once tombstones outnumber live entries.
+    """
+
+    def __init__(self):
+        self._root: Optional[list] = None
+        self._hashes: Dict[str, int] = {}
+        self._nodes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def get(self, key: str) -> Optional[int]:
+        return self._hashes.get(key)
+
+    def add(self, key: str, value: int):
+        """Insert or replace the hash for key"""
+        with self._lock:
+            if self._hashes.get(key) == value:
+                return
+            self._hashes[key] = value
+            self._insert(key, value)
+            # A replaced hash leaves its old node behind, like a removal
+            if self._nodes > 2 * len(self._hashes) + 16:
+                self._rebuild()
+
+    def _insert(self, key: str, value: int):
+        node = [value, key, {}]
+        self._nodes += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def remove(self, key: str):
+        with self._lock:
+            if self._hashes.pop(key, None) is None:
+                return
+            if self._nodes > 2 * len(self._hashes) + 16:
+                self._rebuild()
+
+    def _rebuild(self):
+        self._root = None
+        self._nodes = 0
+        for key, value in self._hashes.items():
+            self._insert(key, value)
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, str]]:
+        """All live (distance, key) pairs within radius, closest first"""
+        matches = []
+        seen = set()
+        with self._lock:
+            stack = [self._root] if self._root is not None else []
+            while stack:
+                node = stack.pop()
+                node_value, node_key, children = node
+                distance = hamming(value, node_value)
+                # Skip stale nodes left behind by replacement or removal; a key hashed
+                # back to an earlier value has two live nodes until the next rebuild
+                if distance <= radius and self._hashes.get(node_key) == node_value and node_key not in seen:
+                    seen.add(node_key)
+                    matches.append((distance, node_key))
+                for edge in range(distance - radius, distance + radius + 1):
+                    child = children.get(edge)
+                    if child is not None:
+                        stack.append(child)
+        matches.sort()
+        return matches
@@ -0,0 +1,240 @@
+"""
+On-demand profiling: statistical stack sampling and per-request cProfile
+"""
+import io
+import os
+import sys
+import time
+import pstats
+import signal
+import cProfile
+import tempfile
+import threading
+import contextvars
+from collections import Counter, OrderedDict
+from itertools import count
+from typing import Dict, List, Optional, Sequence
+import logging
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Set while a request is profiled: profiles of its work run on other threads are added to the list
+worker_profiles: contextvars.ContextVar[Optional[List[cProfile.Profile]]] = contextvars.ContextVar(
+    "worker_profiles", default=None
+)
+
+
+class ProfilerBusyError(RuntimeError):
+    """A sampling profile is already running"""
+
+
+class SamplingProfiler:
+    """
+    Time-boxed statistical profiler of every thread of the running process.
+
+    A sampler thread reads all thread stacks (sys._current_frames) every
+    `interval` seconds and counts identical stacks. The result is in the
+    collapsed-stack format read by flamegraph.pl, speedscope and similar
+    tools: one `thread;outer;...;inner count` line per distinct stack.
+    Nothing is instrumented, so the process runs at full speed outside the
+    sampling itself; only one profile runs at a time.
+    """
+
+    def __init__(self, max_seconds: float = 60):
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._labels: Dict[object, str] = {}
+        self.profiles = 0
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            # Paths relative to the package or stdlib root are enough to tell frames apart
+            for marker in ("/app/", "/site-packages/", "/lib/python"):
+                position = filename.rfind(marker)
+                if position >= 0:
+                    filename = filename[position + 1:]
+                    break
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def _collapse(self, thread: str, frame) -> str:
+        frames = []
+        while frame is not None:
+            frames.append(self._label(frame.f_code))
+            frame = frame.f_back
+        frames.append(thread.replace(";", ":"))
+        return ";".join(reversed(frames))
+
+    def sample(self, seconds: float, interval: float = 0.005) -> Dict:
+        """Sample all other threads for `seconds` (capped at max_seconds); raises ProfilerBusyError if one is running"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already running")
+        try:
+            seconds = min(max(seconds, 0.0), self.max_seconds)
+            interval = max(interval, 0.001)
+            me = threading.get_ident()
+            stacks: Counter = Counter()
+            names: Dict[int, str] = {}
+            samples = 0
+            started = time.perf_counter()
+            deadline = started + seconds
+            while True:
+                frames = sys._current_frames()
+                if frames.keys() - names.keys():
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in frames.items():
+                    if ident != me:
+                        stacks[self._collapse(names.get(ident, str(ident)), frame)] += 1
+                samples += 1
+                del frames
+                if time.perf_counter() >= deadline:
+                    break
+                time.sleep(interval)
+            self.profiles += 1
+            return {
+                "seconds": round(time.perf_counter() - started, 3),
+                "interval_ms": interval * 1000,
+                "samples": samples,
+                "threads": len({stack.split(";", 1)[0] for stack in stacks}),
+                "collapsed": "".join(f"{stack} {hits}\n" for stack, hits in stacks.most_common())
+            }
+        finally:
+            self._lock.release()
+
+    def write(self, directory: str, source: str, seconds: float, interval: float = 0.005) -> str:
+        """Sample and write the collapsed stacks to a file; returns its path"""
+        profile = self.sample(seconds, interval)
+        path = os.path.join(directory, f"profile-{source}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.folded")
+        with open(path, "w") as f:
+            f.write(profile["collapsed"])
+        logger.info(f"Wrote {profile['samples']} samples over {profile['seconds']}s to {path}")
+        return path
+
+    def install_signal_handler(self, source: str, seconds: float = 30, signum: int = signal.SIGUSR1,
+                               directory: Optional[str] = None) -> bool:
+        """
+        Profile for `seconds` whenever the process receives signum (kill -USR1 <pid>).
+
+        The handler only starts a thread, so the interrupted code resumes
+        immediately; the profile is written to directory (default: the temp dir).
+        """
+        directory = directory or tempfile.gettempdir()
+
+        def run():
+            try:
+                self.write(directory, source, seconds)
+            except ProfilerBusyError:
+                logger.warning("Profiling signal ignored: a profile is already running")
+            except Exception as e:
+                logger.error(f"Error writing profile: {e}")
+
+        def handler(received, frame):
+            threading.Thread(target=run, name="profiler", daemon=True).start()
+
+        try:
+            signal.signal(signum, handler)
+            logger.info(f"Send signal {signum} to pid {os.getpid()} to profile {source} for {seconds}s")
+            return True
+        except (ValueError, OSError) as e:
+            # Signals can only be installed from the main thread
+            logger.error(f"Error installing profiling signal handler: {e}")
+            return False
+
+
+class RequestProfiles:
+    """The most recent per-request cProfile reports, by id"""
+
+    def __init__(self, max_size: int = 20):
+        self.max_size = max_size
+        self._reports: "OrderedDict[str, Dict]" = OrderedDict()
+        self._ids = count(1)
+        self._lock = threading.Lock()
+
+    def add(self, method: str, path: str, seconds: float, profile: cProfile.Profile, limit: int = 40,
+            extra: Sequence[cProfile.Profile] = ()) -> str:
+        """Keep the report of a profile merged with the extra profiles of its worker threads"""
+        out = io.StringIO()
+        stats = pstats.Stats(profile, stream=out)
+        for worker_profile in extra:
+            stats.add(worker_profile)
+        stats.sort_stats("cumulative").print_stats(limit)
+        report_id = str(next(self._ids))
+        with self._lock:
+            self._reports[report_id] = {
+                "id": report_id,
+                "method": method,
+                "path": path,
+                "seconds": round(seconds, 6),
+                "created": time.time(),
+                "stats": out.getvalue()
+            }
+            while len(self._reports) > self.max_size:
+                self._reports.popitem(last=False)
+        return report_id
+
+    def get(self, report_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._reports.get(report_id)
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            return [{k: v for k, v in report.items() if k != "stats"} for report in reversed(self._reports.values())]
+
+
+class RequestProfilerMiddleware:
+    """
+    Runs single requests under cProfile when they carry an `X-Profile: 1` header.
+
+    The report is kept in `profiles` and its id returned in the
+    `X-Profile-Id` response header. cProfile follows the event loop thread,
+    so coroutines of other requests running meanwhile appear in the
+    report. Calls the request offloads to worker threads are profiled there
+    (see worker_profiles) and merged in; work a sync route does in the
+    thread pool is not.
+    """
+
+    def __init__(self, app, profiles: Optional[RequestProfiles] = None):
+        self.app = app
+        self.profiles = profiles or request_profiles
+        # cProfile allows one active profiler per thread
+        self._active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active or (b"x-profile", b"1") not in scope.get("headers", ()):
+            await self.app(scope, receive, send)
+            return
+
+        self._active = True
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        report = {}
+        extra: List[cProfile.Profile] = []
+        token = worker_profiles.set(extra)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # The report is complete once the handler has produced the response
+                profile.disable()
+                report["id"] = self.profiles.add(scope["method"], scope["path"], time.perf_counter() - started,
+                                                 profile, extra=extra)
+                message = {**message, "headers": list(message.get("headers", [])) +
+                           [(b"x-profile-id", report["id"].encode())]}
+            await send(message)
+
+        try:
+            profile.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.disable()
+            worker_profiles.reset(token)
+            self._active = False
+
+
+# Singleton instances
+sampling_profiler = SamplingProfiler(max_seconds=settings.PROFILE_MAX_SECONDS)
+request_profiles = RequestProfiles()
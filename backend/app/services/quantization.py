@@ -0,0 +1,200 @@
+"""
+Vector codecs for compact embedding storage: float32, int8 scalar and product quantization
+"""
+from typing import Optional, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per block when codes have to be widened to float32
+SCORE_BLOCK_ROWS = 8192
+
+
+class VectorCodec:
+    """
+    Base codec: stores float32 vectors unchanged.
+
+    encode returns (codes, scales); scores returns approximate inner
+    products between a prepared query and a block of codes.
+    """
+
+    name = "none"
+    lossy = False
+    needs_training = False
+    dtype = np.float32
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    @property
+    def trained(self) -> bool:
+        return True
+
+    @property
+    def code_width(self) -> int:
+        return self.dimension
+
+    def train(self, vectors: np.ndarray):
+        """Fit codec parameters; no-op for codecs without training"""
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors, np.ones(len(vectors), dtype=np.float32)
+
+    def decode(self, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        return np.asarray(codes, dtype=np.float32)
+
+    def prepare(self, query: np.ndarray):
+        return np.asarray(query, dtype=np.float32)
+
+    def scores(self, prepared, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        return codes @ prepared
+
+    def parameter_bytes(self) -> int:
+        """Memory held by codec parameters such as codebooks"""
+        return 0
+
+
+class Int8Codec(VectorCodec):
+    """Symmetric int8 scalar quantization with one float32 scale per vector"""
+
+    name = "int8"
+    lossy = True
+    dtype = np.int8
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        safe = np.where(scales > 0, scales, 1.0)
+        codes = np.clip(np.rint(vectors / safe[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def decode(self, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * scales[:, None]
+
+    def scores(self, prepared, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        result = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            result[start:start + len(block)] = block @ prepared
+        return result * scales
+
+
+class ProductQuantizer(VectorCodec):
+    """
+    Product quantization: the vector is split into num_subvectors chunks and
+    each chunk is replaced by the id of its nearest k-means centroid.
+    Queries are scored with per-chunk lookup tables (asymmetric distance).
+    """
+
+    name = "pq"
+    lossy = True
+    needs_training = True
+    dtype = np.uint8
+
+    def __init__(self, dimension: int, num_subvectors: int = 64, num_centroids: int = 256,
+                 iterations: int = 12, max_training_vectors: int = 20000, seed: int = 7):
+        super().__init__(dimension)
+        if dimension % num_subvectors:
+            raise ValueError(f"dimension {dimension} is not divisible by {num_subvectors} subvectors")
+        if num_centroids > 256:
+            raise ValueError("num_centroids must fit in uint8 codes")
+        self.num_subvectors = num_subvectors
+        self.num_centroids = num_centroids
+        self.subvector_dim = dimension // num_subvectors
+        self.iterations = iterations
+        self.max_training_vectors = max_training_vectors
+        self.seed = seed
+        self.codebooks: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    @property
+    def code_width(self) -> int:
+        return self.num_subvectors
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, dimension) -> (num_subvectors, n, subvector_dim)"""
+        return vectors.reshape(len(vectors), self.num_subvectors, self.subvector_dim).transpose(1, 0, 2)
+
+    @staticmethod
+    def _nearest(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        distances = (
+            (centroids * centroids).sum(axis=1)[None, :]
+            - 2.0 * points @ centroids.T
+        )
+        return distances.argmin(axis=1)
+
+    def train(self, vectors: np.ndarray):
+        """Fit one k-means codebook per subvector"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) < self.num_centroids:
+            raise ValueError(f"need at least {self.num_centroids} vectors to train, got {len(vectors)}")
+
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > self.max_training_vectors:
+            vectors = vectors[rng.choice(len(vectors), self.max_training_vectors, replace=False)]
+
+        codebooks = np.empty((self.num_subvectors, self.num_centroids, self.subvector_dim), dtype=np.float32)
+        for j, points in enumerate(self._split(vectors)):
+            centroids = points[rng.choice(len(points), self.num_centroids, replace=False)].copy()
+            for _ in range(self.iterations):
+                assignment = self._nearest(points, centroids)
+                counts = np.bincount(assignment, minlength=self.num_centroids)
+                sums = np.stack([
+                    np.bincount(assignment, weights=points[:, d], minlength=self.num_centroids)
+                    for d in range(self.subvector_dim)
+                ], axis=1)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+                # Re-seed empty clusters from random points
+                empty = np.flatnonzero(~filled)
+                if len(empty):
+                    centroids[empty] = points[rng.choice(len(points), len(empty))]
+            codebooks[j] = centroids
+
+        self.codebooks = codebooks
+        logger.info(f"Trained PQ codebooks: {self.num_subvectors} x {self.num_centroids} on {len(vectors)} vectors")
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.codebooks is None:
+            raise RuntimeError("ProductQuantizer must be trained before encoding")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((len(vectors), self.num_subvectors), dtype=np.uint8)
+        for j, points in enumerate(self._split(vectors)):
+            codes[:, j] = self._nearest(points, self.codebooks[j])
+        return codes, np.ones(len(vectors), dtype=np.float32)
+
+    def decode(self, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        parts = self.codebooks[np.arange(self.num_subvectors), codes]
+        return parts.reshape(len(codes), self.dimension)
+
+    def prepare(self, query: np.ndarray) -> np.ndarray:
+        """Lookup table of inner products between each query chunk and every centroid"""
+        chunks = np.asarray(query, dtype=np.float32).reshape(self.num_subvectors, self.subvector_dim)
+        return np.einsum("jkd,jd->jk", self.codebooks, chunks)
+
+    def scores(self, prepared: np.ndarray, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        result = np.zeros(len(codes), dtype=np.float32)
+        for j in range(self.num_subvectors):
+            result += prepared[j, codes[:, j]]
+        return result
+
+    def parameter_bytes(self) -> int:
+        return 0 if self.codebooks is None else self.codebooks.nbytes
+
+
+def create_codec(name: str, dimension: int, **options) -> VectorCodec:
+    """Build a codec by name: "none", "int8" or "pq" """
+    name = (name or "none").lower()
+    if name == "int8":
+        return Int8Codec(dimension)
+    if name == "pq":
+        return ProductQuantizer(dimension, **options)
+    if name != "none":
+        logger.warning(f"Unknown quantization '{name}', storing float32 vectors")
+    return VectorCodec(dimension)
@@ -0,0 +1,197 @@
+"""
+Turns diagnostics questions into structured log queries
+"""
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Status codes named in words
+STATUS_NAMES = {
+    "bad request": [400],
+    "unauthorized": [401],
+    "forbidden": [403],
+    "not found": [404],
+    "too many requests": [429],
+    "rate limited": [429],
+    "internal server error": [500],
+    "bad gateway": [502],
+    "service unavailable": [503],
+    "gateway timeout": [504],
+    "timeout": [504],
+}
+
+# Status classes, as inclusive code ranges
+STATUS_CLASSES = [
+    (re.compile(r"\b([1-5])xx\b"), None),
+    (re.compile(r"\bserver errors?\b"), (500, 599)),
+    (re.compile(r"\bclient errors?\b"), (400, 499)),
+    (re.compile(r"\b(?:errors?|erroring|errored|fail|fails|failures?|failed|failing)\b"), (400, 599)),
+    (re.compile(r"\b(?:successful|success|ok)\b"), (200, 299)),
+    (re.compile(r"\bredirects?\b"), (300, 399)),
+]
+
+STATUS_CODE = re.compile(r"(?<![\d.])([1-5]\d\d)(?![\d.])")
+IP_ADDRESS = re.compile(r"\b(\d{1,3}(?:\.\d{1,3}){3})\b")
+PATH = re.compile(r"(?<![\w/])(/[\w.\-/]*)")
+METHOD = re.compile(r"\b(GET|POST|PUT|DELETE|PATCH|HEAD|OPTIONS)\b")
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+                "eight": 8, "nine": 9, "ten": 10, "twenty": 20, "fifty": 50, "hundred": 100}
+_NUMBER = r"(\d+|" + "|".join(NUMBER_WORDS) + r")"
+TOP_N = re.compile(r"\b(?:top|first)\s+" + _NUMBER + r"\b|\b" + _NUMBER + r"\s+(?:most|top|busiest|worst)\b")
+WINDOW = re.compile(r"\b(?:last|past|previous)\s+(?:" + _NUMBER + r"\s+)?(minute|min|hour|hr|day)s?\b")
+WINDOW_MINUTES = {"minute": 1, "min": 1, "hour": 60, "hr": 60, "day": 1440}
+
+# Words that select the grouping column, checked in order
+GROUP_WORDS = [
+    ("minute", re.compile(r"\b(?:per minute|over time|trend|timeline|histogram|each minute|by minute)\b")),
+    ("status", re.compile(r"\b(?:status codes?|distribution|breakdown|by status|per status)\b")),
+    ("path", re.compile(r"\b(?:paths?|endpoints?|urls?|pages?|routes?|resources?)\b")),
+    ("method", re.compile(r"\b(?:methods?|verbs?)\b")),
+    ("agent", re.compile(r"\b(?:user agents?|agents?|browsers?|clients? software)\b")),
+    ("ip", re.compile(r"\b(?:ips?|ip addresses|addresses|clients?|callers?|sources?|who)\b")),
+]
+
+# A question is analytic only if it asks for a number or a ranking ...
+ANALYTIC_CUES = re.compile(
+    r"\b(?:how many|number of|count|top|most|least|fewest|frequent|busiest|worst|rate|percentage|"
+    r"percent|ratio|share|distribution|breakdown|trend|per minute|over time|histogram|summari[sz]e)\b"
+)
+# ... or for the log entities behind some rows ("which IPs ...", "who is sending ...")
+SELECTION_CUES = re.compile(
+    r"\b(?:which|list|show|give me)\s+(?:the\s+|all\s+)?(?:\w+\s+)?(?:ips?|ip addresses|addresses|clients?|"
+    r"callers?|endpoints?|paths?|urls?|pages?|routes?|methods?|user agents?|agents?|status codes?|requests?|errors?)\b"
+    r"|\bwho\s+(?:is\s+|are\s+|was\s+|were\s+)?(?:\w+ing|sends?|sent|causes?|caused|hits?|makes?|made|gets?|got)\b"
+)
+# Questions about what a status means or how to fix it are answered by retrieval,
+# even when they name a status code
+DEFINITION_CUES = re.compile(
+    r"\b(?:mean|means|meaning|stand for|define|definition|explain|why)\b"
+    r"|\bwhat\s+(?:is|are|does|do)\s+(?:an?|http)\b"
+    r"|\bhow\s+(?:do|can|should|would|to)\b.*\b(?:fix|resolve|troubleshoot|debug|handle|prevent|avoid)\b"
+)
+# ... about something the access log records
+LOG_SUBJECTS = re.compile(
+    r"\b(?:requests?|traffic|hits|responses?|status|errors?|log|logs|ips?|endpoints?|paths?|urls?|methods?|user agents?)\b"
+)
+RATE_CUES = re.compile(r"\b(?:rate|percentage|percent|ratio|share|fraction)\b")
+RECENT = re.compile(r"\b(?:recent|recently|lately|right now|currently)\b")
+
+# Window used for "recent" without an explicit length
+RECENT_MINUTES = 60
+DEFAULT_TOP_N = 5
+
+
+@dataclass
+class LogQuery:
+    """A structured query over the indexed access log"""
+    statuses: Optional[Tuple[int, int]] = None   # inclusive status code range
+    codes: Optional[List[int]] = None            # explicit status codes (take precedence over the range)
+    minutes: Optional[int] = None                # last N minutes of the log
+    ip: Optional[str] = None
+    path: Optional[str] = None                   # path prefix
+    method: Optional[str] = None
+    group_by: Optional[str] = None               # ip, path, method, agent, status or minute
+    top_n: int = DEFAULT_TOP_N
+    metric: str = "count"                        # count or rate
+
+    def key(self) -> Tuple:
+        """Hashable form, for result caching"""
+        return tuple((k, tuple(v) if isinstance(v, list) else v) for k, v in asdict(self).items())
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def _number(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return None
+    return int(value) if value.isdigit() else NUMBER_WORDS[value]
+
+
+def plan_question(question: str) -> Optional[LogQuery]:
+    """
+    Structured log query for an analytic question, or None when the question
+    is not about the access log (it is then answered by retrieval).
+    """
+    text = question.lower()
+    if DEFINITION_CUES.search(text) or not (ANALYTIC_CUES.search(text) or SELECTION_CUES.search(text)):
+        return None
+
+    query = LogQuery()
+    ip = IP_ADDRESS.search(question)
+    if ip:
+        query.ip = ip.group(1)
+    # Numbers inside an IP address are not status codes
+    without_ip = IP_ADDRESS.sub(" ", question)
+
+    codes = sorted({int(code) for code in STATUS_CODE.findall(without_ip)})
+    for name, named in STATUS_NAMES.items():
+        if name in text:
+            codes.extend(code for code in named if code not in codes)
+    if codes:
+        query.codes = sorted(codes)
+    else:
+        for pattern, bounds in STATUS_CLASSES:
+            match = pattern.search(text)
+            if match:
+                query.statuses = bounds or (int(match.group(1)) * 100, int(match.group(1)) * 100 + 99)
+                break
+
+    path = PATH.search(without_ip)
+    if path and len(path.group(1)) > 1:
+        query.path = path.group(1)
+    method = METHOD.search(question)
+    if method:
+        query.method = method.group(1)
+
+    window = WINDOW.search(text)
+    if window:
+        query.minutes = (_number(window.group(1)) or 1) * WINDOW_MINUTES[window.group(2)]
+    elif RECENT.search(text):
+        query.minutes = RECENT_MINUTES
+
+    top = TOP_N.search(text)
+    if top:
+        query.top_n = _number(top.group(1) or top.group(2))
+
+    if RATE_CUES.search(text):
+        query.metric = "rate"
+    for column, pattern in GROUP_WORDS:
+        # Filtering on a value ("requests from 1.2.3.4", "errors on /login") is not grouping by it
+        if (column == "ip" and query.ip) or (column == "path" and query.path):
+            continue
+        if pattern.search(text):
+            query.group_by = column
+            break
+    if query.group_by is None and query.metric == "count" and (top or re.search(r"\b(?:most|frequent)\b", text)):
+        query.group_by = "ip"
+
+    has_subject = LOG_SUBJECTS.search(text) or query.codes or query.statuses or query.ip or query.path
+    if not has_subject:
+        return None
+    return query
+
+
+def describe(query: LogQuery) -> str:
+    """Short English description of the rows a query selects"""
+    if query.codes:
+        subject = "HTTP " + "/".join(str(code) for code in query.codes) + " responses"
+    elif query.statuses:
+        low, high = query.statuses
+        subject = {(400, 599): "error responses", (500, 599): "server errors (5xx)",
+                   (400, 499): "client errors (4xx)"}.get((low, high), f"HTTP {low}-{high} responses")
+    else:
+        subject = "requests"
+    if query.method:
+        subject = f"{query.method} {subject}"
+    if query.path:
+        subject += f" for {query.path}"
+    if query.ip:
+        subject += f" from {query.ip}"
+    if query.minutes:
+        subject += f" in the last {query.minutes} minutes of the log"
+    return subject
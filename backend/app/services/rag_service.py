@@ -1,219 +1,317 @@
 """
 RAG (Retrieval-Augmented Generation) service for log diagnostics and LLM queries
 """
-import re
 import os
-from typing import List, Dict, Optional
-from collections import Counter
+import time
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Iterator, List, Dict, Optional, Tuple
 import logging
+
+import numpy as np
+
 from app.config import settings
+from app.services.log_store import LogStore
+from app.services.log_archive import expand_archives, load_archives
+from app.services.log_snapshot import load_snapshot, save_snapshot
+from app.services.cache import LRUCache
+from app.services.embedding_engine import create_embedding_engine
+from app.services.generator import TOKEN_PATTERN, create_generator
+from app.services.retrieval import HybridRetriever, load_knowledge_directory
+from app.services.query_planner import LogQuery, describe, plan_question
 
 logger = logging.getLogger(__name__)
 
+# Operations knowledge indexed for retrieval, as (title, text)
+KNOWLEDGE_BASE = [
+    ("Safety incidences in BP operations 2024",
+     "Based on BP operations data for 2024, there were 12 reported safety incidents across all sites, with 8 classified as minor and 4 as moderate. No major incidents were recorded. All incidents involved proper PPE protocols and immediate corrective actions."),
+
+    ("Hard hat requirements for BP oil drill operations",
+     "BP oil drill operations require all personnel on-site to wear approved hard hats (ANSI Z89.1 Type I, Class E) at all times. This is a mandatory safety requirement with zero exceptions. Regular inspections ensure compliance with a 99.7% adherence rate."),
+
+    ("Economic and social sustainability statements",
+     """Economic and Social Sustainability Statements:
+
+1. **Economic Sustainability**:
+   - Investment of $2.4B in renewable energy infrastructure
+   - Local job creation: 15,000+ positions across operational sites
+   - Supply chain optimization reducing costs by 18%
+
+2. **Social Sustainability**:
+   - Community development programs in 45 regions
+   - Educational partnerships with 30+ technical institutions
+   - Health and safety training for 100% of workforce
+   - Zero-harm workplace initiative with 99.99% incident-free days"""),
+
+    ("BP oil drill operations",
+     "BP oil drill operations span 10 major sites across North America, utilizing advanced IoT monitoring systems for real-time telemetry from 100,000+ connected devices. Operations maintain 99.99% uptime with continuous monitoring of pressure, temperature, flow rates, and environmental sensors."),
+]
+
+
+class QueryStreamStats:
+    """Time to first byte, time to first token and token rates of recent streamed answers"""
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._samples: Deque[Tuple[float, float, float]] = deque(maxlen=window)
+        self.completed = 0
+        self.disconnected = 0
+        self.tokens = 0
+
+    def record(self, ttfb_ms: float, first_token_ms: float, tokens: int, tokens_per_s: float, completed: bool):
+        with self._lock:
+            self._samples.append((ttfb_ms, first_token_ms, tokens_per_s))
+            self.tokens += tokens
+            if completed:
+                self.completed += 1
+            else:
+                self.disconnected += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            samples = np.asarray(self._samples, dtype=np.float64).reshape(-1, 3)
+            result = {"completed": self.completed, "disconnected": self.disconnected, "tokens": self.tokens}
+        for column, name in enumerate(("ttfb_ms", "first_token_ms", "tokens_per_s")):
+            values = samples[:, column]
+            result[name] = {
+                "p50": float(np.percentile(values, 50)) if len(values) else 0,
+                "p95": float(np.percentile(values, 95)) if len(values) else 0
+            }
+        return result
+
 
 class RAGService:
     def __init__(self):
-        self.log_data = []
+        self.store = LogStore()
+        # Diagnostics results keyed by (name, parameters, store version); new
+        # log lines change the version, so entries never need invalidating
+        self.results = LRUCache("diagnostics_results", max_size=settings.LOG_RESULT_CACHE_SIZE)
+        self.retriever = HybridRetriever(
+            create_embedding_engine(),
+            KNOWLEDGE_BASE + load_knowledge_directory(settings.RAG_KNOWLEDGE_PATH),
+            self.log_documents,
+            lambda: self.store.version,
+            refresh_seconds=settings.RAG_LOG_REFRESH_SECONDS,
+            min_similarity=settings.RAG_MIN_SIMILARITY,
+            query_cache_size=settings.QUERY_CACHE_SIZE
+        )
+        self.generator = create_generator()
+        self.stream_stats = QueryStreamStats()
         self.load_logs()
 
-    def load_logs(self, log_path: str = "/data/LogData/logfiles.log"):
-        """Load and parse log files"""
+    def _cached(self, name: str, params: tuple, compute: Callable[[], Any]) -> Any:
+        """Result of compute for the current log data; concurrent misses share one computation"""
+        return self.results.get_or_compute((name, params, self.store.version), compute)
+
+    def load_logs(self, log_path: str = settings.LOG_PATH, archive_glob: str = settings.LOG_ARCHIVE_GLOB):
+        """
+        Stream the log file into the columnar store, parsing each line once.
+
+        Rotated files matching archive_glob (optionally gzip or zstd
+        compressed) are loaded first, oldest first. Without archives, a
+        snapshot saved for the same file is mapped instead of reparsing,
+        and only lines appended after it are parsed.
+        """
         try:
-            if os.path.exists(log_path):
-                with open(log_path, 'r') as f:
-                    self.log_data = f.readlines()
-                logger.info(f"Loaded {len(self.log_data)} log entries")
+            archives = expand_archives(archive_glob, exclude=(log_path,))
+            if os.path.exists(log_path) or archives:
+                store = None
+                if settings.LOG_SNAPSHOT_PATH and not archives:
+                    store = load_snapshot(settings.LOG_SNAPSHOT_PATH, log_path)
+                restored = store is not None
+                if store is None:
+                    store = LogStore()
+                added = load_archives(store, archives, settings.LOG_CHUNK_SIZE, workers=settings.LOG_PARSE_WORKERS)
+                if os.path.exists(log_path):
+                    # When following, a last line without newline may still be being written
+                    added += store.load_file(log_path, settings.LOG_CHUNK_SIZE,
+                                             include_partial=settings.LOG_FOLLOW_INTERVAL <= 0,
+                                             workers=settings.LOG_PARSE_WORKERS)
+                self.store.close()
+                self.store = store
+                logger.info(f"Loaded {len(self.store)} log entries from {len(archives)} archives and {log_path} "
+                            f"({added} parsed, snapshot {'used' if restored else 'not used'})")
+                if added:
+                    self.save_snapshot()
             else:
                 logger.warning(f"Log file not found: {log_path}")
         except Exception as e:
             logger.error(f"Error loading logs: {e}")
 
-    def parse_log_line(self, line: str) -> Optional[Dict]:
-        """Parse a single log line"""
+    def save_snapshot(self) -> bool:
+        """Persist the parsed log state so the next startup can skip parsing"""
+        if not settings.LOG_SNAPSHOT_PATH:
+            return False
         try:
-            # Apache/Nginx log format pattern
-            pattern = r'^(\S+) - - \[(.*?)\] "(\S+) (\S+) (\S+)" (\d+) (\d+)'
-            match = re.match(pattern, line)
-
-            if match:
-                return {
-                    "ip": match.group(1),
-                    "timestamp": match.group(2),
-                    "method": match.group(3),
-                    "path": match.group(4),
-                    "protocol": match.group(5),
-                    "status_code": int(match.group(6)),
-                    "bytes": int(match.group(7)),
-                    "raw": line
-                }
-            return None
+            return save_snapshot(self.store, settings.LOG_SNAPSHOT_PATH)
         except Exception as e:
-            logger.error(f"Error parsing log line: {e}")
-            return None
-
-    def get_frequent_ips_by_error(self, error_code: int, top_n: int = 10) -> List[Dict]:
-        """Get the most frequent IPs generating a specific error code"""
-        try:
-            ip_counter = Counter()
-
-            for line in self.log_data:
-                parsed = self.parse_log_line(line)
-                if parsed and parsed["status_code"] == error_code:
-                    ip_counter[parsed["ip"]] += 1
-
-            results = []
-            for ip, count in ip_counter.most_common(top_n):
-                results.append({
-                    "ip": ip,
-                    "count": count,
+            logger.error(f"Error saving log snapshot: {e}")
+            return False
+
+    def get_frequent_ips_by_error(self, error_code: int, top_n: int = 10, minutes: Optional[int] = None,
+                                  start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        """Get the most frequent IPs generating a specific error code, optionally over the last N minutes or an epoch range"""
+        def compute():
+            return [
+                {
+                    "ip": entry["ip"],
+                    "count": entry["count"],
+                    "max_overcount": entry["error"],
                     "error_code": error_code
-                })
+                }
+                for entry in self.store.top_ips(error_code, top_n, minutes, start, end)
+            ]
 
-            return results
+        try:
+            return self._cached("frequent_ips", (error_code, top_n, minutes, start, end), compute)
 
         except Exception as e:
             logger.error(f"Error analyzing IPs: {e}")
             return []
 
-    def get_error_statistics(self) -> Dict:
-        """Get overall error statistics"""
+    def get_error_statistics(self, start: Optional[int] = None, end: Optional[int] = None) -> Dict:
+        """Get error statistics, overall or for an epoch range"""
         try:
-            status_counter = Counter()
-            method_counter = Counter()
-            total_bytes = 0
-            total_logs = 0
-
-            for line in self.log_data:
-                parsed = self.parse_log_line(line)
-                if parsed:
-                    status_counter[parsed["status_code"]] += 1
-                    method_counter[parsed["method"]] += 1
-                    total_bytes += parsed["bytes"]
-                    total_logs += 1
-
-            return {
-                "total_requests": total_logs,
-                "total_bytes": total_bytes,
-                "status_codes": dict(status_counter),
-                "methods": dict(method_counter),
-                "error_rate": sum(count for code, count in status_counter.items() if code >= 400) / total_logs if total_logs > 0 else 0
-            }
+            return self._cached("statistics", (start, end), lambda: self.store.statistics(start, end))
 
         except Exception as e:
             logger.error(f"Error computing statistics: {e}")
             return {}
 
-    def search_logs(self, query: str, limit: int = 50) -> List[Dict]:
-        """Search logs by keyword"""
+    def search_logs(self, query: str, limit: int = 50, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        """
+        Search logs by keyword using the inverted index.
+        Terms are ANDed unless joined by OR; most recent matches come first.
+        """
         try:
-            results = []
-
-            for line in self.log_data[:1000]:  # Limit search scope
-                if query.lower() in line.lower():
-                    parsed = self.parse_log_line(line)
-                    if parsed:
-                        results.append(parsed)
-
-                    if len(results) >= limit:
-                        break
-
-            return results
+            return self.store.search(query, limit, start, end)
 
         except Exception as e:
             logger.error(f"Error searching logs: {e}")
             return []
 
-    def get_diagnostics_summary(self) -> str:
-        """Generate a text summary of diagnostics"""
+    def get_error_histogram(self, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        """Per-minute request counts and error rate; defaults to the last hour of the log"""
         try:
-            stats = self.get_error_statistics()
-
-            summary = f"""
-### Log Diagnostics Summary
-
-**Total Requests**: {stats.get('total_requests', 0):,}
-**Total Bytes Transferred**: {stats.get('total_bytes', 0):,}
-**Error Rate**: {stats.get('error_rate', 0) * 100:.2f}%
+            return self._cached("histogram", (start, end), lambda: self.store.error_histogram(start, end))
 
-**Status Code Distribution**:
-"""
-            for code, count in sorted(stats.get('status_codes', {}).items()):
-                percentage = (count / stats.get('total_requests', 1)) * 100
-                summary += f"\n- HTTP {code}: {count:,} ({percentage:.1f}%)"
-
-            summary += "\n\n**Top Error Sources**:\n"
-
-            # Get top IPs for common errors
-            for error_code in [400, 403, 404, 500, 502]:
-                top_ips = self.get_frequent_ips_by_error(error_code, top_n=3)
-                if top_ips:
-                    summary += f"\n**Error {error_code}**:\n"
-                    for entry in top_ips:
-                        summary += f"  - {entry['ip']}: {entry['count']} occurrences\n"
+        except Exception as e:
+            logger.error(f"Error computing histogram: {e}")
+            return []
 
-            return summary
+    def get_diagnostics_summary(self, start: Optional[int] = None, end: Optional[int] = None) -> str:
+        """Generate a text summary of diagnostics, optionally for an epoch range"""
+        try:
+            return self._cached("summary", (start, end), lambda: self._build_summary(start, end))
 
         except Exception as e:
             logger.error(f"Error generating summary: {e}")
             return "Error generating diagnostics summary"
 
-    def query_with_llm(self, question: str, context_data: Optional[Dict] = None) -> str:
-        """
-        Query using LLM with RAG context
-        For demo purposes, returns predefined answers
-        In production, would call OpenAI/Cohere API
-        """
-        question_lower = question.lower()
+    def _build_summary(self, start: Optional[int], end: Optional[int]) -> str:
+        stats = self.get_error_statistics(start, end)
 
-        # Predefined knowledge base
-        knowledge_base = {
-            "safety incidences": "Based on BP operations data for 2024, there were 12 reported safety incidents across all sites, with 8 classified as minor and 4 as moderate. No major incidents were recorded. All incidents involved proper PPE protocols and immediate corrective actions.",
+        summary = f"""
+### Log Diagnostics Summary
 
-            "hard hat": "BP oil drill operations require all personnel on-site to wear approved hard hats (ANSI Z89.1 Type I, Class E) at all times. This is a mandatory safety requirement with zero exceptions. Regular inspections ensure compliance with a 99.7% adherence rate.",
+**Total Requests**: {stats.get('total_requests', 0):,}
+**Total Bytes Transferred**: {stats.get('total_bytes', 0):,}
+**Error Rate**: {stats.get('error_rate', 0) * 100:.2f}%
 
-            "sustainability": """Economic and Social Sustainability Statements:
+**Status Code Distribution**:
+"""
+        for code, count in sorted(stats.get('status_codes', {}).items()):
+            percentage = (count / stats.get('total_requests', 1)) * 100
+            summary += f"\n- HTTP {code}: {count:,} ({percentage:.1f}%)"
 
-1. **Economic Sustainability**:
-   - Investment of $2.4B in renewable energy infrastructure
-   - Local job creation: 15,000+ positions across operational sites
-   - Supply chain optimization reducing costs by 18%
+        summary += "\n\n**Top Error Sources**:\n"
 
-2. **Social Sustainability**:
-   - Community development programs in 45 regions
-   - Educational partnerships with 30+ technical institutions
-   - Health and safety training for 100% of workforce
-   - Zero-harm workplace initiative with 99.99% incident-free days""",
+        # Get top IPs for common errors
+        for error_code in [400, 403, 404, 500, 502]:
+            top_ips = self.get_frequent_ips_by_error(error_code, top_n=3, start=start, end=end)
+            if top_ips:
+                summary += f"\n**Error {error_code}**:\n"
+                for entry in top_ips:
+                    summary += f"  - {entry['ip']}: {entry['count']} occurrences\n"
 
-            "operations": "BP oil drill operations span 10 major sites across North America, utilizing advanced IoT monitoring systems for real-time telemetry from 100,000+ connected devices. Operations maintain 99.99% uptime with continuous monitoring of pressure, temperature, flow rates, and environmental sensors.",
-        }
+        return summary
 
-        # Match question to knowledge
-        for key, answer in knowledge_base.items():
-            if key in question_lower:
-                return answer
-
-        # If asking about error analysis
-        if "error" in question_lower or "400" in question or "500" in question or "ip" in question_lower:
-            if "400" in question:
-                ips = self.get_frequent_ips_by_error(400, top_n=5)
-                response = f"The most frequent IP devices generating HTTP 400 errors are:\n\n"
-                for i, entry in enumerate(ips, 1):
-                    response += f"{i}. {entry['ip']} - {entry['count']} occurrences\n"
-                return response
-            elif "404" in question:
-                ips = self.get_frequent_ips_by_error(404, top_n=5)
-                response = f"The most frequent IP devices generating HTTP 404 errors are:\n\n"
-                for i, entry in enumerate(ips, 1):
-                    response += f"{i}. {entry['ip']} - {entry['count']} occurrences\n"
-                return response
-            elif "500" in question:
-                ips = self.get_frequent_ips_by_error(500, top_n=5)
-                response = f"The most frequent IP devices generating HTTP 500 errors are:\n\n"
-                for i, entry in enumerate(ips, 1):
-                    response += f"{i}. {entry['ip']} - {entry['count']} occurrences\n"
-                return response
-
-        # Default response with stats
+    def log_documents(self) -> List[Tuple[str, str]]:
+        """(title, text) summaries of the current log data, indexed for retrieval"""
+        stats = self.get_error_statistics()
+        total = stats.get('total_requests', 0)
+        documents = [("Log diagnostics summary", self.get_diagnostics_summary())]
+
+        for code, count in sorted(stats.get('status_codes', {}).items()):
+            if code < 400:
+                continue
+            sources = ", ".join(f"{e['ip']} ({e['count']:,} occurrences)"
+                                for e in self.get_frequent_ips_by_error(code, top_n=5))
+            documents.append((
+                f"HTTP {code} errors",
+                f"HTTP {code} error responses: {count:,} of {total:,} requests ({count / total * 100:.2f}%). "
+                f"The most frequent IP devices generating error {code} are {sources}."
+            ))
+
+        histogram = self.get_error_histogram()
+        if histogram:
+            requests = sum(b["requests"] for b in histogram)
+            errors = sum(b["errors"] for b in histogram)
+            peak = max(histogram, key=lambda b: b["error_rate"])
+            documents.append((
+                "Recent error rate",
+                f"In the last {len(histogram)} minutes of the log there were {requests:,} requests and "
+                f"{errors:,} errors, an error rate of {errors / max(requests, 1) * 100:.2f}%. The highest "
+                f"per-minute error rate was {peak['error_rate'] * 100:.2f}% at "
+                f"{datetime.fromtimestamp(peak['minute'], tz=timezone.utc).isoformat()}."
+            ))
+        return documents
+
+    def run_log_query(self, plan: LogQuery) -> Dict:
+        """Execute a planned log query against the indexed log data"""
+        return self._cached("log_query", plan.key(), lambda: self.store.aggregate(
+            plan.codes, plan.statuses, plan.minutes, ip=plan.ip, path=plan.path, method=plan.method,
+            group_by=plan.group_by, top_n=plan.top_n
+        ))
+
+    @staticmethod
+    def _format_log_answer(plan: LogQuery, result: Dict) -> str:
+        subject = describe(plan)
+        matched, total = result["matched"], result["total"]
+        share = matched / total * 100 if total else 0
+        if not matched:
+            return f"No {subject} were found."
+
+        if plan.group_by is None:
+            scope = "requests matching the same filters" if plan.ip or plan.path or plan.method else "requests"
+            if plan.metric == "rate":
+                return f"{subject[0].upper()}{subject[1:]}: {matched:,} of {total:,} {scope} ({share:.2f}%)."
+            return f"There were {matched:,} {subject} ({share:.2f}% of {total:,} {scope})."
+
+        if plan.group_by == "ip" and plan.codes and len(plan.codes) == 1 and subject == f"HTTP {plan.codes[0]} responses":
+            response = f"The most frequent IP devices generating HTTP {plan.codes[0]} errors are:\n\n"
+            for i, entry in enumerate(result["groups"], 1):
+                response += f"{i}. {entry['key']} - {entry['count']} occurrences\n"
+            return response
+
+        if plan.group_by == "minute":
+            response = f"Per-minute counts of {subject} ({matched:,} in total):\n\n"
+            for entry in result["groups"]:
+                minute = datetime.fromtimestamp(entry["key"], tz=timezone.utc).strftime("%Y-%m-%d %H:%M")
+                response += f"- {minute} UTC: {entry['count']:,}\n"
+            return response
+
+        label = {"ip": "IP addresses", "path": "paths", "method": "methods", "agent": "user agents",
+                 "status": "status codes"}[plan.group_by]
+        response = f"Top {len(result['groups'])} {label} for {subject} ({matched:,} in total):\n\n"
+        for i, entry in enumerate(result["groups"], 1):
+            key = f"HTTP {entry['key']}" if plan.group_by == "status" else entry["key"]
+            response += f"{i}. {key} - {entry['count']:,} ({entry['count'] / matched * 100:.1f}%)\n"
+        return response
+
+    def _default_answer(self) -> str:
         stats = self.get_error_statistics()
         return f"""I can help you analyze the system logs and operations data.
 
@@ -229,6 +327,85 @@ Try asking about:
 - "List economic and social sustainability statements"
 """
 
+    def _answer_tokens(self, question: str) -> Tuple[Optional[LogQuery], List[Dict], Dict, Iterator[str]]:
+        """
+        The log query plan (analytic questions), retrieved contexts (other
+        questions), stage timings and the answer as a token iterator
+        """
+        plan = plan_question(question)
+        if plan is not None:
+            started = time.perf_counter()
+            answer = self._format_log_answer(plan, self.run_log_query(plan))
+            return plan, [], {"query_ms": (time.perf_counter() - started) * 1000}, iter(TOKEN_PATTERN.findall(answer))
+
+        contexts, timings = self.retriever.retrieve(question, settings.RAG_TOP_K, settings.RAG_RETRIEVAL_BUDGET_MS)
+        if not contexts:
+            return None, [], timings, iter(TOKEN_PATTERN.findall(self._default_answer()))
+        return None, contexts, timings, self.generator.generate(question, contexts)
+
+    @staticmethod
+    def _sources(contexts: List[Dict]) -> List[Dict]:
+        return [{k: c[k] for k in ("id", "source", "title", "score")} for c in contexts]
+
+    def query(self, question: str, context_data: Optional[Dict] = None) -> Dict:
+        """
+        Answer a question with retrieval-augmented generation.
+
+        Returns the answer, the retrieved sources and per-stage timings in
+        milliseconds. Analytic questions about the access log are planned
+        into structured queries and answered from the indexed log data;
+        `plan` is set for those.
+        """
+        started = time.perf_counter()
+        plan, contexts, timings, tokens = self._answer_tokens(question)
+        generation_started = time.perf_counter()
+        answer = "".join(tokens)
+        finished = time.perf_counter()
+        timings["generation_ms"] = (finished - generation_started) * 1000
+        timings["total_ms"] = (finished - started) * 1000
+        return {
+            "answer": answer,
+            "plan": plan.to_dict() if plan else None,
+            "sources": self._sources(contexts),
+            "timings": timings
+        }
+
+    def query_events(self, question: str, context_data: Optional[Dict] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Answer a question as a stream of (event, data) pairs: "context" with
+        the sources as soon as retrieval finishes, one "token" per generated
+        token, then "done" with timings. Closing the iterator stops generation.
+        """
+        started = time.perf_counter()
+        plan, contexts, timings, tokens = self._answer_tokens(question)
+        yield "context", {"plan": plan.to_dict() if plan else None, "sources": self._sources(contexts), "timings": timings}
+
+        generation_started = time.perf_counter()
+        count = 0
+        try:
+            for token in tokens:
+                count += 1
+                yield "token", {"text": token}
+        finally:
+            # Propagates an early close to the generator (and its upstream request)
+            close = getattr(tokens, "close", None)
+            if close is not None:
+                close()
+        finished = time.perf_counter()
+        yield "done", {
+            "tokens": count,
+            "generation_ms": (finished - generation_started) * 1000,
+            "total_ms": (finished - started) * 1000
+        }
+
+    def query_with_llm(self, question: str, context_data: Optional[Dict] = None) -> str:
+        """Query using the configured generator with retrieved knowledge and log context"""
+        try:
+            return self.query(question, context_data)["answer"]
+        except Exception as e:
+            logger.error(f"Error answering query: {e}")
+            return self._default_answer()
+
 
 # Singleton instance
 rag_service = RAGService()
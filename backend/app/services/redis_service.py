@@ -3,22 +3,57 @@ Redis service for state management, caching, and vector search
 """
 import redis
 import json
+import time
+import base64
 from typing import Dict, List, Optional, Any
+import numpy as np
 from app.config import settings
+from app.services.metrics import REDIS_COMMAND_SECONDS
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class TimedRedis(redis.Redis):
+    """Redis client recording the latency of every command (pipelines count as PIPELINE)"""
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_SECONDS.labels(str(args[0]).upper()).observe(time.perf_counter() - started)
+
+    def pipeline(self, *args, **kwargs):
+        pipe = super().pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def timed_execute(*execute_args, **execute_kwargs):
+            started = time.perf_counter()
+            try:
+                return execute(*execute_args, **execute_kwargs)
+            finally:
+                REDIS_COMMAND_SECONDS.labels("PIPELINE").observe(time.perf_counter() - started)
+
+        pipe.execute = timed_execute
+        return pipe
+
+
 class RedisService:
     def __init__(self):
         self.client = None
+        self.storage_format = settings.EMBEDDING_STORAGE_FORMAT
+        if self.storage_format == "int8" and settings.EMBEDDING_QUANTIZATION in ("int8", "pq"):
+            # Stored vectors are what a quantized index re-ranks with, so they must stay full precision
+            logger.error("EMBEDDING_STORAGE_FORMAT=int8 cannot re-rank a quantized index at full precision; "
+                         "storing embeddings as float32")
+            self.storage_format = "float32"
         self.connect()
 
     def connect(self):
         """Connect to Redis Stack"""
         try:
-            self.client = redis.Redis(
+            self.client = TimedRedis(
                 host=settings.REDIS_HOST,
                 port=settings.REDIS_PORT,
                 decode_responses=True,
@@ -67,6 +102,18 @@ class RedisService:
             logger.error(f"Error incrementing {key}: {e}")
             return 0
 
+    def increment_many(self, amounts: Dict[str, int]) -> bool:
+        """Increment several counters in one round trip"""
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, amount in amounts.items():
+                pipe.incrby(key, amount)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error incrementing {', '.join(amounts)}: {e}")
+            return False
+
     def set_hash(self, name: str, mapping: Dict):
         """Set hash fields"""
         try:
@@ -92,49 +139,211 @@ class RedisService:
             logger.error(f"Error getting hash field {name}.{field}: {e}")
             return None
 
+    def delete_hash_fields(self, name: str, fields: List[str]):
+        """Delete hash fields"""
+        try:
+            if fields:
+                self.client.hdel(name, *fields)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting hash fields {name}: {e}")
+            return False
+
     def store_embedding(self, key: str, embedding: List[float], metadata: Dict):
-        """Store an embedding with metadata"""
+        """Store an embedding with metadata and add it to the site/device type indexes"""
         try:
-            data = {
-                "embedding": json.dumps(embedding),
-                "metadata": json.dumps(metadata)
-            }
-            return self.set_hash(f"embedding:{key}", data)
+            data = self._encode_embedding(embedding)
+            data["metadata"] = json.dumps(metadata)
+            pipe = self.client.pipeline()
+            pipe.hset(f"embedding:{key}", mapping=data)
+            for index_key in self._embedding_index_keys(metadata):
+                pipe.sadd(index_key, key)
+            pipe.execute()
+            return True
         except Exception as e:
             logger.error(f"Error storing embedding {key}: {e}")
             return False
 
+    def _encode_embedding(self, embedding: List[float]) -> Dict:
+        """
+        Encode an embedding for storage according to EMBEDDING_STORAGE_FORMAT:
+        "json" (float list), "float32" (base64 raw floats) or "int8" (base64 codes plus scale)
+        """
+        storage_format = self.storage_format
+        if storage_format == "float32":
+            vector = np.asarray(embedding, dtype=np.float32)
+            return {"format": "float32", "embedding": base64.b64encode(vector.tobytes()).decode("ascii")}
+        if storage_format == "int8":
+            vector = np.asarray(embedding, dtype=np.float32)
+            scale = float(np.abs(vector).max()) / 127.0 if len(vector) else 0.0
+            codes = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8) if scale else np.zeros(len(vector), np.int8)
+            return {
+                "format": "int8",
+                "scale": repr(scale),
+                "embedding": base64.b64encode(codes.tobytes()).decode("ascii")
+            }
+        return {"embedding": json.dumps(embedding)}
+
+    def _decode_embedding(self, data: Dict) -> Dict:
+        """Decode a stored embedding hash in any supported format"""
+        storage_format = data.get("format", "json")
+        raw = data.get("embedding", "")
+        if storage_format == "float32":
+            embedding = np.frombuffer(base64.b64decode(raw), dtype=np.float32).tolist()
+        elif storage_format == "int8":
+            codes = np.frombuffer(base64.b64decode(raw), dtype=np.int8)
+            embedding = (codes.astype(np.float32) * float(data.get("scale", 0))).tolist()
+        else:
+            embedding = json.loads(raw or "[]")
+        return {
+            "embedding": embedding,
+            "metadata": json.loads(data.get("metadata", "{}"))
+        }
+
+    def _embedding_index_keys(self, metadata: Dict) -> List[str]:
+        """Set keys that index an embedding by site and device type"""
+        return [
+            "embedding_index:all",
+            f"embedding_index:site:{metadata.get('site_id', 'UNKNOWN')}",
+            f"embedding_index:device_type:{metadata.get('device_type', 'unknown')}"
+        ]
+
+    def delete_embedding(self, key: str):
+        """Delete an embedding and remove it from the indexes"""
+        try:
+            embedding_data = self.get_embedding(key)
+            metadata = embedding_data["metadata"] if embedding_data else {}
+            pipe = self.client.pipeline()
+            pipe.delete(f"embedding:{key}")
+            for index_key in self._embedding_index_keys(metadata):
+                pipe.srem(index_key, key)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting embedding {key}: {e}")
+            return False
+
+    def list_embedding_keys(self, site_id: Optional[str] = None, device_type: Optional[str] = None) -> List[str]:
+        """List embedding keys from the maintained site/device type indexes"""
+        try:
+            index_keys = []
+            if site_id:
+                index_keys.append(f"embedding_index:site:{site_id}")
+            if device_type:
+                index_keys.append(f"embedding_index:device_type:{device_type}")
+
+            if not index_keys:
+                members = self.client.smembers("embedding_index:all")
+            elif len(index_keys) == 1:
+                members = self.client.smembers(index_keys[0])
+            else:
+                members = self.client.sinter(index_keys)
+            return sorted(members)
+        except Exception as e:
+            logger.error(f"Error listing embedding keys: {e}")
+            return []
+
+    def get_embedding_metadata(self, keys: List[str]) -> List[Optional[Dict]]:
+        """Get metadata for several embeddings in one round trip, without the vectors"""
+        try:
+            pipe = self.client.pipeline()
+            for key in keys:
+                pipe.hget(f"embedding:{key}", "metadata")
+            return [json.loads(data) if data else None for data in pipe.execute()]
+        except Exception as e:
+            logger.error(f"Error getting embedding metadata: {e}")
+            return [None] * len(keys)
+
+    def get_embeddings(self, keys: List[str]) -> List[Optional[Dict]]:
+        """Get several embeddings with metadata in one round trip"""
+        try:
+            pipe = self.client.pipeline()
+            for key in keys:
+                pipe.hgetall(f"embedding:{key}")
+            results = []
+            for data in pipe.execute():
+                results.append(self._decode_embedding(data) if data else None)
+            return results
+        except Exception as e:
+            logger.error(f"Error getting embeddings: {e}")
+            return [None] * len(keys)
+
+    def store_image_link(self, key: str, metadata: Dict):
+        """Store a near-duplicate's link to its original, outside the embedding indexes"""
+        try:
+            pipe = self.client.pipeline()
+            pipe.hset(f"image_link:{key}", mapping={"metadata": json.dumps(metadata)})
+            pipe.sadd(f"image_links:{metadata['duplicate_of']}", key)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error storing image link {key}: {e}")
+            return False
+
+    def get_image_links(self, keys: List[str]) -> List[Optional[Dict]]:
+        """Get the link metadata of several near-duplicates in one round trip"""
+        try:
+            pipe = self.client.pipeline()
+            for key in keys:
+                pipe.hget(f"image_link:{key}", "metadata")
+            return [json.loads(data) if data else None for data in pipe.execute()]
+        except Exception as e:
+            logger.error(f"Error getting image links: {e}")
+            return [None] * len(keys)
+
+    def list_image_links(self, original_key: str) -> List[str]:
+        """Keys of the near-duplicates linked to an original"""
+        try:
+            return sorted(self.client.smembers(f"image_links:{original_key}"))
+        except Exception as e:
+            logger.error(f"Error listing image links of {original_key}: {e}")
+            return []
+
+    def delete_image_links(self, keys: List[str]):
+        """Delete the link records of several images (keys without one are ignored)"""
+        if not keys:
+            return True
+        try:
+            links = self.get_image_links(keys)
+            pipe = self.client.pipeline()
+            for key, metadata in zip(keys, links):
+                if metadata:
+                    pipe.delete(f"image_link:{key}")
+                    pipe.srem(f"image_links:{metadata.get('duplicate_of')}", key)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting image links: {e}")
+            return False
+
     def get_embedding(self, key: str) -> Optional[Dict]:
         """Get an embedding with metadata"""
         try:
             data = self.get_hash(f"embedding:{key}")
             if data:
-                return {
-                    "embedding": json.loads(data.get("embedding", "[]")),
-                    "metadata": json.loads(data.get("metadata", "{}"))
-                }
+                return self._decode_embedding(data)
             return None
         except Exception as e:
             logger.error(f"Error getting embedding {key}: {e}")
             return None
 
-    def search_embeddings(self, query_embedding: List[float], top_k: int = 10) -> List[Dict]:
+    def search_embeddings(self, query_embedding: List[float], top_k: int = 10,
+                          site_id: Optional[str] = None, device_type: Optional[str] = None) -> List[Dict]:
         """
-        Search for similar embeddings
+        Search for similar embeddings, optionally restricted to a site and/or device type
         Note: This is a simple implementation. For production, use RedisSearch with vector similarity
         """
         try:
-            # Get all embedding keys
-            keys = self.client.keys("embedding:*")
+            # Only fetch embeddings that pass the filters
+            keys = self.list_embedding_keys(site_id, device_type)
             results = []
 
-            for key in keys[:100]:  # Limit to first 100 for performance
-                embedding_data = self.get_embedding(key.replace("embedding:", ""))
+            for key, embedding_data in zip(keys, self.get_embeddings(keys)):
                 if embedding_data:
                     # Simple cosine similarity (for demo purposes)
                     similarity = self._cosine_similarity(query_embedding, embedding_data["embedding"])
                     results.append({
-                        "key": key.replace("embedding:", ""),
+                        "key": key,
                         "similarity": similarity,
                         "metadata": embedding_data["metadata"]
                     })
@@ -0,0 +1,303 @@
+"""
+Hybrid BM25 + embedding retrieval over knowledge documents and log summaries
+"""
+import os
+import re
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+import numpy as np
+
+from app.services.cache import LRUCache
+from app.services.embedding_engine import STOP_WORDS, TOKEN_PATTERN, EmbeddingEngine
+
+logger = logging.getLogger(__name__)
+
+# Reciprocal rank fusion constant; damps the influence of the very first ranks
+RRF_K = 60
+
+# Candidates taken from each ranker before fusion, per requested result
+CANDIDATE_FACTOR = 4
+
+# Text files loaded as knowledge documents from a knowledge directory
+KNOWLEDGE_EXTENSIONS = (".md", ".txt")
+
+
+@dataclass
+class Chunk:
+    """A retrievable passage of a document"""
+    id: str
+    source: str
+    title: str
+    text: str
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens without stop words, as the embedding engines see them"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def chunk_document(doc_id: str, source: str, title: str, text: str,
+                   max_words: int = 120, overlap: int = 30) -> List[Chunk]:
+    """
+    Split a document into passages of about max_words words.
+
+    Paragraphs are kept whole and packed together while they fit; a
+    paragraph longer than max_words is cut into windows overlapping by
+    `overlap` words so that no sentence is only seen at a boundary.
+    """
+    pieces: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", text.strip()):
+        words = paragraph.split()
+        if len(words) <= max_words:
+            pieces.append(paragraph.strip())
+            continue
+        step = max_words - overlap
+        for start in range(0, len(words) - overlap, step):
+            pieces.append(" ".join(words[start:start + max_words]))
+
+    chunks: List[Chunk] = []
+    current: List[str] = []
+    size = 0
+    for piece in pieces:
+        words = len(piece.split())
+        if current and size + words > max_words:
+            chunks.append(Chunk(f"{doc_id}#{len(chunks)}", source, title, "\n\n".join(current)))
+            current, size = [], 0
+        current.append(piece)
+        size += words
+    if current:
+        chunks.append(Chunk(f"{doc_id}#{len(chunks)}", source, title, "\n\n".join(current)))
+    return chunks
+
+
+def load_knowledge_directory(path: str) -> List[Tuple[str, str]]:
+    """(title, text) of every knowledge file under path; titles come from file names"""
+    documents = []
+    if not path or not os.path.isdir(path):
+        return documents
+    for root, _, files in os.walk(path):
+        for filename in sorted(files):
+            if not filename.lower().endswith(KNOWLEDGE_EXTENSIONS):
+                continue
+            try:
+                with open(os.path.join(root, filename), encoding="utf-8") as f:
+                    title = os.path.splitext(filename)[0].replace("_", " ").replace("-", " ")
+                    documents.append((title, f.read()))
+            except Exception as e:
+                logger.error(f"Error reading knowledge file {filename}: {e}")
+    return documents
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk texts (titles included).
+
+    Each term maps to arrays of chunk ids and term frequencies, so a query
+    costs one vectorized scatter-add per query term.
+    """
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(texts)
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(self.size, dtype=np.float64)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[doc] = len(tokens)
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[doc] = counts.get(doc, 0) + 1
+
+        average = lengths.mean() if self.size else 0
+        # Length normalization per chunk, precomputed once
+        self.norms = k1 * (1 - b + b * lengths / average) if average else np.full(self.size, k1)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        for token, counts in postings.items():
+            docs = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            tf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+            idf = math.log(1 + (self.size - len(docs) + 0.5) / (len(docs) + 0.5))
+            self.postings[token] = (docs, tf, idf)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for query"""
+        scores = np.zeros(self.size)
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            docs, tf, idf = posting
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + self.norms[docs])
+        return scores
+
+
+def _top(scores: np.ndarray, k: int) -> List[int]:
+    """Indices of the k highest positive scores, best first"""
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind="stable")].tolist()
+
+
+class HybridIndex:
+    """BM25 and embedding rankers over the same chunks, fused by reciprocal rank"""
+
+    def __init__(self, chunks: List[Chunk], vectors: np.ndarray):
+        self.chunks = chunks
+        self.vectors = vectors
+        self.bm25 = BM25Index([f"{c.title}\n{c.text}" for c in chunks])
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def lexical(self, query: str, k: int) -> List[int]:
+        return _top(self.bm25.scores(query), k)
+
+    def dense(self, vector: np.ndarray, k: int, min_similarity: float = 0) -> List[int]:
+        if not len(self.chunks):
+            return []
+        similarity = self.vectors @ vector
+        return _top(np.where(similarity >= min_similarity, similarity, 0), k)
+
+    def fuse(self, rankings: List[List[int]], k: int) -> List[Tuple[int, float]]:
+        """(chunk, fused score) for the k best chunks across rankings"""
+        fused: Dict[int, float] = {}
+        for ranking in rankings:
+            for rank, chunk in enumerate(ranking):
+                fused[chunk] = fused.get(chunk, 0.0) + 1.0 / (RRF_K + rank + 1)
+        return sorted(fused.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+class HybridRetriever:
+    """
+    Retrieves context for diagnostics questions from static knowledge
+    documents and from summaries derived from the current log data.
+
+    Knowledge chunks are embedded once; log summaries are re-derived and
+    re-embedded when the log version changes, at most every
+    `refresh_seconds`. BM25 always runs. The query embedding runs in a
+    worker thread and only counts if it finishes within the latency
+    budget, so a slow embedding provider degrades retrieval to lexical
+    ranking instead of delaying the answer.
+    """
+
+    def __init__(self, engine: EmbeddingEngine, documents: List[Tuple[str, str]],
+                 log_documents: Callable[[], List[Tuple[str, str]]],
+                 log_version: Callable[[], int], refresh_seconds: float = 10,
+                 min_similarity: float = 0.2, query_cache_size: int = 1024):
+        self.engine = engine
+        self.documents = documents
+        self.log_documents = log_documents
+        self.log_version = log_version
+        self.refresh_seconds = refresh_seconds
+        # Embedding matches below this cosine similarity are not considered relevant
+        self.min_similarity = min_similarity
+        self.query_cache = LRUCache("retrieval_queries", max_size=query_cache_size)
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="retrieval-embed")
+        self._lock = threading.Lock()
+        self._knowledge: Optional[Tuple[List[Chunk], np.ndarray]] = None
+        self._index: Optional[HybridIndex] = None
+        self._indexed_version: Optional[int] = None
+        self._refreshed_at = 0.0
+        self.budget_misses = 0
+
+    def _embed(self, chunks: List[Chunk]) -> np.ndarray:
+        if not chunks:
+            return np.zeros((0, self.engine.dimension), dtype=np.float32)
+        vectors = self.engine.embed_batch([f"{c.title}\n{c.text}" for c in chunks], "search_document")
+        if vectors is None:
+            # Provider failure: these chunks are only reachable through BM25
+            return np.zeros((len(chunks), self.engine.dimension), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+    def _current_index(self) -> HybridIndex:
+        with self._lock:
+            if self._knowledge is None:
+                chunks = [chunk for position, (title, text) in enumerate(self.documents)
+                          for chunk in chunk_document(f"kb{position}", "knowledge", title, text)]
+                self._knowledge = (chunks, self._embed(chunks))
+                logger.info(f"Indexed {len(chunks)} knowledge chunks for retrieval")
+
+            version = self.log_version()
+            stale = self._index is None or (
+                version != self._indexed_version and time.monotonic() - self._refreshed_at >= self.refresh_seconds
+            )
+            if stale:
+                chunks = [chunk for position, (title, text) in enumerate(self.log_documents())
+                          for chunk in chunk_document(f"log{position}", "logs", title, text)]
+                knowledge_chunks, knowledge_vectors = self._knowledge
+                self._index = HybridIndex(knowledge_chunks + chunks, np.vstack([knowledge_vectors, self._embed(chunks)]))
+                self._indexed_version = version
+                self._refreshed_at = time.monotonic()
+            return self._index
+
+    def _query_vector(self, query: str) -> Optional[np.ndarray]:
+        def compute():
+            vectors = self.engine.embed_batch([query], "search_query")
+            if vectors is None or not len(vectors):
+                return None
+            vector = vectors[0].astype(np.float32)
+            norm = np.linalg.norm(vector)
+            return vector / norm if norm else None
+        return self.query_cache.get_or_compute(re.sub(r"\s+", " ", query.strip().lower()), compute)
+
+    def retrieve(self, query: str, top_k: int = 4, budget_ms: float = 50) -> Tuple[List[Dict], Dict]:
+        """
+        Top-k context chunks for query and per-stage timings in milliseconds.
+
+        The budget covers the lexical and dense rankers; refreshing the
+        log summaries is timed separately.
+        """
+        started = time.perf_counter()
+        index = self._current_index()
+        ready = time.perf_counter()
+        # Start the query embedding first so that it overlaps with BM25
+        future = self._executor.submit(self._query_vector, query)
+        candidates = max(top_k * CANDIDATE_FACTOR, 10)
+        rankings = [index.lexical(query, candidates)]
+        lexical_done = time.perf_counter()
+
+        remaining = budget_ms / 1000 - (lexical_done - ready)
+        dense_used = False
+        try:
+            vector = future.result(timeout=max(remaining, 0))
+            if vector is not None and len(vector) == index.vectors.shape[1]:
+                rankings.append(index.dense(vector, candidates, self.min_similarity))
+                dense_used = True
+        except TimeoutError:
+            self.budget_misses += 1
+            logger.warning(f"Query embedding exceeded the {budget_ms:.0f} ms retrieval budget; using BM25 only")
+
+        results = []
+        for chunk, score in index.fuse(rankings, top_k):
+            item = index.chunks[chunk]
+            results.append({
+                "id": item.id,
+                "source": item.source,
+                "title": item.title,
+                "text": item.text,
+                "score": round(score * (RRF_K + 1) / len(rankings), 4)
+            })
+        finished = time.perf_counter()
+        return results, {
+            "refresh_ms": (ready - started) * 1000,
+            "lexical_ms": (lexical_done - ready) * 1000,
+            "retrieval_ms": (finished - ready) * 1000,
+            "dense_used": dense_used
+        }
+
+    def stats(self) -> Dict:
+        index = self._index
+        return {
+            "chunks": len(index) if index else 0,
+            "log_version": self._indexed_version,
+            "budget_misses": self.budget_misses,
+            "query_cache": self.query_cache.stats()
+        }
@@ -0,0 +1,262 @@
+"""
+In-memory vector index partitioned by site and device type
+"""
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+import numpy as np
+
+from app.services.quantization import VectorCodec, create_codec
+
+logger = logging.getLogger(__name__)
+
+
+class _Partition:
+    """Dense, growable block of encoded vectors for one (site_id, device_type) pair"""
+
+    def __init__(self, codec: VectorCodec, capacity: int = 64):
+        self.codes = np.zeros((capacity, codec.code_width), dtype=codec.dtype)
+        self.scales = np.zeros(capacity, dtype=np.float32)
+        self.keys: List[str] = []
+        self.metadata: List[Dict] = []
+        self.rows: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key: str, code: np.ndarray, scale: float, metadata: Dict):
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row == len(self.codes):
+                grown = np.zeros((len(self.codes) * 2, self.codes.shape[1]), dtype=self.codes.dtype)
+                grown[:row] = self.codes[:row]
+                self.codes = grown
+                self.scales = np.concatenate([self.scales, np.zeros(row, dtype=np.float32)])
+            self.keys.append(key)
+            self.metadata.append(metadata)
+            self.rows[key] = row
+        else:
+            self.metadata[row] = metadata
+        self.codes[row] = code
+        self.scales[row] = scale
+
+    def remove(self, key: str):
+        # Swap the last row into the hole so rows stay dense
+        row = self.rows.pop(key)
+        last = len(self.keys) - 1
+        if row != last:
+            self.codes[row] = self.codes[last]
+            self.scales[row] = self.scales[last]
+            self.keys[row] = self.keys[last]
+            self.metadata[row] = self.metadata[last]
+            self.rows[self.keys[row]] = row
+        self.keys.pop()
+        self.metadata.pop()
+
+    def reencode(self, source: VectorCodec, target: VectorCodec):
+        """Convert all rows from one codec to another"""
+        count = len(self.keys)
+        vectors = source.decode(self.codes[:count], self.scales[:count])
+        codes, scales = target.encode(vectors)
+        self.codes = np.zeros((max(len(self.codes), 1), target.code_width), dtype=target.dtype)
+        self.codes[:count] = codes
+        self.scales[:count] = scales
+
+    def top_k(self, codec: VectorCodec, prepared, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and approximate scores of the k best matches, best first"""
+        count = len(self.keys)
+        scores = codec.scores(prepared, self.codes[:count], self.scales[:count])
+        if k < len(scores):
+            rows = np.argpartition(-scores, k - 1)[:k]
+        else:
+            rows = np.arange(len(scores))
+        rows = rows[np.argsort(-scores[rows], kind="stable")]
+        return rows, scores[rows]
+
+    def nbytes(self) -> int:
+        count = len(self.keys)
+        return self.codes[:count].nbytes + self.scales[:count].nbytes
+
+
+class VectorIndex:
+    """
+    Cosine-similarity index over image embeddings.
+
+    Vectors are partitioned by (site_id, device_type) so that filtered
+    searches only score the partitions that match the filters.
+
+    With a lossy quantization ("int8" or "pq") the index keeps only the
+    compact codes. Searches over-fetch rerank_factor * top_k candidates and,
+    when a vector_loader is given, re-rank them with the full-precision
+    vectors it returns. Product quantization needs training, so vectors are
+    kept as float32 until quantize() has seen enough of them.
+    """
+
+    def __init__(self, dimension: int, quantization: str = "none", rerank_factor: int = 4,
+                 vector_loader: Optional[Callable[[List[str]], List[Optional[Sequence[float]]]]] = None):
+        self.dimension = dimension
+        self.rerank_factor = max(1, rerank_factor)
+        self.vector_loader = vector_loader
+        self.target_codec = create_codec(quantization, dimension)
+        self.codec = self.target_codec if not self.target_codec.needs_training else create_codec("none", dimension)
+        self._partitions: Dict[Tuple[str, str], _Partition] = {}
+        self._locations: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, key: str):
+        return key in self._locations
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> Optional[np.ndarray]:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        if norm == 0:
+            return None
+        return array / norm
+
+    def add(self, key: str, vector: Sequence[float], metadata: Dict) -> bool:
+        """Insert or replace a vector; returns False for zero or mis-sized vectors"""
+        normalized = self._normalize(vector)
+        if normalized is None or normalized.shape != (self.dimension,):
+            logger.warning(f"Skipping vector {key}: invalid embedding")
+            return False
+
+        partition_key = (metadata.get("site_id", "UNKNOWN"), metadata.get("device_type", "unknown"))
+        with self._lock:
+            current = self._locations.get(key)
+            if current is not None and current != partition_key:
+                self._remove_locked(key)
+
+            codes, scales = self.codec.encode(normalized[None, :])
+            partition = self._partitions.get(partition_key)
+            if partition is None:
+                partition = self._partitions[partition_key] = _Partition(self.codec)
+            partition.add(key, codes[0], scales[0], metadata)
+            self._locations[key] = partition_key
+        return True
+
+    def remove(self, key: str) -> bool:
+        """Remove a vector by key"""
+        with self._lock:
+            if key not in self._locations:
+                return False
+            self._remove_locked(key)
+            return True
+
+    def _remove_locked(self, key: str):
+        partition_key = self._locations.pop(key)
+        partition = self._partitions[partition_key]
+        partition.remove(key)
+        if not len(partition):
+            del self._partitions[partition_key]
+
+    def clear(self):
+        """Drop all vectors"""
+        with self._lock:
+            self._partitions.clear()
+            self._locations.clear()
+
+    def _matching_partitions(self, site_id: Optional[str], device_type: Optional[str]) -> List[_Partition]:
+        return [
+            partition for (site, dtype), partition in self._partitions.items()
+            if (site_id is None or site == site_id) and (device_type is None or dtype == device_type)
+        ]
+
+    def keys(self, site_id: Optional[str] = None, device_type: Optional[str] = None) -> List[str]:
+        """Keys of all vectors matching the filters"""
+        with self._lock:
+            return [key for partition in self._matching_partitions(site_id, device_type) for key in partition.keys]
+
+    def quantize(self) -> bool:
+        """Switch the index to the target codec, training it on the indexed vectors if needed"""
+        with self._lock:
+            if self.codec is self.target_codec:
+                return True
+
+            if self.target_codec.needs_training and not self.target_codec.trained:
+                vectors = [
+                    self.codec.decode(p.codes[:len(p)], p.scales[:len(p)])
+                    for p in self._partitions.values()
+                ]
+                count = sum(len(v) for v in vectors)
+                try:
+                    self.target_codec.train(np.concatenate(vectors) if vectors else np.zeros((0, self.dimension)))
+                except ValueError as e:
+                    logger.info(f"Keeping float32 index with {count} vectors: {e}")
+                    return False
+
+            for partition in self._partitions.values():
+                partition.reencode(self.codec, self.target_codec)
+            self.codec = self.target_codec
+            logger.info(f"Vector index quantized with {self.codec.name} ({len(self)} vectors)")
+            return True
+
+    def search(self, query: Sequence[float], top_k: int = 10, site_id: Optional[str] = None,
+               device_type: Optional[str] = None) -> List[Dict]:
+        """Top-k cosine matches among vectors matching the filters"""
+        normalized = self._normalize(query)
+        if normalized is None or top_k <= 0:
+            return []
+
+        rerank = self.codec.lossy and self.vector_loader is not None
+        fetch_k = top_k * self.rerank_factor if rerank else top_k
+
+        candidates = []
+        with self._lock:
+            codec = self.codec
+            prepared = codec.prepare(normalized)
+            for partition in self._matching_partitions(site_id, device_type):
+                rows, scores = partition.top_k(codec, prepared, fetch_k)
+                candidates.extend(
+                    (float(score), partition.keys[row], partition.metadata[row])
+                    for row, score in zip(rows, scores)
+                )
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        candidates = candidates[:fetch_k]
+
+        if rerank and candidates:
+            candidates = self._rerank(normalized, candidates)
+
+        return [
+            {"key": key, "similarity": score, "metadata": metadata}
+            for score, key, metadata in candidates[:top_k]
+        ]
+
+    def _rerank(self, query: np.ndarray, candidates: List[Tuple]) -> List[Tuple]:
+        """Re-score candidates with full-precision vectors, keeping approximate scores for missing ones"""
+        try:
+            vectors = self.vector_loader([key for _, key, _ in candidates])
+        except Exception as e:
+            logger.error(f"Error loading vectors for re-ranking: {e}")
+            return candidates
+
+        rescored = []
+        for (score, key, metadata), vector in zip(candidates, vectors):
+            normalized = self._normalize(vector) if vector is not None else None
+            if normalized is not None and normalized.shape == query.shape:
+                score = float(normalized @ query)
+            rescored.append((score, key, metadata))
+        rescored.sort(key=lambda c: c[0], reverse=True)
+        return rescored
+
+    def stats(self) -> Dict:
+        """Index size, partitioning and memory footprint"""
+        with self._lock:
+            count = len(self)
+            code_bytes = sum(p.nbytes() for p in self._partitions.values())
+            return {
+                "vectors": count,
+                "partitions": len(self._partitions),
+                "dimension": self.dimension,
+                "quantization": self.codec.name,
+                "target_quantization": self.target_codec.name,
+                "memory_bytes": code_bytes + self.codec.parameter_bytes(),
+                "float32_bytes": count * self.dimension * 4,
+                "rerank_factor": self.rerank_factor if self.codec.lossy else 1
+            }
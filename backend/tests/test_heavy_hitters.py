@@ -0,0 +1,69 @@
+"""
+Space-Saving heavy hitters validated against exact counts
+"""
+from collections import Counter
+
+import numpy as np
+
+from app.services.heavy_hitters import HeavyHitters
+
+CAPACITY = 64
+ERROR_CODE = 502
+
+
+def synthetic_log(rows=200000, ips=5000, minutes=120, seed=7):
+    """Row-aligned (minute, ip code) pairs with a Zipf-like IP skew, in time order"""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, ips + 1)
+    items = rng.choice(ips, size=rows, p=weights / weights.sum()).astype(np.int64)
+    minutes_of_rows = np.sort(rng.integers(0, minutes, size=rows)).astype(np.int64)
+    return minutes_of_rows, items
+
+
+def feed(hitters, minutes, items, chunk=10000):
+    for start in range(0, len(items), chunk):
+        hitters.add(ERROR_CODE, minutes[start:start + chunk], items[start:start + chunk])
+
+
+def check_against_exact(top, exact, total, n):
+    assert len(top) == n
+    for item, count, error in top:
+        # Space-Saving never undercounts and overcounts by at most the reported error
+        assert exact[item] <= count <= exact[item] + error
+        assert error <= total / CAPACITY
+    # Items clearly above the n-th reported count cannot have been missed
+    threshold = top[-1][1]
+    reported = {item for item, _, _ in top}
+    assert all(item in reported for item, count in exact.items() if count > threshold)
+
+
+def test_top_ips_over_whole_log_match_exact_counts():
+    minutes, items = synthetic_log()
+    hitters = HeavyHitters(capacity=CAPACITY, window_minutes=60)
+    feed(hitters, minutes, items)
+
+    exact = Counter(items.tolist())
+    top = hitters.top(ERROR_CODE, 10)
+    check_against_exact(top, exact, len(items), 10)
+    assert [item for item, _, _ in top[:3]] == [item for item, _ in exact.most_common(3)]
+
+
+def test_top_ips_over_last_minutes_match_exact_counts():
+    minutes, items = synthetic_log()
+    hitters = HeavyHitters(capacity=CAPACITY, window_minutes=60)
+    feed(hitters, minutes, items)
+
+    recent = minutes >= minutes.max() - 15 + 1
+    exact = Counter(items[recent].tolist())
+    check_against_exact(hitters.top(ERROR_CODE, 10, minutes=15), exact, int(recent.sum()), 10)
+
+
+def test_small_logs_are_counted_exactly():
+    minutes, items = synthetic_log(rows=5000, ips=40)
+    hitters = HeavyHitters(capacity=CAPACITY, window_minutes=60)
+    feed(hitters, minutes, items, chunk=777)
+
+    exact = Counter(items.tolist())
+    assert hitters.top(ERROR_CODE, 40) == sorted(
+        ((item, count, 0) for item, count in exact.items()), key=lambda entry: (-entry[1], entry[0])
+    )
@@ -0,0 +1,36 @@
+"""
+Derivative rendering recovers from a worker process that dies mid-render
+"""
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from PIL import Image
+
+from app.services import image_derivatives
+from app.services.image_derivatives import ImageDerivativeService
+
+
+def die(*args):
+    """Stands in for a render killed by the OOM killer"""
+    os._exit(1)
+
+
+def test_dead_worker_fails_only_its_render(tmp_path, monkeypatch):
+    source = tmp_path / "source.jpg"
+    Image.new("RGB", (640, 480), "orange").save(source)
+    service = ImageDerivativeService(str(tmp_path / "cache"), workers=1)
+    try:
+        target = service.derivative_path(service.source_hash(str(source)), "thumb", "webp")
+
+        monkeypatch.setattr(image_derivatives, "render_derivative", die)
+        with pytest.raises(BrokenProcessPool):
+            asyncio.run(service.ensure(str(source), target, "thumb", "webp"))
+        monkeypatch.undo()
+
+        assert asyncio.run(service.ensure(str(source), target, "thumb", "webp")) == target
+        with Image.open(target) as image:
+            assert max(image.size) == 256
+    finally:
+        service.shutdown()
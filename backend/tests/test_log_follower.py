@@ -0,0 +1,53 @@
+"""
+Following a log through appends, truncation and copytruncate rewrites
+"""
+from types import SimpleNamespace
+
+from app.services.log_follower import LogFollower
+from app.services.log_store import LogStore
+
+
+def line(ip, path, status=200):
+    return f'{ip} - - [01/Jan/2024:00:00:00 +0000] "GET {path} HTTP/1.1" {status} 10 "-" "curl/8.0"\n'
+
+
+def follower_for(log):
+    service = SimpleNamespace(store=LogStore())
+    return service.store, LogFollower(service, str(log), interval=0)
+
+
+def test_appended_lines_are_ingested(tmp_path):
+    log = tmp_path / "access.log"
+    log.write_text(line("10.0.0.1", "/a"))
+    store, follower = follower_for(log)
+    assert follower.poll() == 1
+    with log.open("a") as f:
+        f.write(line("10.0.0.2", "/b"))
+    assert follower.poll() == 1
+    assert [store.row(row)["path"] for row in range(len(store))] == ["/a", "/b"]
+    assert follower.truncations == 0
+
+
+def test_rewrite_past_the_old_offset_is_read_from_the_start(tmp_path):
+    log = tmp_path / "access.log"
+    log.write_text(line("10.0.0.1", "/old"))
+    store, follower = follower_for(log)
+    assert follower.poll() == 1
+
+    # copytruncate, then more was written than had been read before the next poll
+    log.write_text(line("10.0.0.9", "/new") + line("10.0.0.9", "/newer"))
+    assert follower.poll() == 2
+    assert follower.truncations == 1
+    assert [store.row(row)["path"] for row in range(1, len(store))] == ["/new", "/newer"]
+
+
+def test_same_length_rewrite_is_noticed(tmp_path):
+    log = tmp_path / "access.log"
+    log.write_text(line("10.0.0.1", "/aaa"))
+    store, follower = follower_for(log)
+    follower.poll()
+
+    log.write_text(line("10.0.0.1", "/bbb"))
+    assert follower.poll() == 1
+    assert follower.truncations == 1
+    assert store.row(len(store) - 1)["path"] == "/bbb"
@@ -0,0 +1,96 @@
+"""
+Log store parsing: parallel block parsing must give the same store as a serial parse
+"""
+import gzip
+import pickle
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import zstandard
+
+from app.services.log_archive import expand_archives, load_archives
+from app.services.log_store import Dictionary, LogStore
+
+COLUMNS = ("ip", "path", "method", "protocol", "timestamp", "agent", "status", "bytes", "offset")
+DICTIONARIES = ("ips", "paths", "methods", "protocols", "timestamps", "agents")
+CHUNK_SIZE = 64 * 1024
+
+
+def write_log(path, lines=20000, seed=3):
+    """Synthetic combined-format log, with a few malformed lines and no trailing newline"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    paths = ["/", "/login", "/admin", "/api/devices/active", "/static/app.js", "/api/images/search?q=a b"]
+    out = []
+    for i in range(lines):
+        if i % 997 == 0:
+            out.append("garbage line without fields")
+            continue
+        ts = (start + timedelta(seconds=i // 7)).strftime("%d/%b/%Y:%H:%M:%S +0000")
+        out.append(
+            f'10.0.{rng.randint(0, 40)}.{rng.randint(1, 254)} - - [{ts}] '
+            f'"{rng.choice(["GET", "POST", "PUT"])} {rng.choice(paths)} HTTP/1.1" '
+            f'{rng.choice([200, 200, 200, 301, 404, 500, 502])} {rng.randint(0, 50000)} '
+            f'"-" "{rng.choice(["Mozilla/5.0", "curl/8.0", "python-requests/2.31"])}"'
+        )
+    path.write_text("\n".join(out))
+    return path
+
+
+def load(path, workers):
+    store = LogStore()
+    added = store.load_file(str(path), chunk_size=CHUNK_SIZE, workers=workers)
+    return store, added
+
+
+def test_parallel_parse_matches_serial_parse(tmp_path):
+    log = write_log(tmp_path / "access.log")
+    assert log.stat().st_size > 4 * CHUNK_SIZE
+
+    serial, serial_added = load(log, workers=1)
+    parallel, parallel_added = load(log, workers=4)
+
+    assert parallel_added == serial_added == len(serial) > 0
+    for column in COLUMNS:
+        np.testing.assert_array_equal(getattr(parallel, column).view(), getattr(serial, column).view(), column)
+    for dictionary in DICTIONARIES:
+        assert getattr(parallel, dictionary).values == getattr(serial, dictionary).values, dictionary
+    np.testing.assert_array_equal(parallel.timestamp_epochs.view(), serial.timestamp_epochs.view())
+    np.testing.assert_array_equal(parallel.status_counts, serial.status_counts)
+    assert parallel.source_offset == serial.source_offset
+    assert [parallel.raw(row) for row in range(0, len(serial), 1234)] == \
+        [serial.raw(row) for row in range(0, len(serial), 1234)]
+    assert parallel.search("login 404", 20) == serial.search("login 404", 20)
+
+
+def test_dictionary_pickles_when_empty():
+    # A block of only malformed lines ships empty dictionaries back from the parse workers
+    empty = pickle.loads(pickle.dumps(Dictionary()))
+    assert len(empty) == 0 and empty.encode("-") == 0
+
+    dictionary = Dictionary()
+    dictionary.encode_many(["a", "b", "a"])
+    restored = pickle.loads(pickle.dumps(dictionary))
+    assert restored.values == ["a", "b"] and restored.lookup("b") == 1
+
+
+def test_compressed_archives_match_plain_log(tmp_path):
+    log = write_log(tmp_path / "access.log", lines=5000)
+    data = log.read_bytes()
+    (tmp_path / "access.log.1.gz").write_bytes(gzip.compress(data))
+    # Two frames, as written by a compressor that was restarted mid-file
+    compressor = zstandard.ZstdCompressor()
+    middle = data.index(b"\n", len(data) // 2) + 1
+    (tmp_path / "access.log.2.zst").write_bytes(compressor.compress(data[:middle]) + compressor.compress(data[middle:]))
+
+    plain, _ = load(log, workers=1)
+    for name in ("access.log.1.gz", "access.log.2.zst"):
+        archives = expand_archives(str(tmp_path / name))
+        assert archives == [str(tmp_path / name)]
+        store = LogStore()
+        assert load_archives(store, archives, chunk_size=CHUNK_SIZE, workers=2) == len(plain)
+        for column in ("ip", "path", "status", "bytes"):
+            np.testing.assert_array_equal(getattr(store, column).view(), getattr(plain, column).view(), column)
+        assert [store.raw(row) for row in range(0, len(plain), 321)] == \
+            [plain.raw(row) for row in range(0, len(plain), 321)]
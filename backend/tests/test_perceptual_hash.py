@@ -0,0 +1,33 @@
+"""
+BK-tree range queries over Hamming distance
+"""
+import random
+
+from app.services.perceptual_hash import BKTree, hamming
+
+
+def test_readding_a_key_does_not_duplicate_matches():
+    tree = BKTree()
+    tree.add("a", 5)
+    tree.add("a", 5)
+    assert tree.search(5, 2) == [(0, "a")]
+
+    # Replaced back to an earlier hash: the old node is live again
+    tree.add("a", 6)
+    tree.add("a", 5)
+    assert tree.search(5, 2) == [(0, "a")]
+
+
+def test_replacements_trigger_rebuild_and_match_brute_force():
+    rng = random.Random(1)
+    tree = BKTree()
+    hashes = {}
+    for _ in range(5000):
+        key = f"k{rng.randrange(200)}"
+        hashes[key] = rng.getrandbits(64)
+        tree.add(key, hashes[key])
+    assert tree._nodes <= 2 * len(tree) + 16
+
+    query = rng.getrandbits(64)
+    expected = sorted((hamming(query, value), key) for key, value in hashes.items() if hamming(query, value) <= 28)
+    assert tree.search(query, 28) == expected
@@ -0,0 +1,46 @@
+"""
+Question planning: analytic questions become log queries, the rest go to retrieval
+"""
+import pytest
+
+from app.services.query_planner import plan_question
+
+RETRIEVAL_QUESTIONS = [
+    "What does HTTP 503 mean?",
+    "What is a 502 bad gateway error?",
+    "Why do 504 gateway timeouts happen?",
+    "How do I fix 502 bad gateway errors?",
+    "What PPE protocols were followed after incidents?",
+    "How many connected devices do the drill sites monitor?",
+    "List economic and social sustainability statements",
+]
+
+
+@pytest.mark.parametrize("question", RETRIEVAL_QUESTIONS)
+def test_non_analytic_questions_are_not_planned(question):
+    assert plan_question(question) is None
+
+
+def test_ranking_question_groups_by_ip():
+    query = plan_question("Which IP addresses cause the most 502 errors?")
+    assert query.codes == [502] and query.group_by == "ip"
+
+
+def test_selection_question_is_planned():
+    query = plan_question("Who is generating forbidden 403 responses?")
+    assert query.codes == [403] and query.group_by == "ip"
+
+
+def test_count_question_filters_ip_and_code():
+    query = plan_question("How many requests from 10.165.77.102 returned 404?")
+    assert query.ip == "10.165.77.102" and query.codes == [404] and query.group_by is None
+
+
+def test_rate_question():
+    query = plan_question("What is the recent error rate?")
+    assert query.metric == "rate" and query.statuses == (400, 599) and query.minutes == 60
+
+
+def test_failure_verbs_select_errors():
+    query = plan_question("Which endpoints fail most?")
+    assert query.statuses == (400, 599) and query.group_by == "path"
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Log Analytics Benchmark Script
+Generates a synthetic access log and measures RAGService load time and
+diagnostics query latency, checking results against a naive reference
+"""
+import os
+import sys
+import gzip
+import shutil
+import time
+import random
+import argparse
+import resource
+import tempfile
+from collections import Counter
+
+import numpy as np
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.config import settings
+from app.services.rag_service import RAGService
+from app.services.log_store import LOG_PATTERN, LogStore
+from app.services.log_snapshot import load_snapshot, save_snapshot
+from app.services.log_archive import load_archives
+from app.services.cache import LRUCache
+
+STATUS_WEIGHTS = {200: 70, 304: 6, 400: 6, 403: 3, 404: 9, 500: 4, 502: 2}
+METHODS = ["GET"] * 8 + ["POST", "PUT"]
+PATHS = [
+    "/", "/index.html", "/api/devices/active", "/api/users/active", "/api/images/search",
+    "/api/diagnostics/logs/stats", "/static/app.js", "/static/app.css", "/login", "/admin",
+]
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) Safari/605.1.15",
+    "curl/8.4.0",
+    "python-requests/2.31.0",
+]
+
+
+def generate_log(path, lines, seed=7):
+    """Write a synthetic combined-format access log, one second apart per ~10 lines"""
+    rng = random.Random(seed)
+    ips = [f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}" for _ in range(5000)]
+    # Zipf-like skew so that a few IPs dominate
+    ip_weights = [1.0 / (rank + 1) for rank in range(len(ips))]
+    statuses = list(STATUS_WEIGHTS)
+    status_weights = list(STATUS_WEIGHTS.values())
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    with open(path, "w") as f:
+        batch = 10000
+        for offset in range(0, lines, batch):
+            count = min(batch, lines - offset)
+            chosen_ips = rng.choices(ips, ip_weights, k=count)
+            chosen_status = rng.choices(statuses, status_weights, k=count)
+            out = []
+            for i in range(count):
+                ts = (start + timedelta(seconds=(offset + i) // 10)).strftime("%d/%b/%Y:%H:%M:%S +0000")
+                out.append(
+                    f'{chosen_ips[i]} - - [{ts}] "{rng.choice(METHODS)} {rng.choice(PATHS)} HTTP/1.1" '
+                    f'{chosen_status[i]} {rng.randint(200, 50000)} "-" "{rng.choice(USER_AGENTS)}"\n'
+                )
+            f.writelines(out)
+
+
+def naive_top_ips(lines, code, top_n):
+    counter = Counter()
+    for line in lines:
+        match = LOG_PATTERN.match(line)
+        if match and int(match.group(6)) == code:
+            counter[match.group(1)] += 1
+    return counter.most_common(top_n)
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def column_mb(store):
+    columns = (store.ip, store.path, store.method, store.protocol, store.timestamp,
+               store.agent, store.status, store.bytes, store.offset)
+    return sum(column.view().nbytes for column in columns) / 1e6
+
+
+def new_service():
+    # Skip RAGService.__init__, which loads settings.LOG_PATH and sets up retrieval;
+    # a zero-size result cache makes the timings measure computation, not cache hits
+    service = RAGService.__new__(RAGService)
+    service.store = LogStore()
+    service.results = LRUCache("diagnostics_results", max_size=0)
+    return service
+
+
+def validate_sketches(store, top_n=10):
+    """Compare heavy-hitter answers with exact column scans"""
+    sketch = store.heavy_hitters.stats()
+    print(f"\nHeavy-hitter sketches: {sketch['sketches']} sketches, {sketch['bytes'] / 1e3:.0f} KB "
+          f"(capacity {sketch['capacity']}, {sketch['window_minutes']} min window)")
+    for code in (400, 404, 500):
+        for minutes in (None, 15, 60):
+            approx = store.top_ips(code, top_n, minutes)
+            exact = {row["ip"]: row["count"] for row in store.exact_top_ips(code, len(store.ips), minutes)}
+            expected = sorted(exact, key=exact.get, reverse=True)[:top_n]
+            recall = len({row["ip"] for row in approx} & set(expected)) / max(len(expected), 1)
+            bounded = all(row["count"] - row["error"] <= exact.get(row["ip"], 0) <= row["count"] for row in approx)
+            worst = max((row["count"] - exact.get(row["ip"], 0) for row in approx), default=0)
+            window = f"last {minutes} min" if minutes else "all time"
+            print(f"  {code} {window:<12} recall@{top_n} {recall:.2f}  max overcount {worst}  "
+                  f"within bounds {'yes' if bounded else 'NO'}")
+
+
+def same_store(a, b):
+    columns = ("ip", "path", "method", "protocol", "timestamp", "agent", "status", "bytes", "offset")
+    dictionaries = ("ips", "paths", "methods", "protocols", "timestamps", "agents")
+    return all(np.array_equal(getattr(a, c).view(), getattr(b, c).view()) for c in columns) \
+        and all(getattr(a, d).values == getattr(b, d).values for d in dictionaries) \
+        and a.statistics() == b.statistics() \
+        and a.top_ips(404, 10, 15) == b.top_ips(404, 10, 15) \
+        and a.index.stats() == b.index.stats()
+
+
+def snapshot_round_trip(store, path):
+    """Save and map a snapshot of the loaded store; the mapped store must match the parsed one"""
+    snapshot_path = os.path.join(tempfile.gettempdir(), "benchmark_logs.snapshot")
+    print("\nSnapshot")
+    start = time.perf_counter()
+    save_snapshot(store, snapshot_path)
+    print(f"  save  {time.perf_counter() - start:6.2f}s  {os.path.getsize(snapshot_path) / 1e6:.0f} MB")
+    start = time.perf_counter()
+    restored = load_snapshot(snapshot_path, path)
+    print(f"  load  {time.perf_counter() - start:6.2f}s")
+    identical = restored is not None and same_store(store, restored)
+    print(f"  {'identical' if identical else 'DIFFERENT'} to the parsed store")
+    if restored is not None:
+        restored.close()
+    os.remove(snapshot_path)
+    return identical
+
+
+def parallel_sweep(path, size_mb, worker_counts, chunk_size):
+    """Load the file with each worker count; results must match the serial load exactly"""
+    print(f"\nParallel parse ({os.cpu_count()} CPUs available)")
+    serial = LogStore()
+    start = time.perf_counter()
+    serial.load_file(path, chunk_size, workers=1)
+    baseline = time.perf_counter() - start
+    print(f"  workers  1  {baseline:6.2f}s  {size_mb / baseline:6.1f} MB/s  speedup 1.00x")
+
+    ok = True
+    for workers in worker_counts:
+        if workers <= 1:
+            continue
+        store = LogStore()
+        start = time.perf_counter()
+        store.load_file(path, chunk_size, workers=workers)
+        elapsed = time.perf_counter() - start
+        identical = same_store(serial, store)
+        ok &= identical
+        print(f"  workers {workers:>2}  {elapsed:6.2f}s  {size_mb / elapsed:6.1f} MB/s  "
+              f"speedup {baseline / elapsed:.2f}x  {'identical' if identical else 'DIFFERENT'}")
+        store.close()
+    serial.close()
+    return ok
+
+
+def archive_load(store, path, parts, workers, chunk_size):
+    """Split the log into gzip archives and load them back; the columns must match the plain load"""
+    directory = tempfile.mkdtemp(prefix="benchmark_logs_archives_")
+    with open(path, "rb") as f:
+        lines = f.readlines()
+    paths = []
+    step = -(-len(lines) // parts)
+    for part in range(parts):
+        paths.append(os.path.join(directory, f"access.log.{parts - part}.gz"))
+        with gzip.open(paths[-1], "wb", compresslevel=6) as f:
+            f.writelines(lines[part * step:(part + 1) * step])
+    del lines
+    compressed_mb = sum(os.path.getsize(p) for p in paths) / 1e6
+
+    print(f"\nCompressed archives ({parts} gzip files, {compressed_mb:.1f} MB)")
+    ok = True
+    for count in sorted({1, workers}):
+        archived = LogStore()
+        start = time.perf_counter()
+        load_archives(archived, paths, chunk_size, workers=count)
+        elapsed = time.perf_counter() - start
+        columns = ("ip", "path", "method", "protocol", "timestamp", "agent", "status", "bytes")
+        identical = all(np.array_equal(getattr(store, c).view(), getattr(archived, c).view()) for c in columns) \
+            and archived.statistics() == store.statistics()
+        ok &= identical
+        print(f"  workers {count:>2}  {elapsed:6.2f}s  {len(archived) / elapsed / 1e3:7.0f}k rows/s  "
+              f"{'identical' if identical else 'DIFFERENT'}")
+        archived.close()
+    shutil.rmtree(directory)
+    return ok
+
+
+def timed(label, fn, repeat=5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<40}{best * 1000:>10.2f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--log", help="existing log file to use instead of a synthetic one")
+    parser.add_argument("--chunk-size", type=int, default=settings.LOG_CHUNK_SIZE,
+                        help="bytes parsed per block while streaming")
+    parser.add_argument("--workers-sweep", default="",
+                        help="comma-separated parse worker counts to time against a serial load, e.g. 1,2,4")
+    parser.add_argument("--archives", type=int, default=0,
+                        help="also split the log into this many gzip archives and time loading them")
+    args = parser.parse_args()
+
+    print("\n" + "="*70)
+    print("LOG ANALYTICS BENCHMARK")
+    print("="*70)
+
+    path = args.log
+    if not path:
+        path = os.path.join(tempfile.gettempdir(), f"synthetic_access_{args.lines}.log")
+        if not os.path.exists(path):
+            print(f"\nGenerating {args.lines:,} synthetic log lines -> {path}")
+            generate_log(path, args.lines)
+
+    size_mb = os.path.getsize(path) / 1e6
+    settings.LOG_CHUNK_SIZE = args.chunk_size
+    # Time a full parse; snapshots are measured separately
+    settings.LOG_SNAPSHOT_PATH = ""
+    service = new_service()
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    service.load_logs(path)
+    elapsed = time.perf_counter() - start
+    print(f"\nLoaded {len(service.store):,} rows ({size_mb:.1f} MB) in {elapsed:.2f}s ({size_mb / elapsed:.1f} MB/s)")
+    print(f"Peak RSS {peak_rss_mb():.0f} MB (before load {rss_before:.0f} MB); "
+          f"columns {column_mb(service.store):.0f} MB, chunk size {args.chunk_size / 1e6:.1f} MB")
+
+    print("\nQuery latency (best of 5)")
+    for code in (400, 404, 500):
+        timed(f"get_frequent_ips_by_error({code})", lambda: service.get_frequent_ips_by_error(code, 10))
+    timed("get_error_statistics()", service.get_error_statistics)
+    timed("get_diagnostics_summary()", service.get_diagnostics_summary)
+    for query in ("admin", "admin 404", "curl POST", "login OR admin OR 502"):
+        timed(f"search_logs({query!r})", lambda: service.search_logs(query, 50))
+    for minutes in (15, 60):
+        timed(f"get_frequent_ips_by_error(404, {minutes}m)",
+              lambda: service.get_frequent_ips_by_error(404, 10, minutes))
+    latest = service.store.time_index.latest()
+    if latest is not None:
+        for hours in (1, 24):
+            start = latest - hours * 3600
+            timed(f"get_error_statistics(last {hours}h)", lambda: service.get_error_statistics(start, latest + 1))
+        timed("get_error_histogram(last 1h)", service.get_error_histogram)
+    index = service.store.index.stats()
+    print(f"  index: {index['tokens']:,} tokens, {index['postings']:,} postings, "
+          f"{index['bytes_per_posting']:.2f} bytes/posting")
+
+    validate_sketches(service.store)
+
+    if not snapshot_round_trip(service.store, path):
+        return 1
+
+    if args.archives and not archive_load(service.store, path, args.archives,
+                                          settings.LOG_PARSE_WORKERS, args.chunk_size):
+        return 1
+
+    if args.workers_sweep:
+        ok = parallel_sweep(path, size_mb, [int(w) for w in args.workers_sweep.split(",")], args.chunk_size)
+        if not ok:
+            return 1
+
+    print("\nChecking counts against a naive Counter scan...")
+    with open(path) as f:
+        sample = [line for _, line in zip(range(200000), f)]
+    sample_path = os.path.join(tempfile.gettempdir(), "benchmark_logs_sample.log")
+    with open(sample_path, "w") as f:
+        f.writelines(sample)
+    check = new_service()
+    check.load_logs(sample_path)
+
+    ok = True
+    for code in (400, 404, 500):
+        expected = dict(naive_top_ips(sample, code, 10))
+        actual = {e["ip"]: e["count"] for e in check.get_frequent_ips_by_error(code, 10)}
+        # Compare counts per IP; the order of IPs with equal counts may differ
+        if any(expected.get(ip, count) != count for ip, count in actual.items()) or \
+                sorted(expected.values()) != sorted(actual.values()):
+            ok = False
+            print(f"  MISMATCH for {code}: {expected} vs {actual}")
+    # Most recent rows containing both terms, newest first
+    expected = [i for i in range(len(check.store) - 1, -1, -1)
+                if "/admin " in check.store.raw(i) and '" 404 ' in check.store.raw(i)][:50]
+    actual = [row["raw"] for row in check.search_logs("admin 404", 50)]
+    if actual != [check.store.raw(i) for i in expected]:
+        ok = False
+        print("  MISMATCH for search 'admin 404'")
+    print("  counts match" if ok else "  counts differ")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Quantization Benchmark Script
+Compares memory footprint and recall@k of the float32, int8 and PQ vector
+indexes on the hackathon image descriptions scaled up synthetically
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import numpy as np
+
+from app.services.embedding_engine import HashingEmbeddingEngine
+from app.services.vector_index import VectorIndex
+
+# Descriptions used by EmbeddingService.generate_image_description, grouped by site
+BASE_DESCRIPTIONS = {
+    ("WY-ALPHA", "turbine"): [
+        "Industrial turbine facility with large rotating equipment and control panels",
+        "Turbine installation site with engineers wearing hard hats inspecting equipment",
+        "Gas turbine power generation unit with monitoring systems and safety equipment",
+    ],
+    ("TX-EAGLE", "thermal_engine"): [
+        "Thermal engine test facility with technicians monitoring temperature gauges",
+        "Industrial thermal power unit with workers in protective gear",
+        "Engine testing bay with engineers analyzing performance metrics",
+    ],
+    ("NM-SAGE", "electrical_rotor"): [
+        "Electrical rotor assembly area with maintenance crew wearing safety helmets",
+        "High voltage rotor system with engineers conducting inspections",
+        "Motor control center with electrical engineers reviewing schematics",
+    ],
+    ("ND-RAVEN", "connected_device"): [
+        "Oil and gas wellhead site with connected IoT sensors and monitoring equipment",
+        "Field operations with workers installing pressure monitoring devices",
+        "Remote oil field with technicians wearing hard hats checking equipment",
+    ],
+}
+
+EXTRA_WORDS = (
+    "valve pump pipeline compressor flare tank gauge panel cable tablet crane ladder "
+    "scaffold vest goggles gloves boots night dusk rain snow desert offshore rig "
+    "drone camera thermal infrared leak vibration bearing shaft blade nacelle"
+).split()
+
+
+def synthesize_corpus(size, rng):
+    """Perturbed copies of the base descriptions with site/device metadata"""
+    groups = list(BASE_DESCRIPTIONS.items())
+    texts, metadata = [], []
+    for i in range(size):
+        (site_id, device_type), descriptions = groups[i % len(groups)]
+        words = descriptions[rng.integers(len(descriptions))].split()
+        keep = rng.random(len(words)) > 0.3
+        words = [w for w, k in zip(words, keep) if k] + list(rng.choice(EXTRA_WORDS, 3))
+        rng.shuffle(words)
+        texts.append(" ".join(words))
+        metadata.append({"site_id": site_id, "device_type": device_type})
+    return texts, metadata
+
+
+def synthesize_queries(count, rng):
+    vocabulary = sorted({w.lower() for ds in BASE_DESCRIPTIONS.values() for d in ds for w in d.split()})
+    vocabulary += EXTRA_WORDS
+    return [" ".join(rng.choice(vocabulary, 3)) for _ in range(count)]
+
+
+def evaluate(index, queries, exact, k):
+    """Mean recall@k against exact results and mean query latency"""
+    recalls = []
+    start = time.perf_counter()
+    for query, truth in zip(queries, exact):
+        found = {r["key"] for r in index.search(query, k)}
+        recalls.append(len(found & truth) / k)
+    elapsed = time.perf_counter() - start
+    return float(np.mean(recalls)), elapsed / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=20000, help="number of synthetic images")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    print("\n" + "="*70)
+    print("VECTOR QUANTIZATION BENCHMARK")
+    print("="*70)
+
+    rng = np.random.default_rng(42)
+    engine = HashingEmbeddingEngine()
+
+    print(f"\nEmbedding {args.size:,} synthetic image descriptions...")
+    texts, metadata = synthesize_corpus(args.size, rng)
+    vectors = engine.embed_batch(texts)
+    keys = [f"img_{i}" for i in range(args.size)]
+    vector_by_key = dict(zip(keys, vectors))
+
+    queries = [engine.embed(q, "search_query") for q in synthesize_queries(args.queries, rng)]
+    query_matrix = np.asarray(queries, dtype=np.float32)
+    exact_scores = query_matrix @ vectors.T
+    exact = [
+        {keys[i] for i in np.argpartition(-row, args.k)[:args.k]}
+        for row in exact_scores
+    ]
+
+    def loader(wanted):
+        return [vector_by_key.get(key) for key in wanted]
+
+    print(f"\n{'codec':<8}{'re-rank':<9}{'memory':>12}{'reduction':>11}{'recall@' + str(args.k):>11}{'ms/query':>10}")
+    print("-" * 61)
+    for quantization in ("none", "int8", "pq"):
+        for rerank in (False, True):
+            if quantization == "none" and rerank:
+                continue
+            index = VectorIndex(engine.dimension, quantization, vector_loader=loader if rerank else None)
+            for key, vector, meta in zip(keys, vectors, metadata):
+                index.add(key, vector, meta)
+            index.quantize()
+
+            stats = index.stats()
+            recall, latency = evaluate(index, queries, exact, args.k)
+            reduction = stats["float32_bytes"] / stats["memory_bytes"]
+            print(
+                f"{stats['quantization']:<8}{'yes' if rerank else 'no':<9}"
+                f"{stats['memory_bytes'] / 1e6:>10.1f}MB{reduction:>10.1f}x"
+                f"{recall:>11.3f}{latency:>10.2f}"
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
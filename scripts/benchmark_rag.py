@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+RAG Query Benchmark Script
+Measures end-to-end /api/diagnostics/query latency offline (retrieval and
+generation per stage) and checks that retrieval finds the expected sources
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.config import settings
+from app.services.rag_service import RAGService
+from benchmark_logs import generate_log
+
+# Question -> title of the source expected among the retrieved chunks, or
+# None for analytic questions that must be planned into a log query
+QUESTIONS = {
+    "How many safety incidences occurred in BP operations in 2024?": "Safety incidences in BP operations 2024",
+    "Describe BP oil drill operations and hard hat requirements": "Hard hat requirements for BP oil drill operations",
+    "List economic and social sustainability statements": "Economic and social sustainability statements",
+    "What PPE protocols were followed after incidents?": "Safety incidences in BP operations 2024",
+    "How many connected devices do the drill sites monitor?": "BP oil drill operations",
+    "Which IP addresses cause the most 502 errors?": None,
+    "Who is generating forbidden 403 responses?": None,
+    "What is the recent error rate?": None,
+    "Summarize the status code distribution of the logs": None,
+    "Top 3 paths returning 404 in the last 15 minutes": None,
+    "Error rate for POST requests to /login": None,
+    "How many requests from 10.165.77.102 returned 404?": None,
+    "Show server errors per minute over the last 10 minutes": None,
+    "Which IPs cause 502 errors and what do the logs say about the recent error rate?": None,
+}
+
+
+def percentiles(values):
+    values = np.asarray(values)
+    return f"p50 {np.percentile(values, 50):7.2f} ms  p95 {np.percentile(values, 95):7.2f} ms"
+
+
+def run(service, iterations, top_k):
+    stages = {"retrieval_ms": [], "query_ms": [], "generation_ms": [], "total_ms": []}
+    hits_at_1 = hits_at_k = 0
+    for question, expected in QUESTIONS.items():
+        result = service.query(question)
+        if expected is None:
+            found = result["plan"] is not None
+            hits_at_1 += found
+            hits_at_k += found
+            plan = {k: v for k, v in (result["plan"] or {}).items() if v is not None}
+            print(f"  {'ok  ' if found else 'MISS'} {question[:56]:<56} -> plan {plan}")
+        else:
+            titles = [source["title"] for source in result["sources"]]
+            hits_at_1 += titles[:1] == [expected]
+            hits_at_k += expected in titles[:top_k]
+            print(f"  {'ok  ' if expected in titles else 'MISS'} {question[:56]:<56} -> {titles[:1]}")
+        for _ in range(iterations):
+            timings = service.query(question)["timings"]
+            for stage, values in stages.items():
+                values.append(timings.get(stage, 0))
+    for stage, values in stages.items():
+        print(f"  {stage:<16}{percentiles(values)}")
+    return hits_at_1, hits_at_k
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=200_000, help="synthetic log lines behind the log summaries")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--slow-embedding-ms", type=float, default=200,
+                        help="simulated query embedding latency for the budget check")
+    args = parser.parse_args()
+
+    print("="*70)
+    print("RAG QUERY BENCHMARK")
+    print("="*70)
+
+    path = os.path.join(tempfile.gettempdir(), f"synthetic_access_{args.lines}.log")
+    if not os.path.exists(path):
+        generate_log(path, args.lines)
+    settings.LOG_SNAPSHOT_PATH = ""
+    settings.RAG_GENERATOR = "local"
+
+    start = time.perf_counter()
+    service = RAGService()
+    service.load_logs(path)
+    print(f"\nLoaded {len(service.store):,} log rows in {time.perf_counter() - start:.2f}s "
+          f"(engine {service.retriever.engine.name}, generator {service.generator.name})")
+
+    start = time.perf_counter()
+    cold = service.query("How do I troubleshoot 502 bad gateway errors?")["timings"]
+    print(f"First query {(time.perf_counter() - start) * 1000:.1f} ms "
+          f"(indexing knowledge and log summaries {cold['refresh_ms']:.1f} ms)")
+
+    top_k = settings.RAG_TOP_K
+    print(f"\nWarm queries (top {top_k}, budget {settings.RAG_RETRIEVAL_BUDGET_MS:.0f} ms, {args.iterations} runs each)")
+    hits_at_1, hits_at_k = run(service, args.iterations, top_k)
+    print(f"  hit@1 {hits_at_1}/{len(QUESTIONS)}  hit@{top_k} {hits_at_k}/{len(QUESTIONS)}")
+
+    # Streaming sends the sources and first token long before a slow generator finishes
+    first_event, first_token, finished = [], [], []
+    for question in QUESTIONS:
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            seen_token = False
+            for event, _ in service.query_events(question):
+                now = (time.perf_counter() - start) * 1000
+                if event == "context":
+                    first_event.append(now)
+                elif event == "token" and not seen_token:
+                    first_token.append(now)
+                    seen_token = True
+            finished.append((time.perf_counter() - start) * 1000)
+    print("\nStreamed answers")
+    print(f"  {'first event':<16}{percentiles(first_event)}")
+    print(f"  {'first token':<16}{percentiles(first_token)}")
+    print(f"  {'last token':<16}{percentiles(finished)}")
+
+    # A slow embedding provider must not push retrieval past the budget
+    engine = service.retriever.engine
+    embed_batch = engine.embed_batch
+
+    def slow_embed_batch(texts, input_type="search_document"):
+        if input_type == "search_query":
+            time.sleep(args.slow_embedding_ms / 1000)
+        return embed_batch(texts, input_type)
+
+    engine.embed_batch = slow_embed_batch
+    service.retriever.query_cache.clear()
+    misses = service.retriever.budget_misses
+    retrieval = []
+    retrieved = [question for question, expected in QUESTIONS.items() if expected is not None]
+    for question in retrieved:
+        retrieval.append(service.query(f"{question} (uncached)")["timings"]["retrieval_ms"])
+    print(f"\nSlow query embedding ({args.slow_embedding_ms:.0f} ms): retrieval {percentiles(retrieval)}, "
+          f"{service.retriever.budget_misses - misses} of {len(retrieved)} fell back to BM25")
+    engine.embed_batch = embed_batch
+
+    ok = hits_at_k == len(QUESTIONS) and max(retrieval) < settings.RAG_RETRIEVAL_BUDGET_MS * 1.5
+    print("\nOK" if ok else "\nFAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
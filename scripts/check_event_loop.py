@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Event Loop Check Script
+Drives the heavy API endpoints while probing /health, reports the
+backend's event-loop lag and the stacks of callbacks that blocked it, and
+fails when /health (which does no work) waited longer than allowed
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+import numpy as np
+import requests
+
+API_BASE = "http://localhost:8000"
+
+SEARCH_TERMS = ["admin", "login", "404", "500", "curl", "POST", "static", "api", "502", "Mozilla"]
+QUESTIONS = [
+    "Which IP addresses cause the most 502 errors?",
+    "Top 5 paths returning 404",
+    "Error rate for POST requests to /login",
+    "What are the hard hat requirements?",
+]
+IMAGE_QUERIES = ["workers wearing hard hats", "turbine site with engineers", "oil wellhead sensors"]
+
+
+def heavy_request(session, api, rng):
+    """One uncached request to an endpoint that does CPU work"""
+    # A random suffix keeps result caches from answering instead of the handler
+    salt = rng.randint(0, 1 << 30)
+    choice = rng.randrange(4)
+    if choice == 0:
+        return session.get(f"{api}/api/diagnostics/logs/search",
+                           params={"query": f"{rng.choice(SEARCH_TERMS)} OR {salt}"}, timeout=60)
+    if choice == 1:
+        return session.get(f"{api}/api/diagnostics/logs/query",
+                           params={"question": f"{rng.choice(QUESTIONS)} in the last {salt % 600 + 1} minutes"},
+                           timeout=60)
+    if choice == 2:
+        return session.post(f"{api}/api/diagnostics/query",
+                            json={"question": f"{rng.choice(QUESTIONS)} #{salt}"}, timeout=60)
+    return session.post(f"{api}/api/images/search",
+                        json={"query": f"{rng.choice(IMAGE_QUERIES)} {salt}", "top_k": 5}, timeout=60)
+
+
+def load(api, stop, latencies, errors, seed):
+    rng = random.Random(seed)
+    session = requests.Session()
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            if heavy_request(session, api, rng).status_code >= 500:
+                errors.append(1)
+        except Exception:
+            errors.append(1)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def percentiles(values):
+    if not values:
+        return "no samples"
+    return f"p50 {np.percentile(values, 50):8.2f} ms  p99 {np.percentile(values, 99):8.2f} ms  max {max(values):8.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--api", default=API_BASE)
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--concurrency", type=int, default=4, help="threads sending heavy requests")
+    parser.add_argument("--max-lag-ms", type=float, default=250, help="fail when the loop lagged longer than this")
+    parser.add_argument("--admin-token", default=os.getenv("ADMIN_TOKEN", ""),
+                        help="X-Admin-Token for /api/admin (default: $ADMIN_TOKEN)")
+    args = parser.parse_args()
+
+    print("\n" + "="*70)
+    print("EVENT LOOP CHECK")
+    print("="*70)
+
+    headers = {"X-Admin-Token": args.admin_token}
+    before = requests.get(f"{args.api}/api/admin/loop", headers=headers, timeout=10).json()
+
+    stop = threading.Event()
+    heavy, errors = [], []
+    workers = [threading.Thread(target=load, args=(args.api, stop, heavy, errors, seed), daemon=True)
+               for seed in range(args.concurrency)]
+    for worker in workers:
+        worker.start()
+
+    # /health does no real work, so its latency is the time spent waiting for the loop
+    health = []
+    session = requests.Session()
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        session.get(f"{args.api}/health", timeout=60)
+        health.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.02)
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+    after = requests.get(f"{args.api}/api/admin/loop", headers=headers, timeout=10).json()
+    print(f"\n{len(heavy)} heavy requests from {args.concurrency} threads over {args.duration:.0f}s "
+          f"({len(errors)} failed)")
+    print(f"  heavy requests  {percentiles(heavy)}")
+    print(f"  /health         {percentiles(health)}")
+    lag = after["lag_ms"]
+    print(f"  loop lag        p50 {lag['p50']:8.2f} ms  p99 {lag['p99']:8.2f} ms  max {after['max_lag_ms']:8.2f} ms "
+          f"(since startup)")
+
+    blocks = after["recent_blocks"][:max(after["blocked"] - before["blocked"], 0)]
+    print(f"  blocking callbacks over {after['threshold_ms']:.0f} ms: {after['blocked'] - before['blocked']}")
+    for block in blocks[:5]:
+        print(f"\n  blocked {block['blocked_ms']:.0f} ms at {block['detected_at']}:")
+        for frame in block["stack"][-4:]:
+            print("    " + frame.replace("\n", "\n    "))
+
+    ok = max(health, default=0) <= args.max_lag_ms and not errors
+    print("\nOK" if ok else f"\nFAILED (/health must answer within {args.max_lag_ms:.0f} ms under load)")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())